@@ -6,9 +6,23 @@ import { ProductCard } from '../components/ProductCard';
 import { ShoppingCart } from '../components/ShoppingCart';
 import { CheckoutModal } from '../components/CheckoutModal';
 import { useVoiceAssistant } from '../hooks/useVoiceAssistant';
-import { getCategorias, getProductos, processCheckout } from '../services/api';
+import { buscarProductos, getCambiosCatalogo, getCatalogo, processCheckout } from '../services/api';
 import './Shop.css';
 
+// Transformar un producto de Django al formato del frontend
+const toShopProduct = (prod) => ({
+  id: prod.id,
+  name: prod.nombre,
+  price: parseFloat(prod.precio),
+  description: prod.descripcion || '',
+  image: prod.imagen || 'https://via.placeholder.com/300x200/007bff/ffffff?text=Producto',
+  category: prod.categoria_nombre ? prod.categoria_nombre.toLowerCase() : 'sin categoría',
+  categoryId: prod.categoria,
+  stock: prod.stock,
+  rating: 4.5, // Valor por defecto, puede agregarse al modelo más adelante
+  estado: prod.estado
+});
+
 /**
  * Componente principal de la tienda
  * Integra productos, carrito y asistente de voz
@@ -18,6 +32,8 @@ export const Shop = () => {
   const [allProducts, setAllProducts] = useState([]);
   const [cartItems, setCartItems] = useState([]);
   const [searchQuery, setSearchQuery] = useState('');
+  // Ids devueltos por /api/producto/buscar/ para searchQuery, en orden de relevancia
+  const [searchResultIds, setSearchResultIds] = useState(null);
   const [selectedCategory, setSelectedCategory] = useState('todas');
   const [categories, setCategories] = useState(['todas']);
   const [loadingCategories, setLoadingCategories] = useState(true);
@@ -28,6 +44,11 @@ export const Shop = () => {
   const lastProcessedCommand = useRef('');
   const lastProcessedTime = useRef(0);
   const commandProcessedSuccessfully = useRef(false);
+
+  // Token para pedir sólo los cambios del catálogo desde la última carga
+  const catalogTokenRef = useRef(null);
+  const cartItemsRef = useRef(cartItems);
+  cartItemsRef.current = cartItems;
   
   const { speak, transcript, clearTranscript, startListening, isListening } = useVoiceAssistant();
 
@@ -49,7 +70,7 @@ export const Shop = () => {
     const fetchCategories = async () => {
       try {
         setLoadingCategories(true);
-        const apiCategories = await getCategorias();
+        const { categorias: apiCategories } = await getCatalogo();
         // Combinar "todas" con las categorías de la API
         const categoryNames = apiCategories.map(cat => cat.nombre.toLowerCase());
         setCategories(['todas', ...categoryNames]);
@@ -70,20 +91,11 @@ export const Shop = () => {
     const fetchProducts = async () => {
       try {
         setLoadingProducts(true);
-        const apiProducts = await getProductos();
+        const { productos: apiProducts, token } = await getCatalogo();
+        catalogTokenRef.current = token;
         
         // Transformar productos de Django al formato del frontend
-        const transformedProducts = apiProducts.map(prod => ({
-          id: prod.id,
-          name: prod.nombre,
-          price: parseFloat(prod.precio),
-          description: prod.descripcion || '',
-          image: prod.imagen || 'https://via.placeholder.com/300x200/007bff/ffffff?text=Producto',
-          category: prod.categoria_nombre ? prod.categoria_nombre.toLowerCase() : 'sin categoría',
-          stock: prod.stock,
-          rating: 4.5, // Valor por defecto, puede agregarse al modelo más adelante
-          estado: prod.estado
-        }));
+        const transformedProducts = apiProducts.map(toShopProduct);
         
         setAllProducts(transformedProducts);
         setProducts(transformedProducts);
@@ -100,6 +112,140 @@ export const Shop = () => {
     fetchProducts();
   }, [speak]);
 
+  // Al volver a la pestaña, traer sólo lo que cambió en el catálogo
+  useEffect(() => {
+    const syncCatalog = async () => {
+      if (document.visibilityState !== 'visible' || !catalogTokenRef.current) {
+        return;
+      }
+      try {
+        const cambios = await getCambiosCatalogo(catalogTokenRef.current);
+        if (cambios === null || cambios.categorias.length > 0 || cambios.eliminados.categorias.length > 0) {
+          // Token caducado o categorías cambiadas (poco frecuente): catálogo completo
+          const { categorias, productos, token } = await getCatalogo();
+          catalogTokenRef.current = token;
+          const transformedProducts = productos.map(toShopProduct);
+          setCategories(['todas', ...categorias.map(cat => cat.nombre.toLowerCase())]);
+          setAllProducts(transformedProducts);
+          setProducts(transformedProducts);
+          return;
+        }
+        catalogTokenRef.current = cambios.token;
+
+        const updated = new Map(cambios.productos.map(prod => [prod.id, toShopProduct(prod)]));
+        const deactivated = new Set(cambios.desactivados);
+        const deleted = new Set(cambios.eliminados.productos);
+        if (updated.size === 0 && deactivated.size === 0 && deleted.size === 0) {
+          return;
+        }
+        const applyChanges = (list) => {
+          const seen = new Set();
+          const result = [];
+          list.forEach(product => {
+            if (deleted.has(product.id)) {
+              return;
+            }
+            seen.add(product.id);
+            if (updated.has(product.id)) {
+              result.push(updated.get(product.id));
+            } else if (deactivated.has(product.id)) {
+              result.push({ ...product, estado: false });
+            } else {
+              result.push(product);
+            }
+          });
+          updated.forEach((product, id) => {
+            if (!seen.has(id)) {
+              result.push(product);
+            }
+          });
+          return result;
+        };
+        setAllProducts(applyChanges);
+        setProducts(applyChanges);
+      } catch (error) {
+        console.error('Error al sincronizar el catálogo:', error);
+      }
+    };
+
+    document.addEventListener('visibilitychange', syncCatalog);
+    return () => document.removeEventListener('visibilitychange', syncCatalog);
+  }, []);
+
+  // Cambios de stock, precio y estado en tiempo real para las categorías de la tienda
+  const categoryIdsKey = [...new Set(allProducts.map(p => p.categoryId))]
+    .filter(id => id != null)
+    .sort((a, b) => a - b)
+    .join(',');
+  useEffect(() => {
+    if (!categoryIdsKey) {
+      return;
+    }
+    const socket = new WebSocket('ws://localhost:8000/ws/catalogo/');
+    socket.onopen = () => {
+      socket.send(JSON.stringify({ type: 'subscribe', categorias: categoryIdsKey.split(',').map(Number) }));
+    };
+    socket.onmessage = (event) => {
+      const message = JSON.parse(event.data);
+      if (message.type !== 'catalog_changes') {
+        return;
+      }
+      const changes = new Map(message.productos.map(diff => [diff.id, diff]));
+      const applyDiff = (product) => {
+        const diff = changes.get(product.id);
+        if (!diff) {
+          return product;
+        }
+        const updated = { ...product };
+        if (diff.stock !== undefined) updated.stock = diff.stock;
+        if (diff.precio !== undefined) updated.price = parseFloat(diff.precio);
+        if (diff.estado !== undefined) updated.estado = diff.estado;
+        return updated;
+      };
+      const applyAll = list => list.filter(product => !changes.get(product.id)?.eliminado).map(applyDiff);
+      setAllProducts(applyAll);
+      setProducts(applyAll);
+      setCartItems(items => items.map(applyDiff));
+
+      // Avisar si se agotó algo que está en el carrito
+      const soldOut = cartItemsRef.current.filter(item => {
+        const diff = changes.get(item.id);
+        return diff && (diff.stock === 0 || diff.estado === false || diff.eliminado);
+      });
+      if (soldOut.length > 0) {
+        speak(`Atención: ${soldOut.map(item => item.name).join(', ')} ya no está disponible.`);
+      }
+    };
+    return () => socket.close();
+  }, [categoryIdsKey, speak]);
+
+  // Buscar en el servidor mientras se escribe (con una pausa para no pedir en cada tecla)
+  useEffect(() => {
+    const consulta = searchQuery.trim();
+    if (!consulta) {
+      setSearchResultIds(null);
+      return;
+    }
+    let cancelled = false;
+    const timer = setTimeout(async () => {
+      try {
+        const resultados = await buscarProductos(consulta);
+        if (!cancelled) {
+          setSearchResultIds(resultados.map(prod => prod.id));
+        }
+      } catch (error) {
+        // Sin respuesta del servidor se filtra en el navegador
+        if (!cancelled) {
+          setSearchResultIds(null);
+        }
+      }
+    }, 250);
+    return () => {
+      cancelled = true;
+      clearTimeout(timer);
+    };
+  }, [searchQuery]);
+
   // Procesar comandos de voz (optimizado para discapacidad visual)
   const processVoiceCommand = useCallback((command) => {
     // No procesar comandos mientras todavía está escuchando
@@ -355,27 +501,32 @@ export const Shop = () => {
       if (searchTerm) {
         setSearchQuery(searchTerm);
         
-        const results = allProducts.filter(p =>
-          p.name.toLowerCase().includes(searchTerm.toLowerCase()) ||
-          p.description.toLowerCase().includes(searchTerm.toLowerCase()) ||
-          p.category.toLowerCase().includes(searchTerm.toLowerCase())
-        );
-        
-        if (results.length === 0) {
-          speak(`No encontré productos con ${searchTerm}. Di leer productos para conocer todos los productos disponibles.`);
-        } else if (results.length === 1) {
-          const p = results[0];
-          speak(`Encontré un producto: ${p.name}. Categoría: ${p.category}. Precio: ${p.price} pesos. Di agregar ${p.name} para agregarlo al carrito.`);
-        } else {
-          let mensaje = `Encontré ${results.length} productos con ${searchTerm}. `;
-          results.slice(0, 5).forEach((p, i) => {
-            mensaje += `${i + 1}. ${p.name}, ${p.price} pesos. `;
-          });
-          if (results.length > 5) {
-            mensaje += `Y ${results.length - 5} productos más. `;
+        const announceResults = (results) => {
+          if (results.length === 0) {
+            speak(`No encontré productos con ${searchTerm}. Di leer productos para conocer todos los productos disponibles.`);
+          } else if (results.length === 1) {
+            const p = results[0];
+            speak(`Encontré un producto: ${p.name}. Categoría: ${p.category}. Precio: ${p.price} pesos. Di agregar ${p.name} para agregarlo al carrito.`);
+          } else {
+            let mensaje = `Encontré ${results.length} productos con ${searchTerm}. `;
+            results.slice(0, 5).forEach((p, i) => {
+              mensaje += `${i + 1}. ${p.name}, ${p.price} pesos. `;
+            });
+            if (results.length > 5) {
+              mensaje += `Y ${results.length - 5} productos más. `;
+            }
+            speak(mensaje);
           }
-          speak(mensaje);
-        }
+        };
+
+        // El servidor ordena por relevancia; si no responde, se filtra aquí
+        buscarProductos(searchTerm)
+          .then(resultados => announceResults(resultados.map(toShopProduct)))
+          .catch(() => announceResults(allProducts.filter(p =>
+            p.name.toLowerCase().includes(searchTerm.toLowerCase()) ||
+            p.description.toLowerCase().includes(searchTerm.toLowerCase()) ||
+            p.category.toLowerCase().includes(searchTerm.toLowerCase())
+          )));
       } else {
         speak('No escuché el nombre del producto a buscar. Por favor, di buscar seguido del nombre del producto.');
       }
@@ -654,17 +805,22 @@ export const Shop = () => {
     }
   };
 
-  // Filtrar productos según búsqueda y categoría
-  const filteredProducts = products.filter(product => {
-    const matchesSearch = searchQuery === '' || 
-      product.name.toLowerCase().includes(searchQuery.toLowerCase()) ||
-      product.description.toLowerCase().includes(searchQuery.toLowerCase());
-    
-    const matchesCategory = selectedCategory === 'todas' || 
-      product.category === selectedCategory;
-    
-    return matchesSearch && matchesCategory;
-  });
+  // Filtrar productos según búsqueda y categoría. Con resultados del servidor
+  // se muestran en su orden de relevancia; si no, se filtra en el navegador
+  const matchesCategory = product => selectedCategory === 'todas' ||
+    product.category === selectedCategory;
+
+  const filteredProducts = searchQuery !== '' && searchResultIds !== null
+    ? searchResultIds
+        .map(id => products.find(product => product.id === id))
+        .filter(product => product && matchesCategory(product))
+    : products.filter(product => {
+        const matchesSearch = searchQuery === '' || 
+          product.name.toLowerCase().includes(searchQuery.toLowerCase()) ||
+          product.description.toLowerCase().includes(searchQuery.toLowerCase());
+        
+        return matchesSearch && matchesCategory(product);
+      });
 
   return (
     <div className="shop-container">
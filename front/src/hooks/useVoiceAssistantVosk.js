@@ -1,5 +1,42 @@
 import { useState, useEffect, useRef, useCallback } from 'react';
 
+// Códec del audio que se envía: μ-law ocupa la mitad que PCM 16-bit. Si el
+// servidor no lo acepta se vuelve a PCM ('pcm16')
+const AUDIO_CODEC = 'mulaw';
+
+// Exponente μ-law de cada valor de los 8 bits altos de la magnitud (G.711)
+const MULAW_EXPONENT = new Uint8Array(256);
+for (let i = 2; i < 256; i++) {
+  MULAW_EXPONENT[i] = Math.floor(Math.log2(i));
+}
+
+/**
+ * Float32 [-1, 1] a μ-law (G.711), un byte por muestra; es lo que decodifica
+ * gestion_asistente/audio.py
+ */
+const encodeMulaw = (input) => {
+  const output = new Uint8Array(input.length);
+  for (let i = 0; i < input.length; i++) {
+    const s = Math.max(-1, Math.min(1, input[i]));
+    let sample = s < 0 ? Math.round(-s * 0x8000) : Math.round(s * 0x7FFF);
+    const sign = s < 0 ? 0x80 : 0;
+    sample = Math.min(sample, 32635) + 0x84;
+    const exponent = MULAW_EXPONENT[(sample >> 7) & 0xFF];
+    const mantissa = (sample >> (exponent + 3)) & 0x0F;
+    output[i] = ~(sign | (exponent << 4) | mantissa) & 0xFF;
+  }
+  return output;
+};
+
+const encodePcm16 = (input) => {
+  const output = new Int16Array(input.length);
+  for (let i = 0; i < input.length; i++) {
+    const s = Math.max(-1, Math.min(1, input[i]));
+    output[i] = s < 0 ? s * 0x8000 : s * 0x7FFF;
+  }
+  return output;
+};
+
 /**
  * Hook personalizado para el asistente de voz con Vosk (offline)
  * Usa WebSocket para comunicarse con Django + Vosk en el backend
@@ -13,6 +50,8 @@ export const useVoiceAssistant = () => {
   const [isVoiceEnabled, setIsVoiceEnabled] = useState(true);
   const [availableVoices, setAvailableVoices] = useState([]);
   const [chatMessages, setChatMessages] = useState([]);
+  // Última intención interpretada por el servidor ({ action, quantity, products, ... })
+  const [intent, setIntent] = useState(null);
 
   const wsRef = useRef(null);
   const audioContextRef = useRef(null);
@@ -20,6 +59,10 @@ export const useVoiceAssistant = () => {
   const audioProcessorRef = useRef(null);
   const synthRef = useRef(window.speechSynthesis);
   const isPushToTalkActiveRef = useRef(false);
+  // Token para reanudar la sesión si el socket se cae (frase en curso incluida)
+  const resumeTokenRef = useRef(null);
+  // Códec con el que se codifica el audio (lo confirma el servidor en 'started')
+  const codecRef = useRef(AUDIO_CODEC);
 
   // Inicializar voces disponibles para síntesis
   useEffect(() => {
@@ -52,7 +95,10 @@ export const useVoiceAssistant = () => {
   const connectWebSocket = () => {
     try {
       // Conectar a Django WebSocket (puerto 8000)
-      wsRef.current = new WebSocket('ws://localhost:8000/ws/voice/');
+      const resume = resumeTokenRef.current
+        ? `?resume=${encodeURIComponent(resumeTokenRef.current)}`
+        : '';
+      wsRef.current = new WebSocket(`ws://localhost:8000/ws/voice/${resume}`);
 
       wsRef.current.onopen = () => {
         console.log('✅ WebSocket conectado - Reconocimiento offline listo');
@@ -65,6 +111,17 @@ export const useVoiceAssistant = () => {
         switch(data.type) {
           case 'ready':
             console.log('🎤 Vosk listo:', data.message);
+            resumeTokenRef.current = data.resume_token || null;
+            break;
+          
+          case 'resumed':
+            // El servidor conservó la sesión: los mensajes pendientes llegan a continuación
+            console.log('🔁 Sesión reanudada:', data.replayed, 'mensajes pendientes');
+            resumeTokenRef.current = data.resume_token || null;
+            break;
+          
+          case 'started':
+            codecRef.current = data.codec || 'pcm16';
             break;
           
           case 'partial':
@@ -81,7 +138,21 @@ export const useVoiceAssistant = () => {
             addChatMessage('user', data.transcript);
             break;
           
+          case 'intent':
+            // Acción ya interpretada por el servidor, con ids de producto
+            console.log('🧭 Intención:', data.intent);
+            setIntent({ ...data.intent, transcript: data.transcript });
+            break;
+          
           case 'error':
+            if (codecRef.current !== 'pcm16' && data.message?.startsWith('Códec de audio no soportado')) {
+              // Servidor sin μ-law: repetir el 'start' en PCM
+              codecRef.current = 'pcm16';
+              if (isPushToTalkActiveRef.current) {
+                sendStart();
+              }
+              break;
+            }
             console.error('❌ Error Vosk:', data.message);
             setVoiceStatus(`Error: ${data.message}`);
             break;
@@ -96,8 +167,8 @@ export const useVoiceAssistant = () => {
       wsRef.current.onclose = () => {
         console.log('🔌 WebSocket desconectado');
         setVoiceStatus('Reconexión...');
-        // Reintentar conexión después de 3 segundos
-        setTimeout(connectWebSocket, 3000);
+        // Reintentar pronto: la sesión se guarda en el servidor sólo unos segundos
+        setTimeout(connectWebSocket, resumeTokenRef.current ? 1000 : 3000);
       };
 
     } catch (error) {
@@ -118,8 +189,7 @@ export const useVoiceAssistant = () => {
       // Solicitar acceso al micrófono
       const stream = await navigator.mediaDevices.getUserMedia({ 
         audio: {
-          channelCount: 1,  // Mono
-          sampleRate: 16000,  // Vosk requiere 16kHz
+          channelCount: 1,  // Mono (la frecuencia nativa; el servidor remuestrea a 16kHz)
           echoCancellation: true,
           noiseSuppression: true,
         } 
@@ -128,9 +198,7 @@ export const useVoiceAssistant = () => {
       mediaStreamRef.current = stream;
 
       // Crear AudioContext para procesar audio
-      audioContextRef.current = new (window.AudioContext || window.webkitAudioContext)({
-        sampleRate: 16000
-      });
+      audioContextRef.current = new (window.AudioContext || window.webkitAudioContext)();
 
       const source = audioContextRef.current.createMediaStreamSource(stream);
       
@@ -145,22 +213,18 @@ export const useVoiceAssistant = () => {
         // Obtener datos de audio
         const inputData = e.inputBuffer.getChannelData(0);
         
-        // Convertir Float32Array a Int16Array (PCM 16-bit)
-        const pcmData = new Int16Array(inputData.length);
-        for (let i = 0; i < inputData.length; i++) {
-          const s = Math.max(-1, Math.min(1, inputData[i]));
-          pcmData[i] = s < 0 ? s * 0x8000 : s * 0x7FFF;
-        }
+        // Codificar en el códec de la sesión (μ-law o PCM 16-bit)
+        const encoded = codecRef.current === 'mulaw' ? encodeMulaw(inputData) : encodePcm16(inputData);
 
         // Enviar audio al WebSocket como bytes
-        wsRef.current.send(pcmData.buffer);
+        wsRef.current.send(encoded.buffer);
       };
 
       source.connect(processor);
       processor.connect(audioContextRef.current.destination);
       audioProcessorRef.current = processor;
 
-      console.log('🎤 Audio capturado correctamente (16kHz mono)');
+      console.log(`🎤 Audio capturado correctamente (${audioContextRef.current.sampleRate}Hz mono)`);
       return true;
 
     } catch (error) {
@@ -230,6 +294,15 @@ export const useVoiceAssistant = () => {
     }
   }, [isVoiceEnabled, voiceSpeed, selectedVoice]);
 
+  // Mensaje 'start' con la frecuencia de captura y el códec del audio
+  const sendStart = () => {
+    wsRef.current.send(JSON.stringify({
+      type: 'start',
+      sample_rate: audioContextRef.current.sampleRate,
+      codec: codecRef.current
+    }));
+  };
+
   // Iniciar escucha (Push-to-Talk)
   const startListening = useCallback(async () => {
     if (!wsRef.current || wsRef.current.readyState !== WebSocket.OPEN) {
@@ -259,7 +332,7 @@ export const useVoiceAssistant = () => {
     setTranscript('');  // Limpiar transcript anterior
 
     // Notificar al servidor que inicia el reconocimiento
-    wsRef.current.send(JSON.stringify({ type: 'start' }));
+    sendStart();
     console.log('✅ Push-to-Talk activado');
 
   }, []);
@@ -349,5 +422,6 @@ export const useVoiceAssistant = () => {
     setIsVoiceEnabled,
     availableVoices,
     chatMessages,
+    intent,
   };
 };
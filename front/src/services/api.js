@@ -9,15 +9,26 @@ const API_BASE_URL = 'http://localhost:8000';
 // CATEGORÍAS
 // ============================================
 
-// Obtener todas las categorías
-export const getCategorias = async () => {
-  try {
-    const response = await fetch(`${API_BASE_URL}/api/categoria/`);
+// Recorrer todas las páginas (paginación por cursor) de un listado del catálogo
+const fetchAllPages = async (url, errorMessage) => {
+  const results = [];
+  let next = url;
+  while (next) {
+    const response = await fetch(next);
     if (!response.ok) {
-      throw new Error('Error al obtener categorías');
+      throw new Error(errorMessage);
     }
     const data = await response.json();
-    return data;
+    results.push(...data.results);
+    next = data.next;
+  }
+  return results;
+};
+
+// Obtener todas las categorías
+export const getCategorias = async () => {
+  try {
+    return await fetchAllPages(`${API_BASE_URL}/api/categoria/?page_size=500`, 'Error al obtener categorías');
   } catch (error) {
     console.error('Error en getCategorias:', error);
     throw error;
@@ -39,17 +50,76 @@ export const getCategoria = async (id) => {
   }
 };
 
-// Obtener todos los productos
+// Obtener todos los productos (sólo los campos que usa la tienda)
 export const getProductos = async () => {
   try {
-    const response = await fetch(`${API_BASE_URL}/api/producto/`);
+    const params = new URLSearchParams({
+      fields: 'id,nombre,precio,descripcion,imagen,categoria_nombre,stock,estado',
+      page_size: 500,
+    });
+    return await fetchAllPages(`${API_BASE_URL}/api/producto/?${params}`, 'Error al obtener productos');
+  } catch (error) {
+    console.error('Error en getProductos:', error);
+    throw error;
+  }
+};
+
+// Catálogo completo (categorías y productos) en una sola petición. El navegador
+// guarda la respuesta y la revalida: si no cambió, el servidor responde 304.
+// Las llamadas simultáneas comparten la misma petición
+let catalogoPendiente = null;
+export const getCatalogo = async () => {
+  if (!catalogoPendiente) {
+    catalogoPendiente = fetch(`${API_BASE_URL}/api/catalogo/`, { cache: 'no-cache' })
+      .then(response => {
+        if (!response.ok) {
+          throw new Error('Error al obtener el catálogo');
+        }
+        return response.json();
+      })
+      .finally(() => {
+        catalogoPendiente = null;
+      });
+  }
+  try {
+    return await catalogoPendiente;
+  } catch (error) {
+    console.error('Error en getCatalogo:', error);
+    throw error;
+  }
+};
+
+// Cambios del catálogo desde un token (el de getCatalogo o el de la llamada
+// anterior). Devuelve null si el token caducó y hay que volver a cargarlo entero
+export const getCambiosCatalogo = async (token) => {
+  try {
+    const params = new URLSearchParams({ desde: token });
+    const response = await fetch(`${API_BASE_URL}/api/catalogo/cambios/?${params}`);
+    if (response.status === 410) {
+      return null;
+    }
     if (!response.ok) {
-      throw new Error('Error al obtener productos');
+      throw new Error('Error al obtener los cambios del catálogo');
+    }
+    return await response.json();
+  } catch (error) {
+    console.error('Error en getCambiosCatalogo:', error);
+    throw error;
+  }
+};
+
+// Buscar productos en el servidor, ordenados por relevancia
+export const buscarProductos = async (consulta, limite = 50) => {
+  try {
+    const params = new URLSearchParams({ q: consulta, limit: limite });
+    const response = await fetch(`${API_BASE_URL}/api/producto/buscar/?${params}`);
+    if (!response.ok) {
+      throw new Error('Error al buscar productos');
     }
     const data = await response.json();
-    return data;
+    return data.resultados;
   } catch (error) {
-    console.error('Error en getProductos:', error);
+    console.error('Error en buscarProductos:', error);
     throw error;
   }
 };
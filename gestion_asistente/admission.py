@@ -0,0 +1,297 @@
+"""
+Control de admisión de las sesiones de voz.
+
+Cada sesión activa consume CPU de reconocimiento de forma continua; pasado
+cierto número, todas las sesiones del proceso se retrasan a la vez.
+``AdmissionController`` limita las sesiones activas por proceso
+(``VOSK_MAX_SESSIONS``) y, opcionalmente, en todo el despliegue
+(``VOSK_GLOBAL_MAX_SESSIONS``, con Redis). Las conexiones que no caben
+esperan en una cola corta y reciben su posición en mensajes 'busy'; si la
+cola está llena o la espera se alarga, se rechazan.
+
+Cerca del límite (``VOSK_DEGRADE_AT``) el proceso entra en modo degradado:
+las sesiones que empiezan usan el modo gramática y parciales más espaciados,
+para que cada sesión cueste menos y quepan más sin que todas vayan lentas.
+El consumer avisa con ``enter_degraded``/``leave_degraded`` de las sesiones
+que están en ese modo: ``degraded_sessions`` cuenta las que pasaron a modo
+degradado y ``degraded_active`` las que lo están ahora (una sesión reanudada
+vuelve a estar activa sin contar otra vez).
+"""
+import asyncio
+import time
+import uuid
+from collections import deque
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+
+class AdmissionRejected(Exception):
+    """No hay sitio para la sesión (cola llena o espera agotada)"""
+
+
+# Reserva atómica de una plaza global: descarta las reservas caducadas y
+# añade la nueva si queda sitio
+_RESERVE_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[3]) then
+    redis.call('ZADD', KEYS[1], tonumber(ARGV[1]) + tonumber(ARGV[2]), ARGV[4])
+    return 1
+end
+return 0
+"""
+
+
+class GlobalSlots:
+    """
+    Plazas compartidas entre procesos en un sorted set de Redis.
+
+    Cada sesión admitida es un miembro cuya puntuación es el momento en que
+    caduca su reserva; el proceso renueva periódicamente las de sus sesiones,
+    así que las de un proceso caído desaparecen solas.
+    """
+
+    def __init__(self, url, limit, key='vocalcart:voz:sesiones', lease=60.0):
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise ImproperlyConfigured('VOSK_ADMISSION_REDIS_URL requiere el paquete redis')
+        self._client = redis.from_url(url)
+        self.limit = limit
+        self.key = key
+        self.lease = lease
+
+    async def reserve(self, sid):
+        reserved = await self._client.eval(
+            _RESERVE_SCRIPT, 1, self.key, time.time(), self.lease, self.limit, sid
+        )
+        return bool(reserved)
+
+    async def release(self, sid):
+        await self._client.zrem(self.key, sid)
+
+    async def renew(self, sids):
+        if sids:
+            expires = time.time() + self.lease
+            await self._client.zadd(self.key, {sid: expires for sid in sids}, xx=True)
+
+    async def count(self):
+        return await self._client.zcount(self.key, time.time(), '+inf')
+
+
+class _Waiter:
+    __slots__ = ('sid', 'event', 'on_wait')
+
+    def __init__(self, sid, on_wait):
+        self.sid = sid
+        self.event = asyncio.Event()
+        self.on_wait = on_wait
+
+
+class AdmissionController:
+    """Plazas de sesión de un proceso, con cola de espera y modo degradado"""
+
+    # Cada cuánto reintenta la cabeza de la cola una plaza global
+    GLOBAL_POLL = 0.5
+
+    def __init__(self, limit=None, queue=8, wait=10.0, degrade_at=0.8, global_slots=None):
+        """
+        Args:
+            limit: sesiones activas por proceso (None = sin límite)
+            queue: conexiones que pueden esperar plaza
+            wait: segundos máximos de espera antes de rechazar
+            degrade_at: fracción del límite a partir de la que se degrada
+            global_slots: ``GlobalSlots`` para el límite de todo el despliegue
+        """
+        self.limit = limit
+        self.queue = queue
+        self.wait = wait
+        self.degrade_at = degrade_at
+        self.global_slots = global_slots
+        self._active = set()
+        self._waiters = deque()
+        self._renewer = None
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.degraded_sessions = 0
+        self._degraded_active = 0
+        self.peak_active = 0
+        self._wait_total = 0.0
+        self._waited = 0
+
+    def _has_room(self):
+        return self.limit is None or len(self._active) < self.limit
+
+    async def _try_admit(self, sid):
+        """
+        Ocupa una plaza para ``sid`` si la hay; True si la sesión entra.
+
+        Con plazas globales se reserva primero la de Redis y después la local,
+        sin esperas entre la comprobación local y la admisión: mientras se
+        espera a Redis otra conexión puede ocupar la última plaza local, y
+        entonces se devuelve la reserva global.
+        """
+        if not self._has_room():
+            return False
+        if self.global_slots is not None:
+            if not await self.global_slots.reserve(sid):
+                return False
+            if not self._has_room():
+                await self.global_slots.release(sid)
+                return False
+        self._active.add(sid)
+        self.admitted += 1
+        self.peak_active = max(self.peak_active, len(self._active))
+        if self.global_slots is not None and self._renewer is None:
+            self._renewer = asyncio.ensure_future(self._renew_leases())
+        return True
+
+    async def acquire(self, on_wait=None):
+        """
+        Espera una plaza para una sesión nueva.
+
+        Args:
+            on_wait: corrutina ``on_wait(posición)`` que se llama al entrar en
+                la cola y cada vez que avanza (posición 1 = la siguiente)
+
+        Returns:
+            identificador de la plaza, para ``release``
+
+        Raises:
+            AdmissionRejected: si la cola está llena o la espera se agota
+
+        Si se cancela mientras espera (el cliente se desconectó), deja su
+        sitio en la cola.
+        """
+        sid = uuid.uuid4().hex
+        if not self._waiters and await self._try_admit(sid):
+            return sid
+        if len(self._waiters) >= self.queue:
+            self.rejected += 1
+            raise AdmissionRejected('Cola de espera llena')
+
+        waiter = _Waiter(sid, on_wait)
+        self._waiters.append(waiter)
+        self.queued += 1
+        started = time.monotonic()
+        deadline = started + self.wait
+        await self._notify(waiter)
+        try:
+            while True:
+                if self._waiters[0] is waiter and await self._try_admit(sid):
+                    self._waiters.popleft()
+                    self._wait_total += time.monotonic() - started
+                    self._waited += 1
+                    await self._advance()
+                    return sid
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise AdmissionRejected('Tiempo de espera agotado')
+                if self.global_slots is not None and self._waiters[0] is waiter and self._has_room():
+                    # La plaza que falta es global: otro proceso puede liberarla
+                    remaining = min(remaining, self.GLOBAL_POLL)
+                try:
+                    await asyncio.wait_for(waiter.event.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    pass
+                waiter.event.clear()
+        except BaseException:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                await self._advance()
+            raise
+
+    async def _notify(self, waiter):
+        if waiter.on_wait is not None:
+            try:
+                await waiter.on_wait(self._waiters.index(waiter) + 1)
+            except Exception:
+                pass
+
+    async def _advance(self):
+        """La cola se movió: despertar a la cabeza y avisar a todos de su posición"""
+        if self._waiters:
+            self._waiters[0].event.set()
+        for waiter in list(self._waiters):
+            await self._notify(waiter)
+
+    async def release(self, sid):
+        """Libera la plaza de una sesión que terminó"""
+        if sid not in self._active:
+            return
+        self._active.discard(sid)
+        if self.global_slots is not None:
+            await self.global_slots.release(sid)
+        if self._waiters:
+            self._waiters[0].event.set()
+
+    async def _renew_leases(self):
+        while self._active:
+            await asyncio.sleep(self.global_slots.lease / 3)
+            try:
+                await self.global_slots.renew(list(self._active))
+            except Exception:
+                pass
+        self._renewer = None
+
+    def degraded(self):
+        """True si el proceso está cerca del límite y las sesiones nuevas deben costar menos"""
+        if self.limit is None or self.degrade_at is None:
+            return False
+        return len(self._active) >= self.limit * self.degrade_at or bool(self._waiters)
+
+    def enter_degraded(self, new=True):
+        """
+        Una sesión pasó a modo degradado (``new=False``: ya lo estaba y se
+        reanudó; sólo vuelve a contar como activa)
+        """
+        if new:
+            self.degraded_sessions += 1
+        self._degraded_active += 1
+
+    def leave_degraded(self):
+        """Una sesión en modo degradado terminó, se aparcó o dejó de estarlo"""
+        self._degraded_active = max(self._degraded_active - 1, 0)
+
+    def stats(self):
+        return {
+            'active': len(self._active),
+            'waiting': len(self._waiters),
+            'limit': self.limit,
+            'degraded': self.degraded(),
+            'admitted': self.admitted,
+            'queued': self.queued,
+            'rejected': self.rejected,
+            'timeouts': self.timeouts,
+            'degraded_sessions': self.degraded_sessions,
+            'degraded_active': self._degraded_active,
+            'peak_active': self.peak_active,
+            'avg_wait': round(self._wait_total / self._waited, 3) if self._waited else 0.0,
+        }
+
+
+_controller = None
+
+
+def get_admission():
+    """Controlador de admisión del proceso, configurado con los settings"""
+    global _controller
+    if _controller is None:
+        global_slots = None
+        global_limit = getattr(settings, 'VOSK_GLOBAL_MAX_SESSIONS', None)
+        if global_limit:
+            url = getattr(settings, 'VOSK_ADMISSION_REDIS_URL', None)
+            if not url:
+                raise ImproperlyConfigured('VOSK_GLOBAL_MAX_SESSIONS requiere VOSK_ADMISSION_REDIS_URL')
+            global_slots = GlobalSlots(url, global_limit)
+        _controller = AdmissionController(
+            limit=getattr(settings, 'VOSK_MAX_SESSIONS', None),
+            queue=getattr(settings, 'VOSK_ADMISSION_QUEUE', 8),
+            wait=getattr(settings, 'VOSK_ADMISSION_WAIT', 10.0),
+            degrade_at=getattr(settings, 'VOSK_DEGRADE_AT', 0.8),
+            global_slots=global_slots,
+        )
+    return _controller
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class GestionAsistenteConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'gestion_asistente'
+
+    def ready(self):
+        # Conectar las señales que mantienen el vocabulario de voz
+        from . import signals  # noqa: F401
@@ -0,0 +1,188 @@
+"""
+Ejecución del reconocimiento de voz fuera del event loop.
+
+El ASR corre en un pool de threads propio (uno por núcleo) en lugar del
+executor por defecto de asyncio, para no competir con el resto de tareas
+bloqueantes del proceso. Cada sesión tiene además una cola serie
+(``SessionQueue``): sus trabajos se ejecutan de uno en uno y en orden, ya que
+un ``KaldiRecognizer`` no admite llamadas concurrentes, y la cola tiene una
+profundidad máxima para que la latencia no crezca sin límite cuando el
+servidor se atrasa.
+"""
+import asyncio
+import logging
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+# Qué hacer con un chunk de audio cuando la cola de la sesión está llena
+OVERFLOW_MERGE = 'merge'    # procesarlo junto al último chunk pendiente (no se pierde audio)
+OVERFLOW_DROP = 'drop'      # descartar el chunk pendiente más antiguo
+OVERFLOW_REJECT = 'reject'  # descartar el chunk nuevo y avisar al cliente
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Pool de threads dedicado al ASR, de tamaño ``VOSK_ASR_WORKERS`` (por defecto, los núcleos)"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                workers = getattr(settings, 'VOSK_ASR_WORKERS', None) or os.cpu_count() or 1
+                _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='asr')
+    return _executor
+
+
+class SessionOverloaded(Exception):
+    """La cola de la sesión está llena y la política es ``reject``"""
+
+
+class SessionQueue:
+    """
+    Cola serie de trabajos ASR de una sesión.
+
+    ``submit`` encola una función que se ejecuta en el executor de ASR cuando
+    terminan las anteriores (si es una corrutina, como las de una sesión en un
+    proceso worker, simplemente se espera); si se pasa ``on_result``, la corrutina recibe el
+    resultado también en orden. Sólo los trabajos marcados como ``mergeable``
+    (chunks de audio, ``fn(*chunks)``) cuentan para la profundidad máxima y pueden unirse o
+    descartarse; los de control (``Reset``, ``FinalResult``) siempre se
+    ejecutan.
+    """
+
+    def __init__(self, max_depth=None, overflow=None, on_error=None):
+        self.max_depth = max_depth or getattr(settings, 'VOSK_ASR_MAX_QUEUE', 8)
+        self.overflow = overflow or getattr(settings, 'VOSK_ASR_OVERFLOW', OVERFLOW_MERGE)
+        self.on_error = on_error
+        self._items = deque()
+        self._pending_audio = 0
+        self._task = None
+        self._closed = False
+        self.merged = 0
+        self.dropped = 0
+        self.rejected = 0
+
+    def submit(self, fn, *args, on_result=None, mergeable=False):
+        """
+        Encola ``fn(*args)``.
+
+        Devuelve un ``Future`` con el resultado. Lanza ``SessionOverloaded`` si
+        la cola está llena y la política es ``reject``.
+        """
+        if self._closed:
+            raise RuntimeError('La cola de la sesión está cerrada')
+
+        loop = asyncio.get_running_loop()
+        if mergeable and self._pending_audio >= self.max_depth:
+            merged = self._handle_overflow(fn, args)
+            if merged is not None:
+                return merged
+
+        future = loop.create_future()
+        self._items.append([fn, args, on_result, mergeable, future])
+        if mergeable:
+            self._pending_audio += 1
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._drain())
+        return future
+
+    def _handle_overflow(self, fn, args):
+        """Aplica la política de desbordamiento; devuelve el Future si el chunk se unió a otro"""
+        if self.overflow == OVERFLOW_REJECT:
+            self.rejected += 1
+            raise SessionOverloaded()
+
+        if self.overflow == OVERFLOW_MERGE:
+            last = self._items[-1] if self._items else None
+            if last is not None and last[3] and last[0] == fn:
+                # Los chunks se pasan juntos en una sola llamada, fn(*chunks),
+                # sin concatenarlos: cada uno puede traer su propia cabecera
+                last[1] = last[1] + args
+                self.merged += 1
+                return last[4]
+
+        # drop (o merge imposible porque lo último encolado es de control)
+        for item in self._items:
+            if item[3]:
+                self._items.remove(item)
+                self._pending_audio -= 1
+                self.dropped += 1
+                item[4].cancel()
+                break
+        return None
+
+    async def _drain(self):
+        loop = asyncio.get_running_loop()
+        while self._items:
+            fn, args, on_result, mergeable, future = self._items.popleft()
+            if mergeable:
+                self._pending_audio -= 1
+            try:
+                if asyncio.iscoroutinefunction(fn):
+                    result = await fn(*args)
+                else:
+                    result = await loop.run_in_executor(get_executor(), fn, *args)
+                if not future.done():
+                    future.set_result(result)
+                if on_result is not None:
+                    await on_result(result)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if on_result is None:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    # Nadie espera el Future de estos trabajos: el error se notifica aquí
+                    if not future.done():
+                        future.cancel()
+                    if self.on_error is not None:
+                        await self._notify_error(e)
+
+    async def _notify_error(self, error):
+        # Un fallo al avisar (p. ej. el socket ya cerrado) no puede parar la
+        # cola: join() fallaría y el reconocedor no volvería al pool
+        try:
+            await self.on_error(error)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.warning('No se pudo notificar un error de ASR', exc_info=True)
+
+    async def join(self):
+        """Espera a que se procese todo lo encolado hasta ahora"""
+        if self._task is not None and not self._task.done():
+            await asyncio.shield(self._task)
+
+    async def close(self):
+        """
+        Descarta lo pendiente y espera al trabajo en curso.
+
+        Hay que esperar antes de devolver el reconocedor al pool: el thread del
+        executor podría seguir usándolo.
+        """
+        self._closed = True
+        for item in self._items:
+            item[4].cancel()
+        self._items.clear()
+        self._pending_audio = 0
+        if self._task is not None and not self._task.done():
+            try:
+                await self._task
+            except Exception:
+                pass
+
+    def stats(self):
+        return {
+            'pending': len(self._items),
+            'merged': self.merged,
+            'dropped': self.dropped,
+            'rejected': self.rejected,
+        }
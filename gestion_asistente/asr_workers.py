@@ -0,0 +1,432 @@
+"""
+Reconocimiento de voz en procesos separados (``VOSK_ASR_MODE = 'process'``).
+
+En modo thread todo el ASR corre dentro del proceso de daphne que tiene el
+socket, y ese proceso pone el techo de sesiones simultáneas. En modo process
+el consumer reenvía el audio a un pool de procesos worker:
+
+* cada worker carga el modelo una vez y atiende muchas sesiones;
+* cada sesión queda fijada a un worker durante toda su vida;
+* el audio no viaja serializado por el pipe: el padre lo escribe en un
+  buffer circular en memoria compartida (un slot por sesión) y por el pipe
+  sólo va un mensaje corto con el número de bytes.
+
+Los resultados vuelven por el mismo pipe y un thread lector por worker los
+entrega al event loop.
+
+Los workers cargan el modelo por defecto de ``VOSK_MODELS`` al arrancar y no
+lo recargan: en este modo las sesiones no pueden elegir otro modelo y
+``/api/voz/modelo/recargar/`` responde 409 (hay que reiniciar el servidor).
+Cada proceso de daphne/uvicorn arranca su propio pool, así que el total de
+workers es ``VOSK_ASR_PROCESSES`` por proceso de servidor.
+"""
+import asyncio
+import atexit
+import hashlib
+import itertools
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+from collections import OrderedDict
+from multiprocessing.shared_memory import SharedMemory
+
+from django.conf import settings
+
+from . import vosk_registry
+from .recognition import RecognitionStream
+from .recognizer_pool import RecognizerConfig, RecognizerPool
+
+logger = logging.getLogger(__name__)
+
+# Bytes de cabecera de cada slot: contador de lectura (uint64) que escribe el worker
+_SLOT_HEADER = 8
+
+# Marcas de los mensajes 'audio': trozo de un chunk que no cupo entero en el
+# buffer, fin de un chunk (vienen más chunks unidos por la cola) o fin del último
+_PIECE, _CHUNK_END, _LAST = 0, 1, 2
+
+# Gramáticas que recuerda cada worker: las sesiones sólo envían su hash
+_MAX_GRAMMARS = 4
+
+# Workers por defecto (sin VOSK_ASR_PROCESSES): uno por núcleo, como mucho
+# éstos, porque cada proceso de servidor arranca los suyos
+_DEFAULT_MAX_PROCESSES = 4
+
+
+class AudioRing:
+    """
+    Buffer circular de audio sobre un trozo de memoria compartida.
+
+    Un solo productor (el proceso del consumer) y un solo consumidor (el
+    worker). El productor lleva su contador de escritura en local; el de
+    lectura vive en la memoria compartida para que el productor sepa cuánto
+    espacio queda libre.
+    """
+
+    def __init__(self, buf, offset, capacity):
+        self.capacity = capacity
+        self._read_counter = buf[offset:offset + _SLOT_HEADER].cast('Q')
+        self._data = buf[offset + _SLOT_HEADER:offset + _SLOT_HEADER + capacity]
+        self.written = self._read_counter[0]
+        self.read_pos = self._read_counter[0]
+
+    def free(self):
+        return self.capacity - (self.written - self._read_counter[0])
+
+    def write(self, data):
+        """Copia ``data`` al buffer (lado productor); debe caber en ``free()``"""
+        data = memoryview(data)
+        n = len(data)
+        if n > self.free():
+            raise BufferError('No hay espacio en el buffer de audio')
+        pos = self.written % self.capacity
+        first = min(n, self.capacity - pos)
+        self._data[pos:pos + first] = data[:first]
+        if first < n:
+            self._data[:n - first] = data[first:]
+        self.written += n
+
+    def read(self, n):
+        """Saca ``n`` bytes del buffer (lado worker)"""
+        pos = self.read_pos % self.capacity
+        first = min(n, self.capacity - pos)
+        out = bytes(self._data[pos:pos + first])
+        if first < n:
+            out += bytes(self._data[:n - first])
+        self.read_pos += n
+        self._read_counter[0] = self.read_pos
+        return out
+
+    def release(self):
+        self._read_counter.release()
+        self._data.release()
+
+
+def _slot_offset(slot, capacity):
+    return slot * (_SLOT_HEADER + capacity)
+
+
+def _worker_main(model_path, shm_name, slots, capacity, conn):
+    """Bucle de un proceso worker: atiende los mensajes de sus sesiones"""
+    # El padre decide cuándo termina el worker
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    model = vosk_registry.get_model(model_path)
+    pool = RecognizerPool(max_idle=slots, min_idle=0)
+
+    shm = SharedMemory(name=shm_name)
+    rings = [AudioRing(shm.buf, _slot_offset(i, capacity), capacity) for i in range(slots)]
+    sessions = {}
+    grammars = {}
+    conn.send(('ready', os.getpid(), None))
+
+    try:
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                break
+            op, req = message[0], message[1]
+            if op == 'stop':
+                break
+            try:
+                result = None
+                if op == 'grammar':
+                    key, grammar = message[2:]
+                    grammars[key] = grammar
+                elif op == 'forget':
+                    grammars.pop(message[2], None)
+                elif op == 'open':
+                    sid, slot, config, options = message[2:]
+                    if config.grammar:
+                        config = config._replace(grammar=grammars[config.grammar])
+                    recognizer = pool.acquire(model, config)
+                    stream = RecognitionStream(recognizer, **options)
+                    sessions[sid] = [slot, config, stream, [], []]
+                elif op == 'audio':
+                    sid, nbytes, mark = message[2:]
+                    slot, _, stream, pieces, chunks = sessions[sid]
+                    pieces.append(rings[slot].read(nbytes))
+                    if mark == _PIECE:
+                        continue
+                    chunks.append(b''.join(pieces))
+                    pieces.clear()
+                    if mark == _CHUNK_END:
+                        continue
+                    result = stream.accept(*chunks)
+                    chunks.clear()
+                elif op == 'final':
+                    result = sessions[message[2]][2].final()
+                elif op == 'reset':
+                    sessions[message[2]][2].reset()
+                elif op == 'stats':
+                    result = sessions[message[2]][2].stats()
+                elif op == 'close':
+                    slot, config, stream, _, _ = sessions.pop(message[2])
+                    pool.release(stream.recognizer, model, config)
+                if req is not None:
+                    conn.send((req, result, None))
+            except Exception as e:
+                if req is not None:
+                    conn.send((req, None, f'{type(e).__name__}: {e}'))
+    finally:
+        sessions.clear()
+        for ring in rings:
+            ring.release()
+        shm.close()
+
+
+class _Worker:
+    """Lado padre de un proceso worker"""
+
+    def __init__(self, ctx, index, model_path, slots, capacity):
+        self.index = index
+        self.slots = slots
+        self.capacity = capacity
+        self.shm = SharedMemory(create=True, size=slots * (_SLOT_HEADER + capacity))
+        self.rings = [
+            AudioRing(self.shm.buf, _slot_offset(i, capacity), capacity) for i in range(slots)
+        ]
+        self.free_slots = list(range(slots - 1, -1, -1))
+        # Hashes de las gramáticas que este worker tiene guardadas (LRU)
+        self.grammars = OrderedDict()
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(model_path, self.shm.name, slots, capacity, child_conn),
+            name=f'asr-worker-{index}',
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.alive = True
+        self.closing = False
+        self.pending = {}
+        self._send_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._reader = threading.Thread(
+            target=self._read_results, name=f'asr-worker-{index}-reader', daemon=True
+        )
+        self._reader.start()
+
+    def wait_ready(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def send(self, message):
+        with self._send_lock:
+            self.conn.send(message)
+
+    def _read_results(self):
+        while True:
+            try:
+                req, result, error = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            if req == 'ready':
+                self._ready.set()
+                continue
+            entry = self.pending.pop(req, None)
+            if entry is not None:
+                loop, future = entry
+                loop.call_soon_threadsafe(_resolve, future, result, error)
+
+        self.alive = False
+        self._ready.set()
+        if not self.closing:
+            logger.error('El worker de ASR %s terminó inesperadamente', self.index)
+        for loop, future in list(self.pending.values()):
+            loop.call_soon_threadsafe(_resolve, future, None, 'El worker de ASR terminó')
+        self.pending.clear()
+
+    def close(self):
+        self.closing = True
+        try:
+            self.send(('stop', None))
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
+        for ring in self.rings:
+            ring.release()
+        self.shm.close()
+        self.shm.unlink()
+
+
+def _resolve(future, result, error):
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(RuntimeError(error))
+    else:
+        future.set_result(result)
+
+
+class RemoteSession:
+    """
+    Sesión de reconocimiento que vive en un proceso worker.
+
+    Ofrece las mismas operaciones que ``RecognitionStream`` pero como
+    corrutinas, para que el consumer las encole en su ``SessionQueue`` igual
+    que en modo thread.
+    """
+
+    def __init__(self, pool, worker, slot, sid):
+        self._pool = pool
+        self.worker = worker
+        self.slot = slot
+        self.sid = sid
+        self.ring = worker.rings[slot]
+
+    async def _call(self, *message):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        req = next(self._pool._requests)
+        self.worker.pending[req] = (loop, future)
+        try:
+            self.worker.send((message[0], req) + message[1:])
+        except (OSError, ValueError) as e:
+            self.worker.pending.pop(req, None)
+            raise RuntimeError(f'El worker de ASR no está disponible: {e}')
+        return await future
+
+    async def accept(self, *chunks):
+        """Escribe el audio en el buffer compartido y espera el resultado del worker"""
+        for position, chunk in enumerate(chunks):
+            data = memoryview(chunk)
+            while len(data) > self.ring.free():
+                # No cabe entero: se envía por partes y el worker las junta
+                free = self.ring.free()
+                if free > 0:
+                    self.ring.write(data[:free])
+                    self.worker.send(('audio', None, self.sid, free, _PIECE))
+                    data = data[free:]
+                else:
+                    await asyncio.sleep(0.002)
+            self.ring.write(data)
+            if position < len(chunks) - 1:
+                self.worker.send(('audio', None, self.sid, len(data), _CHUNK_END))
+        return await self._call('audio', self.sid, len(data), _LAST)
+
+    async def final(self):
+        return await self._call('final', self.sid)
+
+    async def reset(self):
+        return await self._call('reset', self.sid)
+
+    async def stats(self):
+        return await self._call('stats', self.sid)
+
+    async def close(self):
+        if self.worker.alive:
+            try:
+                await self._call('close', self.sid)
+            except RuntimeError:
+                pass
+        self._pool._release_slot(self.worker, self.slot)
+
+
+class ASRProcessPool:
+    """Pool de procesos worker de ASR con sesiones fijadas a un worker"""
+
+    def __init__(self, processes=None, model_path=None, slots=None, ring_bytes=None):
+        processes = (
+            processes or getattr(settings, 'VOSK_ASR_PROCESSES', None)
+            or min(os.cpu_count() or 1, _DEFAULT_MAX_PROCESSES)
+        )
+        # El mismo modelo que usaría una sesión en modo thread sin elegir ninguno
+        model_path = model_path or vosk_registry.model_paths()[vosk_registry.default_name()]
+        slots = slots or getattr(settings, 'VOSK_ASR_PROCESS_SLOTS', 64)
+        ring_bytes = ring_bytes or getattr(settings, 'VOSK_ASR_RING_BYTES', 256 * 1024)
+        capacity = ring_bytes - ring_bytes % 8
+
+        ctx = multiprocessing.get_context('spawn')
+        self._lock = threading.Lock()
+        self._requests = itertools.count()
+        self._sessions = itertools.count()
+        self.workers = [_Worker(ctx, i, model_path, slots, capacity) for i in range(processes)]
+        for worker in self.workers:
+            worker.wait_ready(timeout=getattr(settings, 'VOSK_ASR_PROCESS_START_TIMEOUT', 120))
+
+    async def open_session(self, config=None, options=None):
+        """
+        Abre una sesión en el worker con menos sesiones activas.
+
+        ``options`` son los argumentos de ``RecognitionStream`` (vad...).
+        """
+        config = config or RecognizerConfig()
+        options = options or {}
+        with self._lock:
+            candidates = [w for w in self.workers if w.alive and w.free_slots]
+            if not candidates:
+                raise RuntimeError('No hay capacidad de ASR disponible')
+            worker = max(candidates, key=lambda w: len(w.free_slots))
+            slot = worker.free_slots.pop()
+        session = RemoteSession(self, worker, slot, next(self._sessions))
+        try:
+            if config.grammar:
+                config = await self._share_grammar(session, config)
+            await session._call('open', session.sid, slot, config, options)
+        except Exception:
+            self._release_slot(worker, slot)
+            raise
+        return session
+
+    async def _share_grammar(self, session, config):
+        """
+        Envía la gramática al worker sólo si no la tiene ya.
+
+        Con un catálogo grande la gramática pesa mucho; cada sesión que abre
+        en modo gramática manda únicamente su hash.
+        """
+        worker = session.worker
+        key = hashlib.sha1(config.grammar.encode('utf-8')).hexdigest()
+        if key in worker.grammars:
+            worker.grammars.move_to_end(key)
+        else:
+            await session._call('grammar', key, config.grammar)
+            worker.grammars[key] = True
+            if len(worker.grammars) > _MAX_GRAMMARS:
+                old, _ = worker.grammars.popitem(last=False)
+                worker.send(('forget', None, old))
+        return config._replace(grammar=key)
+
+    def _release_slot(self, worker, slot):
+        with self._lock:
+            worker.free_slots.append(slot)
+
+    def stats(self):
+        return [
+            {
+                'pid': worker.process.pid,
+                'alive': worker.alive,
+                'sessions': worker.slots - len(worker.free_slots),
+            }
+            for worker in self.workers
+        ]
+
+    def shutdown(self):
+        for worker in self.workers:
+            worker.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_process_pool():
+    """Pool de procesos del proceso actual (se arranca la primera vez)"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ASRProcessPool()
+                atexit.register(_pool.shutdown)
+    return _pool
+
+
+def is_enabled():
+    return getattr(settings, 'VOSK_ASR_MODE', 'thread') == 'process'
@@ -0,0 +1,222 @@
+"""
+Procesamiento del audio de voz antes de llegar a Vosk.
+
+Todo está vectorizado con NumPy: el audio llega en chunks de miles de muestras
+y recorrerlas una a una en Python costaría más que el propio reconocimiento.
+"""
+from math import gcd
+
+import numpy as np
+
+# dBFS de una señal int16 a escala completa
+_FULL_SCALE_DB = 20 * np.log10(32768.0)
+
+# Códecs que el cliente puede negociar en el mensaje 'start'
+CODEC_PCM16 = 'pcm16'  # PCM 16-bit little endian (por defecto)
+CODEC_MULAW = 'mulaw'  # G.711 μ-law, 8 bits por muestra
+
+
+def _mulaw_table():
+    """Las 256 muestras PCM que representa cada byte μ-law (G.711)"""
+    codes = ~np.arange(256, dtype=np.uint8)
+    exponent = (codes >> 4) & 0x07
+    mantissa = (codes & 0x0F).astype(np.int32)
+    magnitude = (((mantissa << 3) + 0x84) << exponent) - 0x84
+    return np.where(codes & 0x80, -magnitude, magnitude).astype(np.int16)
+
+
+_MULAW_TABLE = _mulaw_table()
+
+
+def decode_mulaw(data):
+    """μ-law a PCM 16-bit: una consulta a la tabla por byte, sin bucles"""
+    return _MULAW_TABLE[np.frombuffer(data, dtype=np.uint8)].tobytes()
+
+
+DECODERS = {
+    CODEC_MULAW: decode_mulaw,
+}
+
+
+class Resampler:
+    """
+    Remuestreo polifásico de PCM 16-bit a la frecuencia de Vosk.
+
+    Para pasar de ``in_rate`` a ``out_rate`` se sube por ``up`` y se baja por
+    ``down`` (p. ej. 48000 → 16000 es 1/3 y 44100 → 16000 es 160/441), con un
+    filtro paso bajo de ventana Kaiser dividido en ``up`` fases de ``taps``
+    coeficientes. Cada muestra de salida usa una sola fase, así que el coste es
+    ``taps`` multiplicaciones por muestra de salida, todas en una operación
+    vectorial por chunk.
+
+    Guarda las últimas ``taps - 1`` muestras y la posición de la siguiente
+    salida, de modo que partir el audio en chunks da el mismo resultado que
+    procesarlo entero.
+    """
+
+    def __init__(self, in_rate, out_rate=16000, taps=32):
+        divisor = gcd(int(in_rate), int(out_rate))
+        self.up = int(out_rate) // divisor
+        self.down = int(in_rate) // divisor
+        self.taps = taps
+
+        length = self.up * taps
+        n = np.arange(length) - (length - 1) / 2
+        # Corte un 10% por debajo de Nyquist: más rechazo del aliasing a cambio
+        # de atenuar un poco por encima de 7 kHz, donde la voz aporta poco
+        cutoff = 0.9 * 0.5 / max(self.up, self.down)
+        prototype = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(length, 8.0) * self.up
+        # phases[p, k] = prototype[k * up + p], invertido en k para multiplicar
+        # directamente por la ventana de entrada en orden cronológico
+        self._phases = prototype.reshape(taps, self.up).T[:, ::-1].astype(np.float32)
+        self._window = np.arange(taps) - (taps - 1)
+        self.reset()
+
+    def reset(self):
+        self._history = np.zeros(self.taps - 1, dtype=np.float32)
+        # Posición de la siguiente salida en unidades de la señal subida,
+        # contada desde el inicio del historial
+        self._position = (self.taps - 1) * self.up
+
+    def process(self, pcm):
+        """Remuestrea un chunk de PCM 16-bit y devuelve PCM 16-bit"""
+        samples = np.frombuffer(pcm, dtype=np.int16).astype(np.float32)
+        buffer = np.concatenate((self._history, samples))
+        available = len(buffer) * self.up - 1 - self._position
+        count = available // self.down + 1 if available >= 0 else 0
+
+        positions = self._position + np.arange(count, dtype=np.int64) * self.down
+        base, phase = np.divmod(positions, self.up)
+        windows = buffer[base[:, None] + self._window]
+        out = np.einsum('nk,nk->n', windows, self._phases[phase])
+
+        consumed = len(buffer) - (self.taps - 1)
+        self._position += count * self.down - consumed * self.up
+        self._history = buffer[consumed:]
+        return np.clip(np.rint(out), -32768, 32767).astype(np.int16).tobytes()
+
+
+class VoiceActivityDetector:
+    """
+    Detector de voz por energía y cruces por cero.
+
+    Divide el audio en tramas de ``frame_ms`` y clasifica cada una como voz o
+    silencio: voz si su energía supera el umbral, o si se queda cerca del
+    umbral pero cruza mucho por cero (consonantes sordas como "s" o "f"). El
+    umbral se adapta al ruido de fondo de la sesión.
+
+    Sólo deja pasar la voz más un margen: ``padding_ms`` antes del inicio de
+    la frase y ``hangover_ms`` después. Tras ``end_silence_ms`` de silencio
+    marca el fin de la frase, para cerrarla sin esperar a que Vosk detecte el
+    silencio (que ya no recibe). El fin se indica con su posición dentro del
+    audio devuelto: si en el mismo chunk empieza otra frase, su voz va detrás.
+    """
+
+    def __init__(self, sample_rate=16000, frame_ms=30, threshold_db=-50.0, margin_db=12.0,
+                 zcr_threshold=0.25, padding_ms=210, hangover_ms=300, end_silence_ms=800):
+        self.frame = int(sample_rate * frame_ms / 1000)
+        self.threshold_db = threshold_db
+        self.margin_db = margin_db
+        self.zcr_threshold = zcr_threshold
+        self.padding_frames = max(int(padding_ms / frame_ms), 0)
+        self.hangover_frames = max(int(hangover_ms / frame_ms), 0)
+        self.end_silence_frames = max(int(end_silence_ms / frame_ms), self.hangover_frames + 1)
+        self.frames_total = 0
+        self.frames_dropped = 0
+        self.utterances = 0
+        self.reset()
+
+    def reset(self):
+        """Olvida el estado de la frase en curso (los contadores se conservan)"""
+        self._remainder = np.zeros(0, dtype=np.int16)
+        # Últimas tramas de silencio antes de la voz (relleno de la frase siguiente)
+        self._preroll = np.zeros((0, self.frame), dtype=np.int16)
+        self._in_speech = False
+        self._silence_run = 0
+        self._noise_db = None
+
+    def _classify(self, frames):
+        """Vector booleano voz/silencio para una matriz (tramas x muestras)"""
+        samples = frames.astype(np.float32)
+        energy_db = 10 * np.log10(np.mean(samples * samples, axis=1) + 1e-9) - _FULL_SCALE_DB
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / frames.shape[1]
+
+        # Piso de ruido: media móvil lenta de las tramas más silenciosas
+        quietest = float(np.min(energy_db))
+        if self._noise_db is None:
+            self._noise_db = quietest
+        else:
+            self._noise_db = 0.95 * self._noise_db + 0.05 * quietest
+        threshold = max(self.threshold_db, self._noise_db + self.margin_db)
+
+        return (energy_db > threshold) | ((energy_db > threshold - 6) & (zcr > self.zcr_threshold))
+
+    def process(self, pcm):
+        """
+        Filtra un chunk de audio PCM 16-bit.
+
+        Returns:
+            (bytes de voz a reconocer, lista con la posición en muestras, dentro
+            de esos bytes, de cada fin de frase detectado en este chunk)
+        """
+        samples = np.frombuffer(pcm, dtype=np.int16)
+        if self._remainder.size:
+            samples = np.concatenate((self._remainder, samples))
+        count = samples.size // self.frame
+        self._remainder = samples[count * self.frame:].copy()
+        if not count:
+            return b'', []
+
+        frames = samples[:count * self.frame].reshape(count, self.frame)
+        speech = self._classify(frames)
+        self.frames_total += count
+
+        # Las rachas de silencio se miden desde la última trama de voz; las
+        # del principio del chunk siguen la racha del chunk anterior
+        positions = np.arange(count)
+        last_speech = np.maximum.accumulate(np.where(speech, positions, -1))
+        leading = last_speech < 0
+        run = np.where(leading, self._silence_run + positions + 1, positions - last_speech)
+        # Silencio dentro de una frase: tras voz, o al principio si la frase seguía abierta
+        after_speech = ~speech & (~leading | self._in_speech)
+        hangover = after_speech & (run <= self.hangover_frames)
+        end = after_speech & (run == self.end_silence_frames)
+        in_speech = speech | (after_speech & (run < self.end_silence_frames))
+        # Silencio fuera de una frase: puede ser el relleno de la siguiente
+        idle = ~speech & ~(after_speech & (run <= self.end_silence_frames))
+        next_speech = np.minimum.accumulate(np.where(speech, positions, count)[::-1])[::-1]
+        padding = idle & (next_speech < count) & (next_speech - positions <= self.padding_frames)
+        keep = speech | hangover | padding
+
+        # Relleno guardado del chunk anterior, si la primera frase empieza pronto
+        preroll = self._preroll[:0]
+        if not self._in_speech and speech.any():
+            take = min(self.padding_frames - int(np.argmax(speech)), len(self._preroll))
+            if take > 0:
+                preroll = self._preroll[-take:]
+        if self.padding_frames:
+            trailing = count if idle.all() else int(np.argmin(idle[::-1]))
+            recent = frames[count - trailing:]
+            if trailing == count:
+                recent = np.concatenate((self._preroll, recent))
+            self._preroll = recent[-self.padding_frames:].copy()
+
+        kept_before = len(preroll) + np.cumsum(keep) - keep
+        ends = (kept_before[end] * self.frame).tolist()
+        self._in_speech = bool(in_speech[-1])
+        self._silence_run = int(run[-1]) if self._in_speech and not speech[-1] else 0
+        self.utterances += len(ends)
+
+        kept = len(preroll) + int(np.count_nonzero(keep))
+        self.frames_dropped += count - kept
+        if not kept:
+            return b'', ends
+        return np.concatenate((preroll, frames[keep])).tobytes(), ends
+
+    def stats(self):
+        return {
+            'frames_total': self.frames_total,
+            'frames_dropped': self.frames_dropped,
+            'utterances': self.utterances,
+        }
@@ -0,0 +1,34 @@
+"""
+Piezas comunes de los comandos ``benchmark_*``: audio sintético y resumen de
+latencias por percentiles.
+"""
+import numpy as np
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentiles(values, scale=1000):
+    """
+    Resumen de una lista de medidas en segundos.
+
+    Returns:
+        {'n', 'p50', 'p90', 'p95', 'p99', 'max'} en milisegundos (o
+        multiplicado por ``scale``); sólo {'n': 0} si no hay medidas
+    """
+    if not values:
+        return {'n': 0}
+    data = np.asarray(values) * scale
+    result = {'n': len(values)}
+    for p in PERCENTILES:
+        result[f'p{p}'] = round(float(np.percentile(data, p)), 3)
+    result['max'] = round(float(data.max()), 3)
+    return result
+
+
+def synthetic_voice(rate, seconds):
+    """PCM 16-bit de tonos modulados con ruido, para que el VAD alterne voz y silencio"""
+    t = np.arange(int(rate * seconds)) / rate
+    envelope = (np.sin(2 * np.pi * 0.5 * t) > 0).astype(np.float32)
+    tone = np.sin(2 * np.pi * 220 * t) + 0.5 * np.sin(2 * np.pi * 1800 * t)
+    noise = np.random.default_rng(0).normal(0, 0.01, t.size)
+    return (np.clip(envelope * tone * 0.3 + noise, -1, 1) * 32767).astype(np.int16).tobytes()
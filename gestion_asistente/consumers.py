@@ -1,10 +1,53 @@
 import json
 import asyncio
 import base64
+import functools
+from collections import deque
+from urllib.parse import parse_qs
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
-from vosk import Model, KaldiRecognizer
 from django.conf import settings
 import os
+from . import asr_workers, resume, vosk_registry
+from .admission import AdmissionRejected, get_admission
+from .asr_executor import SessionOverloaded, SessionQueue
+from .audio import CODEC_PCM16, DECODERS
+from .intents import get_intent_engine
+from .partials import PartialCoalescer
+from .prefetch import SpeculativePrefetch
+from .protocol import (
+    PROTOCOL_JSON, PROTOCOL_MSGPACK, SUBPROTOCOL_MSGPACK, MessageEncoder, parse_result, unescape,
+)
+from .recognition import RecognitionStream
+from .recording import SessionRecorder
+from .recognizer_pool import RecognizerConfig, get_pool
+from .rescoring import rescore
+from .resume import get_parking
+from .vocabulary import get_vocabulary
+
+# Modos de reconocimiento que el cliente puede pedir en el mensaje 'start'
+MODE_OPEN = 'open'        # vocabulario abierto del modelo
+MODE_GRAMMAR = 'grammar'  # sólo comandos, números y nombres del catálogo
+
+# Estado de una sesión que se aparca al caerse el socket y se recupera al
+# reanudarla (ver resume.py)
+_PARKED_FIELDS = (
+    'model_name', 'model_path', 'model', 'model_version', 'loaded_model', 'recognizer', 'stream',
+    'recognizer_config', 'stream_options', 'mode', 'intents_enabled', 'prefetch_enabled', 'degraded',
+)
+
+
+async def _close_parked(state):
+    """Libera una sesión aparcada que nadie reanudó"""
+    stream = state['stream']
+    if isinstance(stream, asr_workers.RemoteSession):
+        await stream.close()
+    elif state['recognizer'] is not None:
+        await asyncio.get_running_loop().run_in_executor(
+            None, get_pool().release, state['recognizer'], state['model'], state['recognizer_config']
+        )
+    if state['model_version'] is not None:
+        vosk_registry.release(state['model_version'])
 
 class VoiceRecognitionConsumer(AsyncWebsocketConsumer):
     """
@@ -14,58 +57,342 @@ class VoiceRecognitionConsumer(AsyncWebsocketConsumer):
     
     async def connect(self):
         """Conexión WebSocket establecida"""
-        await self.accept()
+        # Formato de los mensajes al cliente: JSON, o MessagePack si lo pide
+        # con el subprotocolo al conectar (o más tarde en 'start')
+        if SUBPROTOCOL_MSGPACK in self.scope.get('subprotocols', []):
+            self.encoder = MessageEncoder(PROTOCOL_MSGPACK)
+            await self.accept(subprotocol=SUBPROTOCOL_MSGPACK)
+        else:
+            self.encoder = MessageEncoder(PROTOCOL_JSON)
+            await self.accept()
+        # Mensajes retenidos mientras la sesión está aparcada (None = conectada)
+        self.outbox = None
         
-        # Inicializar modelo Vosk en un thread separado para no bloquear
-        self.model_path = settings.VOSK_MODEL_PATH
+        # El modelo Vosk es compartido por el proceso (ver vosk_registry); la
+        # sesión conserva su versión hasta desconectarse aunque se recargue
+        self.model_name = vosk_registry.default_name()
+        self.model_path = vosk_registry.current_path(self.model_name)
+        self.model = None
+        self.model_version = None
+        self.loaded_model = None
         self.recognizer = None
+        # RecognitionStream local o RemoteSession en un proceso worker
+        self.stream = None
         self.sample_rate = 16000  # Vosk requiere 16kHz
+        self.recognizer_config = RecognizerConfig(sample_rate=self.sample_rate)
+        self.mode = MODE_OPEN
+        # Argumentos de RecognitionStream (etapas de audio antes de Vosk)
+        self.stream_options = self._default_stream_options()
+        # Cola serie de la sesión: el audio se reconoce en orden y de a un chunk
+        self.asr_queue = SessionQueue(on_error=self._send_audio_error)
+        # Interpretar las frases completas en el servidor (mensaje 'intent')
+        self.intents_enabled = getattr(settings, 'VOSK_INTENTS_ENABLED', True)
+        # Predecir productos desde los parciales (mensaje 'prefetch'); usa
+        # las intenciones para comprobar si acertó
+        self.prefetch_enabled = getattr(settings, 'VOSK_PREFETCH_ENABLED', True)
+        self.prefetch = SpeculativePrefetch(
+            self._send_prefetch, debounce=getattr(settings, 'VOSK_PREFETCH_DEBOUNCE', 0.05)
+        )
+        # Parciales sin repeticiones y con un intervalo mínimo entre envíos
+        self.partials = PartialCoalescer(
+            self._send_partial, getattr(settings, 'VOSK_PARTIAL_MIN_INTERVAL', 0.15)
+        )
+        # Modo degradado (gramática, parciales espaciados) si el proceso está
+        # cerca de su límite de sesiones al empezar a escuchar
+        self.degraded = False
+        # Grabación de las frases para reproducirlas después (VOSK_RECORD_DIR)
+        self.recorder = None
+        
+        # Plaza de reconocimiento: si el proceso está lleno se espera en cola.
+        # La espera va en una tarea aparte: mientras connect() no termina,
+        # Channels no entrega la desconexión, y el cliente que se va seguiría
+        # ocupando su sitio en la cola hasta agotar la espera
+        self.admission_id = None
+        self.admission_task = asyncio.ensure_future(self._admit())
+    
+    async def _admit(self):
+        """Espera plaza y prepara la sesión (reanudada o nueva)"""
+        try:
+            self.admission_id = await get_admission().acquire(self._send_busy)
+        except AdmissionRejected as e:
+            await self.send_message({
+                'type': 'busy',
+                'position': None,
+                'message': f'Servidor ocupado, inténtalo más tarde ({e})'
+            })
+            await self.close(code=1013)
+            return
+        
+        # Reanudar la sesión aparcada si el cliente vuelve con su token
+        self.resume_token = None
+        if resume.is_enabled():
+            if await self._resume():
+                return
+            self.resume_token = get_parking().issue()
         
         # Verificar que el modelo existe
         if not os.path.exists(self.model_path):
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'error',
                 'message': f'Modelo Vosk no encontrado en {self.model_path}'
-            }))
+            })
             await self.close()
             return
         
         try:
-            # Cargar modelo en thread separado para no bloquear
-            await asyncio.get_event_loop().run_in_executor(
-                None, self._init_recognizer
-            )
+            await self._open_stream(self.recognizer_config, self.stream_options)
             
-            await self.send(text_data=json.dumps({
+            ready = {
                 'type': 'ready',
                 'message': 'Reconocimiento de voz listo'
-            }))
+            }
+            if self.resume_token:
+                # Para reconectar con ?resume=<token> sin perder la frase en curso
+                ready['resume_token'] = self.resume_token
+                ready['resume_ttl'] = get_parking().ttl
+            await self.send_message(ready)
             
         except Exception as e:
-            await self.send(text_data=json.dumps({
+            await self.send_message({
                 'type': 'error',
                 'message': f'Error al cargar modelo Vosk: {str(e)}'
-            }))
+            })
             await self.close()
     
+    async def _open_stream(self, config, options):
+        """Abre el reconocimiento de la sesión con ``config`` (reemplaza el anterior)"""
+        await self._close_stream()
+        self.recognizer_config = config
+        self.stream_options = options
+        if asr_workers.is_enabled():
+            # El reconocimiento corre en un proceso worker de ASR
+            pool = await asyncio.get_event_loop().run_in_executor(
+                None, asr_workers.get_process_pool
+            )
+            self.stream = await pool.open_session(config, options)
+        else:
+            # Crear reconocedor en thread separado para no bloquear
+            # (la primera conexión del proceso también carga el modelo)
+            await asyncio.get_event_loop().run_in_executor(
+                None, self._init_recognizer
+            )
+    
+    async def _close_stream(self):
+        """Cierra el reconocimiento actual y devuelve el reconocedor al pool"""
+        # Esperar al chunk en curso: el reconocedor no puede volver al
+        # pool mientras un thread de ASR lo está usando
+        await self.asr_queue.join()
+        stream, self.stream = self.stream, None
+        if isinstance(stream, asr_workers.RemoteSession):
+            await stream.close()
+        recognizer, self.recognizer = self.recognizer, None
+        if recognizer:
+            # El modelo es compartido por el proceso y no se libera aquí
+            await asyncio.get_event_loop().run_in_executor(
+                None, get_pool().release, recognizer, self.model, self.recognizer_config
+            )
+    
+    async def _config_for(self, data):
+        """Configuración del reconocedor pedida en un mensaje 'start'"""
+        mode = data.get('mode') or getattr(settings, 'VOSK_RECOGNITION_MODE', MODE_OPEN)
+        if self.degraded and mode == MODE_OPEN and getattr(settings, 'VOSK_DEGRADE_GRAMMAR', True):
+            # Bajo carga: la gramática del catálogo decodifica mucho más rápido
+            mode = MODE_GRAMMAR
+        if mode == MODE_GRAMMAR:
+            grammar = await database_sync_to_async(get_vocabulary().grammar)()
+        elif mode == MODE_OPEN:
+            grammar = None
+        else:
+            raise ValueError(f'Modo de reconocimiento desconocido: {mode}')
+        self.mode = mode
+        # Detalle por palabra: los resultados lo llevan salvo que el cliente
+        # pida 'words': false; los parciales sólo si pide 'partial_words'
+        words = data.get('words', getattr(settings, 'VOSK_RESULT_WORDS', True))
+        # Hipótesis por frase (N-best) que se reordenan contra el catálogo
+        alternatives = int(data.get('alternatives', getattr(settings, 'VOSK_MAX_ALTERNATIVES', 0)) or 0)
+        if not 0 <= alternatives <= 10:
+            raise ValueError(f'Número de alternativas no soportado: {alternatives}')
+        if self.degraded:
+            alternatives = 0
+        return self.recognizer_config._replace(
+            grammar=grammar, words=bool(words), partial_words=bool(data.get('partial_words', False)),
+            alternatives=alternatives
+        )
+    
+    def _default_stream_options(self):
+        vad = None
+        if getattr(settings, 'VOSK_VAD_ENABLED', True):
+            vad = dict(getattr(settings, 'VOSK_VAD', {}), sample_rate=self.sample_rate)
+        return {'codec': CODEC_PCM16, 'sample_rate': self.sample_rate, 'vad': vad}
+    
+    def _options_for(self, data):
+        """Opciones del stream pedidas en un mensaje 'start'"""
+        options = self._default_stream_options()
+        # Códec del audio binario: PCM por defecto, o μ-law (la mitad de
+        # bytes) para los clientes que lo codifican
+        codec = data.get('codec') or CODEC_PCM16
+        if codec != CODEC_PCM16 and codec not in DECODERS:
+            raise ValueError(f'Códec de audio no soportado: {codec}')
+        options['codec'] = codec
+        # Frecuencia de captura del navegador (44.1/48 kHz...); el servidor
+        # remuestrea a 16kHz, así el cliente no tiene que hacerlo
+        capture_rate = int(data.get('sample_rate') or self.sample_rate)
+        if not 8000 <= capture_rate <= 96000:
+            raise ValueError(f'Frecuencia de muestreo no soportada: {capture_rate}')
+        options['sample_rate'] = capture_rate
+        if data.get('vad') is False:
+            # El cliente puede desactivar el filtro de silencios
+            options['vad'] = None
+        elif data.get('vad') is True and options['vad'] is None:
+            options['vad'] = dict(getattr(settings, 'VOSK_VAD', {}), sample_rate=self.sample_rate)
+        return options
+    
+    def _model_for(self, data):
+        """Modelo pedido en un mensaje 'start' (p. ej. el grande en escritorio, el pequeño en móvil)"""
+        name = data.get('model') or vosk_registry.default_name()
+        if name not in vosk_registry.model_paths():
+            raise ValueError(f'Modelo de voz desconocido: {name}')
+        if asr_workers.is_enabled() and name != vosk_registry.default_name():
+            raise ValueError('Con los workers de ASR sólo está disponible el modelo por defecto')
+        return name
+    
     def _init_recognizer(self):
-        """Inicializa el modelo y reconocedor de Vosk (ejecutado en thread separado)"""
-        self.model = Model(self.model_path)
-        self.recognizer = KaldiRecognizer(self.model, self.sample_rate)
-        self.recognizer.SetWords(True)
+        """Obtiene el modelo compartido y toma un reconocedor del pool (ejecutado en thread separado)"""
+        if self.model is None or self.loaded_model != self.model_name:
+            # Cambio de modelo: la versión anterior puede descargarse
+            self._release_model()
+            self.model_version, self.model = vosk_registry.acquire(self.model_name)
+            self.loaded_model = self.model_name
+        self.recognizer = get_pool().acquire(self.model, self.recognizer_config)
+        self.stream = RecognitionStream(self.recognizer, **self.stream_options)
+    
+    def _release_model(self):
+        """Devuelve la versión del modelo (una versión retirada se descarga con su última sesión)"""
+        if self.model_version is not None:
+            vosk_registry.release(self.model_version)
+        self.model_version = self.model = self.loaded_model = None
     
     async def disconnect(self, close_code):
         """Desconexión WebSocket"""
-        # Limpiar recursos
-        if hasattr(self, 'recognizer') and self.recognizer:
-            del self.recognizer
-        if hasattr(self, 'model') and self.model:
-            del self.model
+        task = getattr(self, 'admission_task', None)
+        if task is not None and not task.done():
+            if self.admission_id is None:
+                # Sigue en la cola: deja su sitio al siguiente
+                task.cancel()
+            # Si ya tiene plaza se espera a que la sesión termine de abrirse
+            # para cerrarla entera
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        # Devolver el reconocedor al pool para la próxima conexión, o
+        # aparcarlo si el socket se cayó y el cliente puede volver
+        if hasattr(self, 'asr_queue') and self._can_park(close_code):
+            await self._park()
+        elif hasattr(self, 'asr_queue'):
+            self.partials.clear()
+            self.prefetch.reset()
+            await self.asr_queue.close()
+            await self._close_stream()
+            await self._save_recording()
+        if hasattr(self, 'model_version'):
+            self._release_model()
+        if getattr(self, 'degraded', False):
+            get_admission().leave_degraded()
+            self.degraded = False
+        if getattr(self, 'admission_id', None):
+            # Liberar la plaza para la siguiente conexión en espera
+            await get_admission().release(self.admission_id)
+            self.admission_id = None
+    
+    def _owner(self):
+        user = self.scope.get('user')
+        return user.pk if user is not None and user.is_authenticated else None
+    
+    def _can_park(self, close_code):
+        # Un cierre limpio (1000) es el cliente terminando: no va a volver
+        return getattr(self, 'resume_token', None) is not None and self.stream is not None and close_code != 1000
+    
+    async def _park(self):
+        """Aparca la sesión para que el cliente pueda reanudarla"""
+        # Lo que produzca el audio ya recibido se guarda para reenviarlo
+        self.outbox = deque(maxlen=getattr(settings, 'VOSK_RESUME_MAX_MESSAGES', 32))
+        await self.asr_queue.join()
+        self.partials.clear()
+        self.prefetch.reset()
+        await self.asr_queue.close()
+        await self._save_recording()
+        state = {field: getattr(self, field) for field in _PARKED_FIELDS}
+        state['partial_interval'] = self.partials.min_interval
+        state['outbox'] = list(self.outbox)
+        get_parking().park(
+            self.resume_token, self._owner(), state, functools.partial(_close_parked, state)
+        )
+        # El reconocedor y el modelo ya no son de este consumer
+        self.stream = self.recognizer = None
+        self.model_version = self.model = self.loaded_model = None
+    
+    def _update_degraded(self):
+        """Modo degradado según la carga del proceso al empezar a escuchar"""
+        admission = get_admission()
+        was_degraded, self.degraded = self.degraded, admission.degraded()
+        if self.degraded and not was_degraded:
+            admission.enter_degraded()
+        elif was_degraded and not self.degraded:
+            admission.leave_degraded()
+    
+    async def _resume(self):
+        """Recupera la sesión aparcada de ``?resume=<token>``; True si la había"""
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        token = query.get('resume', [None])[0]
+        if not token:
+            return False
+        state = get_parking().claim(token, self._owner())
+        if state is None:
+            return False
+        outbox = state.pop('outbox')
+        self.partials.min_interval = state.pop('partial_interval')
+        for field, value in state.items():
+            setattr(self, field, value)
+        if self.degraded:
+            get_admission().enter_degraded(new=False)
+        # Cada token sirve una vez
+        self.resume_token = get_parking().issue()
+        await self.send_message({
+            'type': 'resumed',
+            'resume_token': self.resume_token,
+            'resume_ttl': get_parking().ttl,
+            'mode': self.mode,
+            'model': self.model_name,
+            'replayed': len(outbox),
+            'message': 'Sesión reanudada'
+        })
+        for frame in outbox:
+            await self.send(**frame)
+        return True
+    
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        if self.outbox is not None:
+            # Sesión aparcada: se reenviará si el cliente vuelve
+            self.outbox.append({'text_data': text_data, 'bytes_data': bytes_data})
+            return
+        await super().send(text_data=text_data, bytes_data=bytes_data, close=close)
     
     async def receive(self, text_data=None, bytes_data=None):
         """
         Recibe datos del cliente (audio o comandos)
         """
+        if not self.admission_task.done():
+            if self.admission_id is None:
+                # Aún en la cola: no hay sesión para este mensaje
+                if text_data:
+                    await self.send_message({
+                        'type': 'error',
+                        'message': 'Esperando plaza: la sesión empieza con el mensaje ready'
+                    })
+                return
+            # Ya tiene plaza: terminar de abrir la sesión antes de atender el mensaje
+            await self.admission_task
         try:
             if text_data:
                 # Mensaje de control (JSON)
@@ -73,81 +400,178 @@ class VoiceRecognitionConsumer(AsyncWebsocketConsumer):
                 msg_type = data.get('type')
                 
                 if msg_type == 'start':
-                    # Reiniciar reconocedor para nueva sesión
-                    if self.recognizer:
-                        await asyncio.get_event_loop().run_in_executor(
-                            None, self.recognizer.Reset
-                        )
-                    await self.send(text_data=json.dumps({
+                    self._update_degraded()
+                    self.partials.min_interval = getattr(
+                        settings,
+                        'VOSK_DEGRADED_PARTIAL_INTERVAL' if self.degraded else 'VOSK_PARTIAL_MIN_INTERVAL',
+                        0.5 if self.degraded else 0.15,
+                    )
+                    # El cliente puede elegir el modo de reconocimiento
+                    config = await self._config_for(data)
+                    options = self._options_for(data)
+                    model_name = self._model_for(data)
+                    if 'intents' in data:
+                        self.intents_enabled = bool(data['intents'])
+                    if 'prefetch' in data:
+                        self.prefetch_enabled = bool(data['prefetch'])
+                    self.prefetch.reset()
+                    if data.get('protocol'):
+                        self.encoder = MessageEncoder(data['protocol'])
+                    self.partials.clear()
+                    await self._save_recording()
+                    self.recorder = SessionRecorder.for_session(options)
+                    if (config != self.recognizer_config or options != self.stream_options
+                            or model_name != self.model_name or not self.stream):
+                        self.model_name = model_name
+                        # Un reconocedor recién tomado del pool ya está reiniciado
+                        await self._open_stream(config, options)
+                    else:
+                        # Reiniciar reconocedor para nueva sesión
+                        await self.asr_queue.submit(self.stream.reset)
+                    await self.send_message({
                         'type': 'started',
+                        'mode': self.mode,
+                        'model': self.model_name,
+                        'codec': self.stream_options['codec'],
+                        'sample_rate': self.stream_options['sample_rate'],
+                        'protocol': self.encoder.protocol,
+                        'degraded': self.degraded,
                         'message': 'Reconocimiento iniciado'
-                    }))
+                    })
                 
                 elif msg_type == 'stop':
                     # Finalizar reconocimiento y obtener resultado final
-                    if self.recognizer:
-                        final_result = await asyncio.get_event_loop().run_in_executor(
-                            None, self.recognizer.FinalResult
-                        )
-                        result_json = json.loads(final_result)
+                    if self.stream:
+                        # Se encola detrás del audio pendiente de la sesión
+                        final_result = await self.asr_queue.submit(self.stream.final)
+                        self.partials.clear()
+                        field, transcript = parse_result(final_result)
                         
-                        if result_json.get('text'):
-                            await self.send(text_data=json.dumps({
-                                'type': 'final',
-                                'transcript': result_json['text']
-                            }))
+                        if field == 'text' and transcript:
+                            await self._send_final('final', final_result, transcript)
                     
-                    await self.send(text_data=json.dumps({
+                    stopped = {
                         'type': 'stopped',
                         'message': 'Reconocimiento detenido'
-                    }))
+                    }
+                    if self.stream:
+                        # Contadores de la sesión (p. ej. tramas de silencio descartadas)
+                        stopped['stats'] = await self.asr_queue.submit(self.stream.stats)
+                        stopped['stats']['partials'] = self.partials.stats()
+                        stopped['stats']['prefetch'] = self.prefetch.stats()
+                    await self.send_message(stopped)
+                    await self._save_recording()
             
             elif bytes_data:
                 # Datos de audio (bytes crudos)
-                if not self.recognizer:
+                if not self.stream:
                     return
+                if self.recorder:
+                    self.recorder.write(bytes_data)
                 
-                # Procesar audio en thread separado
-                result = await asyncio.get_event_loop().run_in_executor(
-                    None, self._process_audio, bytes_data
-                )
-                
-                if result:
-                    result_json = json.loads(result)
-                    
-                    # Enviar resultado parcial si hay texto
-                    if 'partial' in result_json and result_json['partial']:
-                        await self.send(text_data=json.dumps({
-                            'type': 'partial',
-                            'transcript': result_json['partial']
-                        }))
-                    
-                    # Enviar resultado final si está completo
-                    elif 'text' in result_json and result_json['text']:
-                        await self.send(text_data=json.dumps({
-                            'type': 'result',
-                            'transcript': result_json['text']
-                        }))
+                # Encolar el audio; se procesa en el executor de ASR y el
+                # resultado se envía en orden desde _send_recognition
+                try:
+                    self.asr_queue.submit(
+                        self.stream.accept, bytes_data,
+                        on_result=self._send_recognition, mergeable=True
+                    )
+                except SessionOverloaded:
+                    await self.send_message({
+                        'type': 'overloaded',
+                        'message': 'Servidor ocupado, se descartó audio'
+                    })
         
         except Exception as e:
-            await self.send(text_data=json.dumps({
-                'type': 'error',
-                'message': f'Error procesando audio: {str(e)}'
-            }))
+            await self._send_audio_error(e)
     
-    def _process_audio(self, audio_data):
-        """
-        Procesa chunk de audio con Vosk (ejecutado en thread separado)
+    async def _send_recognition(self, results):
+        """Envía al cliente los resultados de un chunk de audio, en orden"""
+        for result in results:
+            await self._send_result(result)
+
+    async def _send_result(self, result):
+        if not result:
+            return
+        # Sólo se extrae el texto, sin decodificar el JSON de Vosk
+        field, transcript = parse_result(result)
+        if not transcript:
+            return
         
-        Args:
-            audio_data: bytes de audio PCM 16-bit mono 16kHz
-            
-        Returns:
-            JSON string con resultado parcial o completo
-        """
-        if self.recognizer.AcceptWaveform(audio_data):
-            # Frase completa detectada
-            return self.recognizer.Result()
+        # Resultado parcial si hay texto (PartialCoalescer decide cuándo se envía)
+        if field == 'partial':
+            if self.prefetch_enabled and self.intents_enabled:
+                self.prefetch.observe(unescape(transcript))
+            await self.partials.push(transcript)
+        
+        # Enviar resultado final si está completo (siempre, sin esperar)
         else:
-            # Resultado parcial (palabra siendo pronunciada)
-            return self.recognizer.PartialResult()
+            self.partials.clear()
+            await self._send_final('result', result, transcript)
+    
+    async def _send_partial(self, transcript):
+        await self.send(**self.encoder.encode_transcript('partial', transcript))
+    
+    async def _send_final(self, msg_type, result, transcript):
+        """Envía una frase completa ('result' o 'final') y su intención"""
+        if self.recognizer_config.alternatives:
+            # Con N-best se envía la hipótesis que mejor encaja con la tienda
+            choice = await database_sync_to_async(rescore)(result)
+            if choice:
+                await self.send_message({
+                    'type': msg_type,
+                    'transcript': choice['transcript'],
+                    'confidence': choice['confidence'],
+                    'alternatives': choice['alternatives']
+                })
+                if self.intents_enabled and choice['intent']:
+                    await self.send_message({
+                        'type': 'intent',
+                        'transcript': choice['transcript'],
+                        'intent': choice['intent'],
+                        'confidence': choice['confidence']
+                    })
+                self.prefetch.resolve(choice['intent'])
+                return
+        await self.send(**self.encoder.encode_transcript(msg_type, transcript))
+        self.prefetch.resolve(await self._send_intent(transcript))
+    
+    async def _save_recording(self):
+        """Guarda en disco la frase grabada, si la hay, sin bloquear el event loop"""
+        recorder, self.recorder = self.recorder, None
+        if recorder:
+            await asyncio.get_running_loop().run_in_executor(None, recorder.save)
+    
+    async def _send_busy(self, position):
+        await self.send_message({
+            'type': 'busy',
+            'position': position,
+            'message': 'Servidor ocupado, esperando turno'
+        })
+    
+    async def _send_prefetch(self, prediction):
+        await self.send_message({'type': 'prefetch', **prediction})
+    
+    async def _send_intent(self, transcript):
+        """Envía la intención de una frase completa, con los productos ya resueltos (y la devuelve)"""
+        if not self.intents_enabled:
+            return None
+        text = unescape(transcript)
+        intent = await database_sync_to_async(get_intent_engine().parse)(text)
+        if intent:
+            await self.send_message({
+                'type': 'intent',
+                'transcript': text,
+                'intent': intent
+            })
+        return intent
+    
+    async def send_message(self, message):
+        """Envía un mensaje al cliente en el protocolo negociado"""
+        await self.send(**self.encoder.encode(message))
+    
+    async def _send_audio_error(self, e):
+        await self.send_message({
+            'type': 'error',
+            'message': f'Error procesando audio: {str(e)}'
+        })
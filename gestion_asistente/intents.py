@@ -0,0 +1,340 @@
+"""
+Intenciones de compra a partir de las transcripciones finales.
+
+El frontend interpretaba cada frase con cadenas de ``cmd.includes(...)`` y
+luego buscaba el producto recorriendo la lista completa. ``IntentEngine`` lo
+hace en el servidor: compila en un autómata Aho-Corasick las frases de los
+comandos, los números y los nombres del catálogo, y cada transcripción se
+recorre una sola vez, palabra a palabra, sin importar cuántos productos haya.
+Cuando cambia el catálogo el autómata nuevo se construye en un thread y,
+mientras tanto, se sigue usando el anterior. El consumer envía el resultado
+como mensaje 'intent' con los ids de producto ya resueltos.
+"""
+import heapq
+import logging
+import threading
+from bisect import bisect_left
+from collections import defaultdict, deque
+
+from gestion_productos.fuzzy_index import get_fuzzy_index
+from gestion_productos.text import fold
+
+from .vocabulary import NUMBER_WORDS, get_vocabulary, normalize
+
+# Acciones en orden de prioridad (el mismo que Shop.jsx): si una frase
+# contiene varios comandos gana el primero de esta lista
+ACTIONS = (
+    ('help', ('ayuda', 'comandos', 'qué puedo decir')),
+    ('add', ('agregar', 'agrega', 'añadir')),
+    ('read_cart', ('leer carrito', 'ver carrito', 'mostrar carrito', 'qué hay en el carrito')),
+    ('product_info', ('información', 'detalles', 'precio de', 'cuánto cuesta')),
+    ('search', ('buscar', 'busca', 'encuentra')),
+    ('read_products', ('leer productos', 'listar productos', 'mostrar productos', 'qué productos hay')),
+    ('list_categories', ('categorías', 'qué categorías hay')),
+    ('filter', ('filtrar', 'categoría', 'mostrar solo')),
+    ('clear_cart', ('vaciar carrito', 'limpiar carrito', 'borrar carrito', 'eliminar todo del carrito')),
+    ('remove', ('quitar', 'eliminar', 'remover')),
+    ('checkout', ('finalizar compra', 'terminar compra', 'comprar', 'pagar', 'proceder al pago')),
+    ('total', ('total', 'cuánto debo', 'cuánto es')),
+    ('confirm', ('confirmar', 'confirmar compra')),
+    ('cancel', ('cancelar', 'cerrar', 'salir')),
+    ('next', ('siguiente', 'continuar')),
+    ('back', ('anterior', 'atrás', 'volver')),
+)
+_PRIORITY = {action: index for index, (action, _) in enumerate(ACTIONS)}
+
+# Acciones que llevan cantidad ("agregar dos leche")
+_QUANTITY_ACTIONS = {'add', 'remove'}
+
+# Acciones sobre un producto: si ningún nombre coincide exactamente se
+# busca en el índice aproximado (el reconocedor suele deformar los nombres)
+_PRODUCT_ACTIONS = {'add', 'remove', 'product_info', 'search'}
+_FUZZY_LIMIT = 5
+
+# Productos que se devuelven como mucho (el más probable primero)
+_PRODUCT_LIMIT = 10
+
+# Palabras con más productos que esto ("leche" en un supermercado) no se
+# cuentan enteras: sólo suman a los candidatos de las palabras más raras, y
+# si no hay, aportan este número de candidatos
+_WORD_CANDIDATES = 1000
+
+# Palabras que no identifican un producto por sí solas
+_STOPWORDS = {'de', 'del', 'el', 'la', 'los', 'las', 'un', 'una', 'con', 'sin', 'para', 'por', 'y', 'en'}
+
+_COMMAND, _NUMBER, _PRODUCT, _PRODUCT_WORD, _CATEGORY = range(5)
+
+logger = logging.getLogger(__name__)
+
+
+class PhraseAutomaton:
+    """
+    Aho-Corasick por palabras: encuentra todas las frases registradas que
+    aparecen en una secuencia de palabras en una sola pasada. Trabajar con
+    palabras completas (y no caracteres) evita que "compra" coincida dentro de
+    "comprar".
+    """
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+    def add(self, phrase, payload):
+        words = phrase.split()
+        if not words:
+            return
+        state = 0
+        for word in words:
+            following = self._goto[state].get(word)
+            if following is None:
+                following = len(self._goto)
+                self._goto[state][word] = following
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = following
+        self._out[state].append((len(words), payload))
+
+    def build(self):
+        """Calcula los enlaces de fallo (llamar después de añadir todas las frases)"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for word, following in self._goto[state].items():
+                queue.append(following)
+                fallback = self._fail[state]
+                while fallback and word not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(word, 0)
+                self._fail[following] = target if target != following else 0
+                self._out[following] = self._out[following] + self._out[self._fail[following]]
+        return self
+
+    def search(self, words):
+        """Genera (inicio, fin, payload) por cada frase encontrada en ``words``"""
+        state = 0
+        for index, word in enumerate(words):
+            while state and word not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(word, 0)
+            for length, payload in self._out[state]:
+                yield index - length + 1, index + 1, payload
+
+
+class IntentEngine:
+    """
+    Traduce transcripciones a intenciones estructuradas.
+
+    El autómata se reconstruye cuando cambia la versión del vocabulario del
+    catálogo (ver ``CatalogVocabulary``): la primera vez al interpretar, y
+    después en un thread mientras se sigue usando el anterior. Entre cambios,
+    interpretar una frase sólo recorre sus palabras.
+    """
+
+    def __init__(self, vocabulary=None):
+        self.vocabulary = vocabulary or get_vocabulary()
+        self._lock = threading.Lock()
+        # (autómata, {palabra: pks ordenados}, palabras conocidas), se cambia entero
+        self._state = None
+        self._version = -1
+        self._building = False
+
+    def _build(self):
+        automaton = PhraseAutomaton()
+        command_words = set()
+        for action, phrases in ACTIONS:
+            for phrase in phrases:
+                phrase = fold(phrase)
+                automaton.add(phrase, (_COMMAND, action))
+                command_words.update(phrase.split())
+        number_words = set()
+        for word, value in NUMBER_WORDS.items():
+            automaton.add(fold(word), (_NUMBER, value))
+            number_words.add(fold(word))
+
+        word_products = defaultdict(list)
+        for pk, name in sorted(self.vocabulary.products().items()):
+            name = fold(name)
+            automaton.add(name, (_PRODUCT, pk))
+            for word in set(name.split()):
+                if len(word) > 2 and word not in _STOPWORDS and word not in command_words \
+                        and word not in number_words:
+                    word_products[word].append(pk)
+        for word in word_products:
+            automaton.add(word, (_PRODUCT_WORD, word))
+        known_words = command_words | number_words
+        for pk, name in self.vocabulary.categories().items():
+            name = fold(name)
+            automaton.add(name, (_CATEGORY, pk))
+            known_words.update(name.split())
+        for name in self.vocabulary.products().values():
+            known_words.update(fold(name).split())
+        word_products = {word: tuple(pks) for word, pks in word_products.items()}
+        return automaton.build(), word_products, frozenset(known_words)
+
+    def _current(self):
+        self.vocabulary.ensure_loaded()
+        version = self.vocabulary.version
+        if self._state is None:
+            with self._lock:
+                if self._state is None:
+                    self._state = self._build()
+                    self._version = version
+        elif self._version != version:
+            self._rebuild_in_background()
+        return self._state
+
+    def _rebuild_in_background(self):
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+
+        def run():
+            try:
+                version = self.vocabulary.version
+                state = self._build()
+                with self._lock:
+                    self._state = state
+                    self._version = version
+            except Exception:
+                logger.exception('No se pudo reconstruir el autómata de intenciones')
+            finally:
+                with self._lock:
+                    self._building = False
+
+        threading.Thread(target=run, name='intent-automaton', daemon=True).start()
+
+    def known_words(self):
+        """Palabras (sin tildes) de los comandos, números y nombres del catálogo"""
+        return self._current()[2]
+
+    def parse(self, text):
+        """
+        Intención de una transcripción (llamar fuera del event loop: puede
+        recargar el catálogo de la base de datos).
+
+        Returns:
+            dict con 'action' y, según la acción, 'quantity', 'products'
+            (ids, el más probable primero; con 'fuzzy': True si salen del
+            índice aproximado), 'categories' (ids) y 'query'; o None si la
+            frase no contiene ningún comando
+        """
+        automaton, word_products, _ = self._current()
+        words = fold(normalize(text)).split()
+        command, arguments = self._command(automaton.search(words))
+        if command is None:
+            return None
+        start, end, action = command
+
+        intent = {'action': action}
+        if action in _QUANTITY_ACTIONS:
+            intent['quantity'] = self._quantity(words, end, arguments)
+        intent['products'] = self._products(arguments, word_products)
+        if not intent['products'] and action in _PRODUCT_ACTIONS:
+            intent['products'] = self._fuzzy_products(words, end, arguments)
+            if intent['products']:
+                intent['fuzzy'] = True
+        intent['categories'] = list(dict.fromkeys(
+            payload[1] for _, _, payload in arguments if payload[0] == _CATEGORY
+        ))
+        if action == 'search':
+            intent['query'] = ' '.join(words[end:])
+        return intent
+
+    def summary(self, text):
+        """
+        Lo que necesita ``rescoring`` de una frase, con una pasada del autómata
+        y sin resolver productos ni consultar el índice aproximado.
+
+        Returns:
+            (contiene un comando, nombra productos del catálogo fuera del comando)
+        """
+        automaton = self._current()[0]
+        command, arguments = self._command(automaton.search(fold(normalize(text)).split()))
+        if command is None:
+            return False, False
+        return True, any(payload[0] in (_PRODUCT, _PRODUCT_WORD) for _, _, payload in arguments)
+
+    @staticmethod
+    def _command(matches):
+        """Comando (inicio, fin, acción) de mayor prioridad y las coincidencias fuera de él"""
+        matches = list(matches)
+        commands = [(start, end, payload[1]) for start, end, payload in matches if payload[0] == _COMMAND]
+        if not commands:
+            return None, []
+        # Entre comandos iguales, la frase más larga
+        start, end, action = min(commands, key=lambda m: (_PRIORITY[m[2]], m[0] - m[1], m[0]))
+        return (start, end, action), [m for m in matches if m[0] >= end or m[1] <= start]
+
+    def _quantity(self, words, after, arguments):
+        """Primera cantidad después del comando: dígitos, palabra o "treinta y cinco" (1 si no hay)"""
+        numbers = {start: payload[1] for start, _, payload in arguments
+                   if payload[0] == _NUMBER and start >= after}
+        for index in range(after, len(words)):
+            if words[index].isdigit():
+                return int(words[index])
+            if index in numbers:
+                value = numbers[index]
+                if 20 <= value < 100 and value % 10 == 0 and index + 2 < len(words) \
+                        and words[index + 1] == 'y' and numbers.get(index + 2, 10) < 10:
+                    value += numbers[index + 2]
+                return value
+        return 1
+
+    def _fuzzy_products(self, words, after, arguments):
+        """Productos del índice aproximado para las palabras tras el comando que no son cantidades"""
+        covered = set()
+        for start, end, payload in arguments:
+            if payload[0] in (_NUMBER, _CATEGORY):
+                covered.update(range(start, end))
+        rest = [
+            word for index, word in enumerate(words[after:], after)
+            if index not in covered and word not in _STOPWORDS and not word.isdigit()
+        ]
+        if not rest:
+            return []
+        return [pk for pk, _ in get_fuzzy_index().search(' '.join(rest), limit=_FUZZY_LIMIT)]
+
+    def _products(self, arguments, word_products):
+        """
+        Ids de producto nombrados (como mucho ``_PRODUCT_LIMIT``): primero
+        nombres completos (los más largos), luego por palabras sueltas
+        """
+        full = sorted(
+            ((end - start, payload[1]) for start, end, payload in arguments if payload[0] == _PRODUCT),
+            key=lambda item: -item[0],
+        )
+        if full:
+            return list(dict.fromkeys(pk for _, pk in full))[:_PRODUCT_LIMIT]
+        # Como el frontend: cualquier palabra del nombre sirve; gana el que
+        # comparte más palabras con la frase. Las palabras raras van primero.
+        words = {payload[1] for _, _, payload in arguments if payload[0] == _PRODUCT_WORD}
+        scores = defaultdict(int)
+        for word in sorted(words, key=lambda word: len(word_products[word])):
+            pks = word_products[word]
+            if len(pks) <= _WORD_CANDIDATES:
+                for pk in pks:
+                    scores[pk] += 1
+            elif scores:
+                for pk in scores:
+                    index = bisect_left(pks, pk)
+                    if index < len(pks) and pks[index] == pk:
+                        scores[pk] += 1
+            else:
+                for pk in pks[:_WORD_CANDIDATES]:
+                    scores[pk] = 1
+        return heapq.nsmallest(_PRODUCT_LIMIT, scores, key=lambda pk: (-scores[pk], pk))
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_intent_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = IntentEngine()
+        return _engine
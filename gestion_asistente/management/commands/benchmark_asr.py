@@ -0,0 +1,211 @@
+import csv
+import itertools
+import json
+import os
+import time
+import wave
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion_asistente import vosk_registry
+from gestion_asistente.benchmarking import percentiles
+from gestion_asistente.intents import get_intent_engine
+from gestion_asistente.protocol import parse_result, unescape
+from gestion_asistente.recognition import RecognitionStream
+from gestion_asistente.recognizer_pool import RecognizerConfig, build_recognizer
+from gestion_asistente.rescoring import rescore
+from gestion_asistente.vocabulary import get_vocabulary, normalize
+from gestion_productos.text import edit_distance, fold
+
+# Cambiar si cambia el significado de algún campo del resultado JSON
+RESULT_VERSION = 1
+
+
+class Command(BaseCommand):
+    help = ('Compara configuraciones del reconocimiento de voz sobre un corpus transcrito: '
+            'WER, acierto de productos, factor de tiempo real y latencia')
+
+    def add_arguments(self, parser):
+        parser.add_argument('corpus',
+                            help='Carpeta con WAVs PCM 16-bit mono y sus transcripciones: transcripciones.tsv '
+                                 '(archivo<TAB>texto) o un .txt junto a cada WAV')
+        parser.add_argument('--modos', default='open,grammar', help="Modos a comparar ('open', 'grammar')")
+        parser.add_argument('--words', default='1,0', help='SetWords activado (1) y/o desactivado (0)')
+        parser.add_argument('--vad', default='1,0', help='Filtro de silencios activado (1) y/o desactivado (0)')
+        parser.add_argument('--chunks', default='4096', help='Muestras por chunk, p. ej. "2048,4096,8192"')
+        parser.add_argument('--alternativas', default='0', help='Hipótesis N-best, p. ej. "0,3"')
+        parser.add_argument('--limite', type=int, default=None, help='Usar sólo las primeras N frases')
+        parser.add_argument('--json', action='store_true', help='Imprimir el resultado como JSON')
+
+    def handle(self, *args, **options):
+        utterances = self._load_corpus(options['corpus'])[:options['limite']]
+        if not utterances:
+            raise CommandError(f'No hay frases transcritas en {options["corpus"]}')
+
+        model = vosk_registry.get_model()
+        engine = get_intent_engine()
+        grammar = get_vocabulary().grammar()
+        for utterance in utterances:
+            # Producto que nombra la transcripción correcta (si nombra alguno)
+            intent = engine.parse(utterance['texto'])
+            utterance['producto'] = intent['products'][0] if intent and intent.get('products') else None
+
+        matrix = itertools.product(
+            self._list(options['modos'], str), self._list(options['words'], self._flag),
+            self._list(options['vad'], self._flag), self._list(options['chunks'], int),
+            self._list(options['alternativas'], int),
+        )
+        results = []
+        for mode, words, vad, chunk, alternatives in matrix:
+            if mode not in ('open', 'grammar'):
+                raise CommandError(f'Modo desconocido: {mode}')
+            config = RecognizerConfig(
+                words=words, grammar=grammar if mode == 'grammar' else None, alternatives=alternatives
+            )
+            row = {'modo': mode, 'words': words, 'vad': vad, 'chunk': chunk, 'alternativas': alternatives}
+            row.update(self._evaluate(model, config, vad, chunk, utterances, engine))
+            results.append(row)
+
+        report = {
+            'version': RESULT_VERSION,
+            # El modelo que se cargó de verdad (VOSK_MODELS y recargas incluidas)
+            'modelo': os.path.basename(vosk_registry.current_path()),
+            'corpus': {
+                'frases': len(utterances),
+                'segundos_audio': round(sum(u['segundos'] for u in utterances), 2),
+                'con_producto': sum(u['producto'] is not None for u in utterances),
+            },
+            'configuraciones': results,
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2, ensure_ascii=False))
+            return
+        self._print(report)
+
+    def _evaluate(self, model, config, vad, chunk, utterances, engine):
+        """Reconoce todo el corpus con una configuración, de una frase en una, en un núcleo"""
+        recognizer = build_recognizer(model, config)
+        errors = reference_words = 0
+        products_ok = 0
+        processing = 0.0
+        chunk_latencies, final_latencies = [], []
+
+        for utterance in utterances:
+            stream = RecognitionStream(
+                recognizer, sample_rate=utterance['frecuencia'],
+                vad=dict(getattr(settings, 'VOSK_VAD', {}), sample_rate=16000) if vad else None,
+            )
+            stream.reset()
+            audio, size = utterance['audio'], chunk * 2
+            texts = []
+            for i in range(0, len(audio), size):
+                started = time.perf_counter()
+                results = stream.accept(audio[i:i + size])
+                elapsed = time.perf_counter() - started
+                chunk_latencies.append(elapsed)
+                processing += elapsed
+                texts.extend(self._text(result, config) for result in results)
+            started = time.perf_counter()
+            result = stream.final()
+            elapsed = time.perf_counter() - started
+            final_latencies.append(elapsed)
+            processing += elapsed
+            texts.append(self._text(result, config))
+
+            hypothesis = ' '.join(text for text in texts if text)
+            reference, recognized = self._words(utterance['texto']), self._words(hypothesis)
+            # Errores de palabra: sustituciones, inserciones y omisiones
+            errors += edit_distance(reference, recognized, len(reference) + len(recognized))
+            reference_words += len(reference)
+            if utterance['producto'] is not None:
+                intent = engine.parse(hypothesis) if hypothesis else None
+                if intent and intent.get('products') and intent['products'][0] == utterance['producto']:
+                    products_ok += 1
+
+        with_product = sum(u['producto'] is not None for u in utterances)
+        audio_seconds = sum(u['segundos'] for u in utterances)
+        return {
+            'wer': round(errors / reference_words, 4) if reference_words else None,
+            'acierto_productos': round(products_ok / with_product, 4) if with_product else None,
+            'rtf': round(processing / audio_seconds, 4),
+            'latencia_chunk_ms': percentiles(chunk_latencies),
+            'latencia_final_ms': percentiles(final_latencies),
+        }
+
+    def _text(self, result, config):
+        """Texto de una frase completa de Vosk ('' si es un parcial o no hay resultado)"""
+        if not result:
+            return ''
+        if config.alternatives:
+            best = rescore(result)
+            return best['transcript'] if best else ''
+        field, raw = parse_result(result)
+        return unescape(raw) if field == 'text' and raw else ''
+
+    def _words(self, text):
+        return fold(normalize(text)).split()
+
+    def _list(self, value, cast):
+        try:
+            return [cast(item.strip()) for item in value.split(',') if item.strip()]
+        except ValueError:
+            raise CommandError(f'Lista no válida: {value}')
+
+    def _flag(self, value):
+        if value not in ('0', '1'):
+            raise ValueError(value)
+        return value == '1'
+
+    def _load_corpus(self, path):
+        if not os.path.isdir(path):
+            raise CommandError(f'No existe la carpeta {path}')
+        transcripts = {}
+        tsv = os.path.join(path, 'transcripciones.tsv')
+        if os.path.exists(tsv):
+            with open(tsv, encoding='utf-8', newline='') as f:
+                for row in csv.reader(f, delimiter='\t'):
+                    if len(row) >= 2 and not row[0].startswith('#'):
+                        transcripts[row[0].strip()] = row[1].strip()
+        else:
+            for name in os.listdir(path):
+                if name.lower().endswith('.wav'):
+                    sidecar = os.path.join(path, os.path.splitext(name)[0] + '.txt')
+                    if os.path.exists(sidecar):
+                        with open(sidecar, encoding='utf-8') as f:
+                            transcripts[name] = f.read().strip()
+
+        utterances = []
+        for name in sorted(transcripts):
+            try:
+                with wave.open(os.path.join(path, name), 'rb') as wav:
+                    if wav.getnchannels() != 1 or wav.getsampwidth() != 2:
+                        raise CommandError(f'{name}: el WAV debe ser PCM 16-bit mono')
+                    rate = wav.getframerate()
+                    audio = wav.readframes(wav.getnframes())
+            except (OSError, wave.Error) as e:
+                raise CommandError(f'No se pudo leer {name}: {e}')
+            utterances.append({
+                'archivo': name, 'texto': transcripts[name], 'frecuencia': rate,
+                'audio': audio, 'segundos': len(audio) / 2 / rate,
+            })
+        return utterances
+
+    def _print(self, report):
+        corpus = report['corpus']
+        self.stdout.write(
+            f'Corpus: {corpus["frases"]} frases, {corpus["segundos_audio"]} s de audio, '
+            f'{corpus["con_producto"]} nombran un producto; modelo {report["modelo"]}'
+        )
+        self.stdout.write(
+            f'{"modo":<8} {"words":>5} {"vad":>4} {"chunk":>6} {"alt":>4} {"WER":>7} {"productos":>10} '
+            f'{"RTF":>7} {"final p95 ms":>13}'
+        )
+        for row in report['configuraciones']:
+            products = '-' if row['acierto_productos'] is None else f'{row["acierto_productos"]:.2%}'
+            wer = '-' if row['wer'] is None else f'{row["wer"]:.2%}'
+            self.stdout.write(
+                f'{row["modo"]:<8} {int(row["words"]):>5} {int(row["vad"]):>4} {row["chunk"]:>6} '
+                f'{row["alternativas"]:>4} {wer:>7} {products:>10} {row["rtf"]:>7.4f} '
+                f'{row["latencia_final_ms"].get("p95", "-"):>13}'
+            )
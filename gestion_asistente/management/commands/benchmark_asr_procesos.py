@@ -0,0 +1,105 @@
+import asyncio
+import json
+import os
+import random
+import time
+import wave
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion_asistente.asr_workers import ASRProcessPool
+
+SAMPLE_RATE = 16000
+
+
+class Command(BaseCommand):
+    help = 'Mide cómo escala el reconocimiento de voz con el número de procesos worker de ASR'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wav', help='Archivo WAV PCM 16-bit mono 16kHz (por defecto, ruido sintético)')
+        parser.add_argument('--sesiones', type=int, default=16, help='Sesiones simultáneas')
+        parser.add_argument('--procesos', default=None,
+                            help='Números de workers a probar, p. ej. "1,2,4" (por defecto, potencias de 2 hasta los núcleos)')
+        parser.add_argument('--segundos', type=float, default=10.0, help='Duración del audio sintético por sesión')
+        parser.add_argument('--chunk', type=int, default=8192, help='Bytes por chunk (8192 = 4096 muestras, como el frontend)')
+        parser.add_argument('--json', action='store_true', help='Imprimir el resultado como JSON')
+
+    def handle(self, *args, **options):
+        audio = self._load_audio(options['wav'], options['segundos'])
+        audio_seconds = len(audio) / 2 / SAMPLE_RATE
+        chunk = options['chunk'] - options['chunk'] % 2
+        chunks = [audio[i:i + chunk] for i in range(0, len(audio), chunk)]
+
+        results = []
+        for processes in self._process_counts(options['procesos']):
+            pool = ASRProcessPool(processes=processes, slots=max(options['sesiones'], 1))
+            try:
+                wall = asyncio.run(self._run(pool, chunks, options['sesiones']))
+            finally:
+                pool.shutdown()
+            total_audio = audio_seconds * options['sesiones']
+            results.append({
+                'procesos': processes,
+                'sesiones': options['sesiones'],
+                'segundos_audio': round(total_audio, 2),
+                'segundos_reloj': round(wall, 3),
+                'x_tiempo_real': round(total_audio / wall, 2),
+            })
+
+        base = results[0]['x_tiempo_real'] / results[0]['procesos']
+        for row in results:
+            row['eficiencia'] = round(row['x_tiempo_real'] / (base * row['procesos']), 2)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(f'Audio por sesión: {audio_seconds:.1f} s, chunks de {chunk} bytes')
+        self.stdout.write(f'{"procesos":>9} {"x tiempo real":>14} {"eficiencia":>11}')
+        for row in results:
+            self.stdout.write(f'{row["procesos"]:>9} {row["x_tiempo_real"]:>14.2f} {row["eficiencia"]:>11.2f}')
+
+    async def _run(self, pool, chunks, sessions):
+        """Alimenta todas las sesiones a la vez lo más rápido posible; devuelve el tiempo total"""
+        opened = [await pool.open_session() for _ in range(sessions)]
+
+        async def feed(session):
+            for data in chunks:
+                await session.accept(data)
+            await session.final()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(feed(session) for session in opened))
+        wall = time.perf_counter() - started
+        for session in opened:
+            await session.close()
+        return wall
+
+    def _process_counts(self, value):
+        if value:
+            try:
+                return [int(n) for n in value.split(',') if n.strip()]
+            except ValueError:
+                raise CommandError('--procesos debe ser una lista de enteros separada por comas')
+        cores = os.cpu_count() or 1
+        counts, n = [], 1
+        while n < cores:
+            counts.append(n)
+            n *= 2
+        return counts + [cores]
+
+    def _load_audio(self, path, seconds):
+        if not path:
+            # Ruido de baja amplitud: el decodificador trabaja igual que con voz
+            rng = random.Random(0)
+            samples = int(seconds * SAMPLE_RATE)
+            return b''.join(
+                rng.randint(-800, 800).to_bytes(2, 'little', signed=True) for _ in range(samples)
+            )
+        try:
+            with wave.open(path, 'rb') as wav:
+                if wav.getnchannels() != 1 or wav.getsampwidth() != 2 or wav.getframerate() != SAMPLE_RATE:
+                    raise CommandError('El WAV debe ser PCM 16-bit mono a 16kHz')
+                return wav.readframes(wav.getnframes())
+        except (OSError, wave.Error) as e:
+            raise CommandError(f'No se pudo leer {path}: {e}')
@@ -0,0 +1,62 @@
+import json
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from gestion_asistente.audio import Resampler, VoiceActivityDetector, decode_mulaw
+from gestion_asistente.benchmarking import synthetic_voice
+
+
+class Command(BaseCommand):
+    help = 'Mide cuántas veces el tiempo real procesa un núcleo en cada etapa del audio de voz'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--segundos', type=float, default=30.0, help='Duración del audio sintético')
+        parser.add_argument('--frecuencias', default='44100,48000',
+                            help='Frecuencias de captura a remuestrear, separadas por comas')
+        parser.add_argument('--chunk', type=int, default=4096, help='Muestras por chunk (4096, como el frontend)')
+        parser.add_argument('--json', action='store_true', help='Imprimir el resultado como JSON')
+
+    def handle(self, *args, **options):
+        seconds = options['segundos']
+        chunk = options['chunk']
+        results = []
+
+        for rate in [int(r) for r in options['frecuencias'].split(',') if r.strip()]:
+            chunks = self._chunks(synthetic_voice(rate, seconds), chunk)
+            resampler = Resampler(rate)
+            results.append(self._measure(f'remuestreo {rate} -> 16000', seconds, chunks, resampler.process))
+
+        chunks = self._chunks(synthetic_voice(16000, seconds), chunk)
+        vad = VoiceActivityDetector()
+        results.append(self._measure('vad 16000', seconds, chunks, vad.process))
+
+        # 1 byte por muestra; el contenido no cambia el coste de la tabla
+        mulaw = [bytes(np.frombuffer(data, dtype=np.uint8)[::2]) for data in chunks]
+        results.append(self._measure('mulaw 16000', seconds, mulaw, decode_mulaw))
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(f'Audio: {seconds:.1f} s en chunks de {chunk} muestras, un núcleo')
+        self.stdout.write(f'{"etapa":<28} {"x tiempo real":>14}')
+        for row in results:
+            self.stdout.write(f'{row["etapa"]:<28} {row["x_tiempo_real"]:>14.1f}')
+
+    def _measure(self, name, seconds, chunks, fn):
+        fn(chunks[0])  # calentar cachés y tablas
+        started = time.perf_counter()
+        for data in chunks:
+            fn(data)
+        wall = time.perf_counter() - started
+        return {
+            'etapa': name,
+            'segundos_reloj': round(wall, 4),
+            'x_tiempo_real': round(seconds / wall, 1),
+        }
+
+    def _chunks(self, audio, chunk):
+        size = chunk * 2
+        return [audio[i:i + size] for i in range(0, len(audio), size)]
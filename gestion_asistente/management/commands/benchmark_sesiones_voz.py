@@ -0,0 +1,279 @@
+import asyncio
+import json
+import os
+import resource
+import time
+import wave
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion_asistente.benchmarking import percentiles, synthetic_voice
+from gestion_asistente.vosk_registry import rss_bytes
+
+
+class Command(BaseCommand):
+    help = ('Reproduce sesiones de voz contra la aplicación ASGI con muchos clientes simultáneos '
+            'y mide latencias, factor de tiempo real, CPU y memoria')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--audios', default=None,
+                            help='Archivo WAV o carpeta con WAVs PCM 16-bit mono, a cualquier frecuencia '
+                                 '(por defecto, las grabaciones de VOSK_RECORD_DIR o audio sintético)')
+        parser.add_argument('--clientes', type=int, default=10, help='Clientes simultáneos')
+        parser.add_argument('--frases', type=int, default=1, help='Frases (start/stop) por cliente')
+        parser.add_argument('--rampa', type=float, default=1.0,
+                            help='Segundos en los que se reparten las conexiones')
+        parser.add_argument('--chunk', type=int, default=4096, help='Muestras por chunk (4096, como el frontend)')
+        parser.add_argument('--sin-pausa', action='store_true',
+                            help='Enviar el audio lo más rápido posible en lugar de a tiempo real')
+        parser.add_argument('--modo', default=None, help="Modo de reconocimiento ('open' o 'grammar')")
+        parser.add_argument('--segundos', type=float, default=5.0, help='Duración del audio sintético')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Segundos máximos de espera por mensaje')
+        parser.add_argument('--json', action='store_true', help='Imprimir el resultado como JSON')
+
+    def handle(self, *args, **options):
+        clips = self._load_clips(options['audios'], options['segundos'])
+        if options['clientes'] < 1 or options['frases'] < 1:
+            raise CommandError('--clientes y --frases deben ser al menos 1')
+
+        rss_before = rss_bytes()
+        loading = time.perf_counter()
+        # Igual que al arrancar daphne: precarga del modelo y del pool
+        from vocalcart.asgi import application
+        startup = time.perf_counter() - loading
+
+        report = asyncio.run(self._run(application, clips, options))
+        if not report['segundos_audio']:
+            # Ninguna frase se completó (p. ej. el modelo no cargó): un
+            # informe de ceros no sirve como medida
+            raise CommandError(
+                f'Ninguna sesión llegó a reconocer audio. Errores: {report["errores"]}; '
+                f'último mensaje: {report["ultimo_error"]}'
+            )
+        report.update({
+            'clientes': options['clientes'],
+            'frases_por_cliente': options['frases'],
+            'tiempo_real': not options['sin_pausa'],
+            'audios': len(clips),
+            'arranque_s': round(startup, 3),
+            'rss_inicial_mb': round(rss_before / 2 ** 20, 1),
+        })
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self._print(report)
+
+    async def _run(self, application, clips, options):
+        sessions = [Session() for _ in range(options['clientes'])]
+        rss_peak = [rss_bytes()]
+        sampling = asyncio.ensure_future(self._sample_rss(rss_peak))
+
+        cpu_before = self._cpu_seconds()
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            self._client(application, session, clips[i % len(clips)], i, options)
+            for i, session in enumerate(sessions)
+        ))
+        wall = time.perf_counter() - started
+        cpu = self._cpu_seconds() - cpu_before
+        sampling.cancel()
+
+        audio = sum(session.audio_seconds for session in sessions)
+        errors = Counter()
+        last_error = None
+        for session in sessions:
+            errors.update(session.errors)
+            last_error = session.last_error or last_error
+        return {
+            'segundos_reloj': round(wall, 3),
+            'segundos_audio': round(audio, 2),
+            'x_tiempo_real': round(audio / wall, 2) if wall else None,
+            # Segundos de CPU del proceso por segundo de audio (con VOSK_ASR_MODE
+            # 'process' no incluye los workers de ASR)
+            'rtf_cpu': round(cpu / audio, 3) if audio else None,
+            'cpu_s': round(cpu, 3),
+            'rss_pico_mb': round(rss_peak[0] / 2 ** 20, 1),
+            'listo_ms': percentiles([s.ready for s in sessions if s.ready is not None]),
+            'parcial_ms': percentiles([v for s in sessions for v in s.partials]),
+            'resultado_ms': percentiles([v for s in sessions for v in s.results]),
+            'final_ms': percentiles([v for s in sessions for v in s.finals]),
+            # Duración de cada frase respecto a su audio (1.0 = sin retraso)
+            'rtf_sesion': percentiles([v for s in sessions for v in s.rtf], scale=1),
+            'errores': dict(errors),
+            'ultimo_error': last_error,
+        }
+
+    async def _client(self, application, session, clip, index, options):
+        from channels.testing import WebsocketCommunicator
+
+        await asyncio.sleep(options['rampa'] * index / options['clientes'])
+        communicator = WebsocketCommunicator(application, '/ws/voice/')
+        timeout = options['timeout']
+        connecting = time.perf_counter()
+        try:
+            connected, _ = await communicator.connect(timeout)
+            if not connected:
+                session.errors['conexion'] += 1
+                return
+            # Puede llegar 'busy' mientras se espera plaza
+            while True:
+                message = await self._receive(communicator, timeout)
+                if message['type'] == 'ready':
+                    session.ready = time.perf_counter() - connecting
+                    break
+                session.errors[message['type']] += 1
+                session.last_error = message.get('message')
+                if message['type'] != 'busy' or message.get('position') is None:
+                    return
+
+            for _ in range(options['frases']):
+                if not await self._utterance(communicator, session, clip, options):
+                    return
+        except asyncio.TimeoutError:
+            session.errors['timeout'] += 1
+        finally:
+            await communicator.disconnect()
+
+    async def _utterance(self, communicator, session, clip, options):
+        """Envía una frase; False si el servidor no la empezó"""
+        rate, audio = clip
+        start = {'type': 'start', 'sample_rate': rate}
+        if options['modo']:
+            start['mode'] = options['modo']
+        await communicator.send_to(text_data=json.dumps(start))
+        while True:
+            message = await self._receive(communicator, options['timeout'])
+            if message['type'] == 'started':
+                break
+            if message['type'] == 'error':
+                # No se pudo empezar (modelo que no carga, opciones no válidas...)
+                session.errors['error'] += 1
+                session.last_error = message.get('message')
+                return False
+
+        size = options['chunk'] * 2
+        chunks = [audio[i:i + size] for i in range(0, len(audio), size)]
+        chunk_seconds = options['chunk'] / rate
+        clock = {'sent': time.perf_counter(), 'stop': None}
+        receiving = asyncio.ensure_future(self._collect(communicator, session, clock, options['timeout']))
+
+        first = time.perf_counter()
+        for i, data in enumerate(chunks):
+            await communicator.send_to(bytes_data=data)
+            clock['sent'] = time.perf_counter()
+            if not options['sin_pausa']:
+                # Ritmo del micrófono: el chunk i+1 se captura (i+1) chunks después
+                await asyncio.sleep(max(first + (i + 1) * chunk_seconds - time.perf_counter(), 0))
+            elif i % 8 == 7:
+                await asyncio.sleep(0)
+        clock['stop'] = time.perf_counter()
+        await communicator.send_to(text_data=json.dumps({'type': 'stop'}))
+        await receiving
+
+        duration = len(audio) / 2 / rate
+        session.audio_seconds += duration
+        session.rtf.append((time.perf_counter() - first) / duration)
+        return True
+
+    async def _collect(self, communicator, session, clock, timeout):
+        """
+        Mensajes de una frase hasta 'stopped'. Los parciales y resultados se
+        miden desde el último chunk enviado; la frase final desde el 'stop'.
+        """
+        final = False
+        while True:
+            message = await self._receive(communicator, timeout)
+            latency = time.perf_counter() - clock['sent']
+            kind = message['type']
+            if kind == 'partial':
+                session.partials.append(latency)
+            elif kind == 'result':
+                session.results.append(latency)
+            elif kind in ('final', 'stopped'):
+                if not final and clock['stop'] is not None:
+                    # Sin texto final, la frase termina con 'stopped'
+                    session.finals.append(time.perf_counter() - clock['stop'])
+                final = True
+                if kind == 'stopped':
+                    return
+            elif kind in ('error', 'overloaded'):
+                session.errors[kind] += 1
+                session.last_error = message.get('message')
+
+    async def _receive(self, communicator, timeout):
+        return json.loads(await communicator.receive_from(timeout))
+
+    async def _sample_rss(self, peak):
+        while True:
+            peak[0] = max(peak[0], rss_bytes())
+            await asyncio.sleep(0.25)
+
+    def _cpu_seconds(self):
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_utime + usage.ru_stime
+
+    def _load_clips(self, path, seconds):
+        """Lista de (frecuencia, PCM 16-bit) a reproducir"""
+        if path is None:
+            path = getattr(settings, 'VOSK_RECORD_DIR', None)
+            if not path or not os.path.isdir(path):
+                return [(16000, synthetic_voice(16000, seconds))]
+        elif not os.path.exists(path):
+            raise CommandError(f'No existe {path}')
+
+        if os.path.isdir(path):
+            files = sorted(os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith('.wav'))
+        else:
+            files = [path]
+        if not files:
+            return [(16000, synthetic_voice(16000, seconds))]
+
+        clips = []
+        for name in files:
+            try:
+                with wave.open(name, 'rb') as wav:
+                    if wav.getnchannels() != 1 or wav.getsampwidth() != 2:
+                        raise CommandError(f'{name}: el WAV debe ser PCM 16-bit mono')
+                    clips.append((wav.getframerate(), wav.readframes(wav.getnframes())))
+            except (OSError, wave.Error) as e:
+                raise CommandError(f'No se pudo leer {name}: {e}')
+        return clips
+
+    def _print(self, report):
+        mode = 'a tiempo real' if report['tiempo_real'] else 'sin pausa'
+        self.stdout.write(
+            f'{report["clientes"]} clientes x {report["frases_por_cliente"]} frases, {report["audios"]} audios, {mode}'
+        )
+        self.stdout.write(
+            f'Audio {report["segundos_audio"]} s en {report["segundos_reloj"]} s '
+            f'({report["x_tiempo_real"]} x tiempo real), CPU {report["cpu_s"]} s (RTF {report["rtf_cpu"]})'
+        )
+        self.stdout.write(
+            f'Memoria: {report["rss_inicial_mb"]} MB al empezar, pico {report["rss_pico_mb"]} MB; '
+            f'arranque {report["arranque_s"]} s'
+        )
+        self.stdout.write(f'{"medida":<14} {"n":>6} {"p50":>9} {"p90":>9} {"p95":>9} {"p99":>9} {"max":>9}')
+        for key, label in (('listo_ms', 'listo ms'), ('parcial_ms', 'parcial ms'), ('resultado_ms', 'resultado ms'),
+                           ('final_ms', 'final ms'), ('rtf_sesion', 'rtf sesión')):
+            row = report[key]
+            values = ''.join(f' {row.get(k, "-"):>9}' for k in ('p50', 'p90', 'p95', 'p99', 'max'))
+            self.stdout.write(f'{label:<14} {row["n"]:>6}{values}')
+        if report['errores']:
+            self.stdout.write(f'Errores: {report["errores"]}')
+
+
+class Session:
+    """Medidas de un cliente simulado"""
+
+    def __init__(self):
+        self.ready = None
+        self.partials = []
+        self.results = []
+        self.finals = []
+        self.rtf = []
+        self.audio_seconds = 0.0
+        self.errors = Counter()
+        self.last_error = None
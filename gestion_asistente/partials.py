@@ -0,0 +1,85 @@
+"""
+Envío de resultados parciales al cliente.
+
+Vosk produce un parcial por chunk de audio (unas 4 veces por segundo con el
+frontend, más si la cola une chunks atrasados) y cada uno acaba en un mensaje
+WebSocket y un re-render en ``useVoiceAssistantVosk.js``. ``PartialCoalescer``
+sólo envía un parcial si el texto cambió, y como mucho uno cada
+``min_interval`` segundos: si llegan varios seguidos, el último se envía al
+cumplirse el intervalo y los intermedios se descartan.
+"""
+import asyncio
+
+
+class PartialCoalescer:
+    """Parciales de una sesión: sin repeticiones y con un intervalo mínimo"""
+
+    def __init__(self, send, min_interval=0.15):
+        """
+        Args:
+            send: corrutina que envía un texto parcial al cliente
+            min_interval: segundos mínimos entre dos parciales enviados (0 = sin límite)
+        """
+        self._send = send
+        self.min_interval = min_interval
+        self._sent = None
+        self._sent_at = None
+        self._pending = None
+        self._flush = None
+        self.sent = 0
+        self.coalesced = 0
+
+    async def push(self, text):
+        """Nuevo parcial de Vosk: se envía ya, más tarde o nunca"""
+        if text == self._sent:
+            # Volvió al texto ya enviado: el pendiente (si lo hay) sobra
+            self.coalesced += 1
+            self._drop_pending()
+            return
+
+        loop = asyncio.get_running_loop()
+        wait = 0.0
+        if self._sent_at is not None:
+            wait = self._sent_at + self.min_interval - loop.time()
+        if wait <= 0 and self._flush is None:
+            await self._emit(text)
+            return
+
+        if self._pending is not None:
+            self.coalesced += 1
+        self._pending = text
+        if self._flush is None:
+            self._flush = asyncio.ensure_future(self._flush_later(max(wait, 0.0)))
+
+    def clear(self):
+        """
+        Llegó un resultado completo: reemplaza a cualquier parcial pendiente
+        (se envía siempre, sin esperar al intervalo) y la siguiente frase
+        empieza de cero.
+        """
+        self._drop_pending()
+        self._sent = None
+
+    def _drop_pending(self):
+        if self._pending is not None:
+            self.coalesced += 1
+            self._pending = None
+        if self._flush is not None:
+            self._flush.cancel()
+            self._flush = None
+
+    async def _flush_later(self, wait):
+        await asyncio.sleep(wait)
+        self._flush = None
+        text, self._pending = self._pending, None
+        if text is not None:
+            await self._emit(text)
+
+    async def _emit(self, text):
+        self._sent = text
+        self._sent_at = asyncio.get_running_loop().time()
+        self.sent += 1
+        await self._send(text)
+
+    def stats(self):
+        return {'sent': self.sent, 'coalesced': self.coalesced}
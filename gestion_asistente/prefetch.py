@@ -0,0 +1,180 @@
+"""
+Prefetch especulativo a partir de los resultados parciales.
+
+Los parciales llegan cientos de milisegundos antes que la frase completa. En
+cuanto el principio de la frase deja de cambiar entre dos parciales ("agregar
+dos le..." -> "agregar dos leche..."), ``SpeculativePrefetch`` interpreta ese
+prefijo estable y, si predice productos, envía al cliente un mensaje
+'prefetch' con sus datos: cuando llega la frase completa la respuesta ya está
+en el cliente. Los datos de producto quedan además en la caché de Django para
+las consultas siguientes.
+
+Especular es barato: una pasada del autómata de intenciones y, como mucho, una
+consulta a la base de datos. Aun así cada sesión tiene como mucho una
+especulación en marcha: los parciales se agrupan durante ``debounce``
+segundos, si el prefijo sigue creciendo mientras se interpreta se descarta
+el resultado y se interpreta el último, y al terminar la frase se descarta la
+que esté en curso. Cancelar la tarea no pararía el thread que interpreta, así
+que no se cancela: se ignora su resultado. Al llegar la intención final se
+cuenta si la predicción acertó.
+"""
+import asyncio
+
+from channels.db import database_sync_to_async
+from django.core.cache import cache
+
+from .intents import get_intent_engine
+
+# Acciones que se benefician de tener los datos del producto por adelantado
+_PREFETCH_ACTIONS = {'add', 'remove', 'product_info', 'search'}
+_MAX_PRODUCTS = 5
+
+_DETAIL_KEY = 'asistente:producto:{}'
+_DETAIL_TIMEOUT = 300
+
+
+def product_details(pks):
+    """Datos que el cliente necesita para responder sobre cada producto (cacheados)"""
+    from gestion_productos.models import producto
+
+    keys = {pk: _DETAIL_KEY.format(pk) for pk in pks}
+    cached = cache.get_many(list(keys.values()))
+    missing = [pk for pk in pks if keys[pk] not in cached]
+    if missing:
+        fresh = {}
+        for prod in producto.objects.filter(pk__in=missing, estado=True).select_related('categoria'):
+            fresh[keys[prod.pk]] = {
+                'id': prod.pk,
+                'nombre': prod.nombre,
+                'precio': str(prod.precio),
+                'stock': prod.stock,
+                'categoria': prod.categoria.nombre,
+                'imagen': prod.imagen,
+            }
+        cache.set_many(fresh, _DETAIL_TIMEOUT)
+        cached.update(fresh)
+    return [cached[keys[pk]] for pk in pks if keys[pk] in cached]
+
+
+def forget_product(pk):
+    """Invalida los datos cacheados de un producto (ver ``signals.py``)"""
+    cache.delete(_DETAIL_KEY.format(pk))
+
+
+def predict(prefix):
+    """
+    Predicción para un prefijo estable (llamar fuera del event loop).
+
+    Returns:
+        dict con 'action', 'products' (datos de producto) y 'query' si es
+        una búsqueda; o None si el prefijo no anticipa ningún producto
+    """
+    intent = get_intent_engine().parse(prefix)
+    if not intent or intent['action'] not in _PREFETCH_ACTIONS or not intent['products']:
+        return None
+    prediction = {
+        'action': intent['action'],
+        'products': product_details(intent['products'][:_MAX_PRODUCTS]),
+    }
+    if 'query' in intent:
+        prediction['query'] = intent['query']
+    return prediction
+
+
+class SpeculativePrefetch:
+    """Especulación sobre los parciales de una sesión, con sus aciertos"""
+
+    def __init__(self, send, min_words=2, debounce=0.05):
+        """
+        Args:
+            send: corrutina que envía una predicción al cliente
+            min_words: palabras estables necesarias para especular
+            debounce: segundos que se espera a más parciales antes de especular
+        """
+        self._send = send
+        self.min_words = min_words
+        self.debounce = debounce
+        self._previous = []
+        self._stable = []
+        self._task = None
+        self._pending = None     # último prefijo estable aún sin interpretar
+        self._generation = 0     # cambia con cada frase: invalida lo que esté en curso
+        self._predicted = None
+        self._sent_key = None
+        self.hints = 0
+        self.hits = 0
+        self.misses = 0
+        self.cancelled = 0
+
+    def observe(self, text):
+        """Nuevo parcial: especula si su prefijo estable creció"""
+        words = text.split()
+        stable = []
+        for previous, current in zip(self._previous, words):
+            if previous != current:
+                break
+            stable.append(current)
+        self._previous = words
+        if len(stable) < self.min_words or stable == self._stable:
+            return
+        self._stable = stable
+        self._pending = ' '.join(stable)
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        """Interpreta el último prefijo pendiente hasta que no quede ninguno"""
+        try:
+            while True:
+                await asyncio.sleep(self.debounce)
+                if self._pending is None:
+                    return
+                prefix, self._pending = self._pending, None
+                generation = self._generation
+                prediction = await database_sync_to_async(predict)(prefix)
+                if generation != self._generation or self._pending is not None:
+                    # Terminó la frase o el prefijo siguió creciendo
+                    self.cancelled += 1
+                elif prediction:
+                    await self._deliver(prediction)
+        finally:
+            self._task = None
+
+    async def _deliver(self, prediction):
+        ids = [product['id'] for product in prediction['products']]
+        key = (prediction['action'], tuple(ids))
+        if key == self._sent_key:
+            return
+        self._sent_key = key
+        self._predicted = set(ids)
+        self.hints += 1
+        await self._send(prediction)
+
+    def resolve(self, intent):
+        """
+        Llegó la frase completa: cuenta si se había predicho su producto y
+        prepara la siguiente frase.
+        """
+        if self._predicted is not None:
+            products = (intent or {}).get('products') or []
+            if products and products[0] in self._predicted:
+                self.hits += 1
+            else:
+                self.misses += 1
+        self.reset()
+
+    def reset(self):
+        self._generation += 1
+        self._pending = None
+        self._previous = []
+        self._stable = []
+        self._predicted = None
+        self._sent_key = None
+
+    def stats(self):
+        return {
+            'hints': self.hints,
+            'hits': self.hits,
+            'misses': self.misses,
+            'cancelled': self.cancelled,
+        }
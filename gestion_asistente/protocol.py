@@ -0,0 +1,88 @@
+"""
+Formato de los mensajes del WebSocket de voz.
+
+Por defecto los mensajes del servidor son JSON en frames de texto. El cliente
+puede negociar MessagePack (frames binarios, más pequeños y baratos de
+codificar) con el subprotocolo ``vocalcart.msgpack`` al conectar, o con
+``'protocol': 'msgpack'`` en el mensaje 'start'. Los mensajes de control del
+cliente siguen siendo JSON en frames de texto: los frames binarios que envía
+el cliente son siempre audio.
+
+Los resultados de Vosk ya llegan como JSON. En lugar de decodificarlos
+completos (``json.loads``) para volver a codificarlos, ``parse_result`` extrae
+el texto tal cual está escrito en el JSON, y ``MessageEncoder`` lo copia
+directamente al mensaje JSON de salida; sólo se decodifica si hace falta
+(MessagePack, o secuencias de escape en el texto).
+"""
+import json
+import re
+
+import msgpack
+
+PROTOCOL_JSON = 'json'
+PROTOCOL_MSGPACK = 'msgpack'
+PROTOCOLS = (PROTOCOL_JSON, PROTOCOL_MSGPACK)
+
+# Subprotocolo WebSocket para pedir MessagePack desde la conexión
+SUBPROTOCOL_MSGPACK = 'vocalcart.msgpack'
+
+# "partial" o "text" seguido de su valor; "partial_result" y las palabras
+# ("word") de SetWords no coinciden
+_RESULT_FIELD = re.compile(r'"(partial|text)"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+def parse_result(result):
+    """
+    Campo y texto de un resultado de Vosk sin decodificar todo el JSON.
+
+    Returns:
+        (campo, texto) con campo 'partial' o 'text' y el texto todavía
+        escapado como en el JSON (ver ``unescape``), o (None, '') si no hay
+    """
+    match = _RESULT_FIELD.search(result)
+    if match is None:
+        return None, ''
+    return match.group(1), match.group(2)
+
+
+def unescape(raw):
+    """Texto de ``parse_result`` decodificado (sólo tiene coste si lleva escapes)"""
+    if '\\' not in raw:
+        return raw
+    return json.loads(f'"{raw}"')
+
+
+class MessageEncoder:
+    """Codifica los mensajes de una sesión en el protocolo negociado"""
+
+    def __init__(self, protocol=PROTOCOL_JSON):
+        if protocol not in PROTOCOLS:
+            raise ValueError(f'Protocolo no soportado: {protocol}')
+        self.protocol = protocol
+        self._prefixes = {}
+
+    def encode(self, message):
+        """Argumentos para ``AsyncWebsocketConsumer.send`` con ``message`` codificado"""
+        if self.protocol == PROTOCOL_MSGPACK:
+            return {'bytes_data': msgpack.packb(message, use_bin_type=True)}
+        return {'text_data': json.dumps(message)}
+
+    def encode_transcript(self, msg_type, raw):
+        """
+        Mensaje ``{'type': msg_type, 'transcript': texto}`` a partir del texto
+        escapado de ``parse_result``. Es el mensaje más frecuente (parciales),
+        así que su prefijo se codifica una vez por tipo.
+        """
+        prefix = self._prefixes.get(msg_type)
+        if self.protocol == PROTOCOL_MSGPACK:
+            if prefix is None:
+                # Mapa de 2 entradas + 'type' + valor + clave 'transcript'
+                prefix = self._prefixes[msg_type] = (
+                    b'\x82' + msgpack.packb('type') + msgpack.packb(msg_type)
+                    + msgpack.packb('transcript')
+                )
+            return {'bytes_data': prefix + msgpack.packb(unescape(raw))}
+        if prefix is None:
+            prefix = self._prefixes[msg_type] = '{"type": %s, "transcript": "' % json.dumps(msg_type)
+        # El texto ya viene escapado como cadena JSON
+        return {'text_data': prefix + raw + '"}'}
@@ -0,0 +1,106 @@
+"""
+Reconocimiento de una sesión de voz.
+
+``RecognitionStream`` recibe los chunks de audio de una sesión y devuelve los
+resultados de Vosk. Lo usan tanto el consumer (modo thread) como los procesos
+de ASR (modo process), para que ambos caminos hagan exactamente lo mismo.
+Sus métodos son bloqueantes: se llaman desde el executor de ASR o desde un
+proceso worker, nunca desde el event loop.
+
+Las opciones de la sesión (``codec``, ``sample_rate``, ``vad``...) son diccionarios simples para que
+puedan viajar a un proceso worker sin depender de los settings de Django.
+"""
+from .audio import DECODERS, Resampler, VoiceActivityDetector
+
+
+class RecognitionStream:
+    """Audio de una sesión hacia un ``KaldiRecognizer``"""
+
+    def __init__(self, recognizer, codec=None, sample_rate=16000, vad=None):
+        """
+        Args:
+            recognizer: KaldiRecognizer de la sesión (a 16kHz)
+            codec: códec del audio que envía el cliente (None o 'pcm16' = PCM sin comprimir)
+            sample_rate: frecuencia de captura del cliente; se remuestrea a 16kHz
+            vad: parámetros de ``VoiceActivityDetector``, o None para no filtrar silencios
+        """
+        self.recognizer = recognizer
+        self.decode = DECODERS.get(codec)
+        self.resampler = Resampler(sample_rate) if sample_rate != 16000 else None
+        self.vad = VoiceActivityDetector(**vad) if vad is not None else None
+        # Último parcial devuelto: Vosk repite el mismo parcial en cada chunk
+        # mientras no cambia el texto, y no hace falta enviarlo otra vez
+        self._last_partial = None
+        self.partials_repeated = 0
+
+    def accept(self, *chunks):
+        """
+        Procesa uno o varios chunks de audio (varios si la cola los unió).
+
+        Args:
+            chunks: bytes de audio mono en el códec y la frecuencia de la
+                sesión, tal como los envió el cliente
+
+        Returns:
+            lista de JSON strings de Vosk (parciales o frases completas), en
+            orden; vacía si el audio era silencio o el parcial no cambió. Tiene
+            más de uno si en el audio terminó una frase
+        """
+        if self.decode is not None:
+            chunks = [self.decode(chunk) for chunk in chunks]
+        audio_data = chunks[0] if len(chunks) == 1 else b''.join(chunks)
+        if self.resampler is not None:
+            audio_data = self.resampler.process(audio_data)
+
+        ends = []
+        if self.vad is not None:
+            audio_data, ends = self.vad.process(audio_data)
+
+        results = []
+        start = 0
+        for end in ends:
+            # El VAD vio suficiente silencio: cerrar la frase sin esperar a
+            # Vosk, con el audio hasta el fin y no el de la frase siguiente
+            segment = audio_data[start * 2:end * 2]
+            start = end
+            if segment and self.recognizer.AcceptWaveform(segment):
+                results.append(self.recognizer.Result())
+            results.append(self.recognizer.FinalResult())
+            self._last_partial = None
+
+        audio_data = audio_data[start * 2:] if start else audio_data
+        if audio_data:
+            if self.recognizer.AcceptWaveform(audio_data):
+                # Frase completa detectada
+                self._last_partial = None
+                results.append(self.recognizer.Result())
+            else:
+                # Resultado parcial (palabra siendo pronunciada); se compara
+                # el JSON tal cual, sin decodificarlo
+                partial = self.recognizer.PartialResult()
+                if partial != self._last_partial:
+                    self._last_partial = partial
+                    results.append(partial)
+                else:
+                    self.partials_repeated += 1
+        return results
+
+    def final(self):
+        """Cierra la frase en curso y devuelve su resultado"""
+        self._last_partial = None
+        return self.recognizer.FinalResult()
+
+    def reset(self):
+        self.recognizer.Reset()
+        self._last_partial = None
+        if self.resampler is not None:
+            self.resampler.reset()
+        if self.vad is not None:
+            self.vad.reset()
+
+    def stats(self):
+        """Contadores de la sesión"""
+        return {
+            'vad': self.vad.stats() if self.vad is not None else None,
+            'partials_repeated': self.partials_repeated,
+        }
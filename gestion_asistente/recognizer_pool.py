@@ -0,0 +1,168 @@
+"""
+Pool de ``KaldiRecognizer`` pre-construidos.
+
+Crear un reconocedor y configurarlo (``SetWords``) cuesta tiempo en cada
+conexión, y los usuarios de voz reconectan a menudo (cambio de página, activar
+y desactivar el micrófono). El pool guarda reconocedores ya construidos por
+modelo y configuración: una conexión toma uno, y al desconectarse lo devuelve
+reiniciado con ``Reset()`` para la siguiente.
+"""
+import threading
+import time
+from collections import deque, namedtuple
+
+from django.conf import settings
+from vosk import KaldiRecognizer
+
+from . import vosk_registry
+
+# Todo lo que determina cómo se construye un reconocedor. Dos sesiones con la
+# misma configuración (y el mismo modelo) pueden intercambiarse reconocedores.
+# ``grammar`` es la lista de frases JSON del modo gramática (None = vocabulario abierto).
+# ``words`` y ``partial_words`` añaden el detalle por palabra (tiempos y
+# confianza) a los resultados y a los parciales respectivamente.
+# ``alternatives`` > 0 pide ese número de hipótesis por frase (N-best).
+RecognizerConfig = namedtuple(
+    'RecognizerConfig', ['sample_rate', 'words', 'grammar', 'partial_words', 'alternatives'],
+    defaults=(16000, True, None, False, 0)
+)
+
+
+def build_recognizer(model, config):
+    """Construye un reconocedor nuevo para ``config``"""
+    if config.grammar:
+        recognizer = KaldiRecognizer(model, config.sample_rate, config.grammar)
+    else:
+        recognizer = KaldiRecognizer(model, config.sample_rate)
+    recognizer.SetWords(config.words)
+    recognizer.SetPartialWords(config.partial_words)
+    if config.alternatives:
+        recognizer.SetMaxAlternatives(config.alternatives)
+    return recognizer
+
+
+class RecognizerPool:
+    """
+    Pool acotado de reconocedores por (modelo, configuración).
+
+    Crece bajo demanda (si no hay uno libre se construye) y se encoge solo:
+    los reconocedores que llevan más de ``idle_ttl`` segundos sin usarse se
+    descartan, conservando como mínimo ``min_idle`` en las configuraciones
+    precalentadas. Las demás (p. ej. la gramática de una versión anterior del
+    catálogo) pueden vaciarse del todo.
+    """
+
+    def __init__(self, max_idle=16, min_idle=2, idle_ttl=300.0):
+        self.max_idle = max_idle
+        self.min_idle = min_idle
+        self.idle_ttl = idle_ttl
+        self._idle = {}
+        self._prewarmed = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.returned = 0
+        self.discarded = 0
+
+    def acquire(self, model, config):
+        """Toma un reconocedor libre o construye uno nuevo (llamar desde un thread)"""
+        recognizer = None
+        with self._lock:
+            idle = self._idle.get((model, config))
+            if idle:
+                recognizer, _ = idle.pop()
+                self.hits += 1
+            else:
+                self.misses += 1
+        if recognizer is None:
+            recognizer = build_recognizer(model, config)
+        return recognizer
+
+    def release(self, recognizer, model, config):
+        """Devuelve un reconocedor al pool, reiniciado para la próxima sesión"""
+        try:
+            recognizer.Reset()
+        except Exception:
+            # Un reconocedor en mal estado no se reutiliza
+            with self._lock:
+                self.discarded += 1
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            idle = self._idle.setdefault((model, config), deque())
+            if len(idle) >= self.max_idle:
+                self.discarded += 1
+            else:
+                idle.append((recognizer, now))
+                self.returned += 1
+            self._trim(now)
+
+    def prewarm(self, model, config, count=None):
+        """Construye reconocedores por adelantado hasta tener ``count`` libres"""
+        count = self.min_idle if count is None else count
+        with self._lock:
+            missing = count - len(self._idle.get((model, config), ()))
+        built = [build_recognizer(model, config) for _ in range(max(missing, 0))]
+        now = time.monotonic()
+        with self._lock:
+            self._prewarmed.add((model, config))
+            idle = self._idle.setdefault((model, config), deque())
+            for recognizer in built:
+                if len(idle) < self.max_idle:
+                    idle.append((recognizer, now))
+
+    def discard_model(self, model):
+        """Descarta los reconocedores libres de un modelo que se va a descargar"""
+        with self._lock:
+            for key in [key for key in self._idle if key[0] is model]:
+                self.discarded += len(self._idle.pop(key))
+            self._prewarmed = {key for key in self._prewarmed if key[0] is not model}
+
+    def _trim(self, now):
+        """Descarta reconocedores ociosos por más de ``idle_ttl`` (con el lock tomado)"""
+        for key in list(self._idle):
+            idle = self._idle[key]
+            keep = self.min_idle if key in self._prewarmed else 0
+            # Los más antiguos están a la izquierda: acquire() toma por la derecha
+            while len(idle) > keep and now - idle[0][1] > self.idle_ttl:
+                idle.popleft()
+                self.discarded += 1
+            if not idle:
+                del self._idle[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'returned': self.returned,
+                'discarded': self.discarded,
+                'idle': sum(len(idle) for idle in self._idle.values()),
+                'configs': len(self._idle),
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Pool del proceso, configurado con los ajustes ``VOSK_POOL_*``"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = RecognizerPool(
+                    max_idle=getattr(settings, 'VOSK_POOL_MAX_IDLE', 16),
+                    min_idle=getattr(settings, 'VOSK_POOL_MIN_IDLE', 2),
+                    idle_ttl=getattr(settings, 'VOSK_POOL_IDLE_TTL', 300.0),
+                )
+    return _pool
+
+
+def prewarm(model_path=None):
+    """Deja reconocedores listos para la configuración por defecto (al arrancar)"""
+    if not vosk_registry.is_loaded(model_path):
+        return
+    get_pool().prewarm(vosk_registry.get_model(model_path), RecognizerConfig())
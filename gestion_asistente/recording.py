@@ -0,0 +1,60 @@
+"""
+Grabación de sesiones de voz para reproducirlas después.
+
+Con ``VOSK_RECORD_DIR`` cada frase (de 'start' a 'stop') se guarda como WAV
+mono PCM 16-bit con la frecuencia de captura del cliente; el audio en μ-law se
+decodifica al grabarlo. El comando ``benchmark_sesiones_voz`` reproduce esas
+grabaciones contra la aplicación ASGI con muchos clientes simultáneos.
+"""
+import os
+import time
+import uuid
+import wave
+
+from django.conf import settings
+
+from .audio import DECODERS
+
+
+class SessionRecorder:
+    """Audio de una frase en memoria, hasta ``max_seconds``"""
+
+    def __init__(self, directory, sample_rate, max_seconds=120, codec=None):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.decode = DECODERS.get(codec)
+        self.max_bytes = int(max_seconds * sample_rate) * 2
+        self._audio = bytearray()
+
+    @classmethod
+    def for_session(cls, options):
+        """Grabador para las opciones de ``RecognitionStream`` de una sesión, o None"""
+        directory = getattr(settings, 'VOSK_RECORD_DIR', None)
+        if not directory:
+            return None
+        return cls(
+            directory, options['sample_rate'], getattr(settings, 'VOSK_RECORD_MAX_SECONDS', 120),
+            codec=options['codec'],
+        )
+
+    def write(self, data):
+        if self.decode is not None:
+            data = self.decode(data)
+        room = self.max_bytes - len(self._audio)
+        if room > 0:
+            self._audio += data[:room]
+
+    def save(self):
+        """Escribe el WAV (llamar fuera del event loop); devuelve su ruta o None si no hay audio"""
+        if not self._audio:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        name = f'{time.strftime("%Y%m%d-%H%M%S")}-{uuid.uuid4().hex[:8]}-{self.sample_rate}.wav'
+        path = os.path.join(self.directory, name)
+        with wave.open(path, 'wb') as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(self.sample_rate)
+            wav.writeframes(bytes(self._audio))
+        self._audio = bytearray()
+        return path
@@ -0,0 +1,90 @@
+"""
+Elección entre las alternativas (N-best) de Vosk.
+
+Con ``SetMaxAlternatives`` el reconocedor devuelve varias hipótesis por frase
+en lugar de sólo la mejor según el modelo acústico. El modelo pequeño en
+español suele poner arriba una frase que no tiene sentido en la tienda
+("agregar dos le che") y un poco más abajo la correcta. ``rescore`` puntúa
+cada alternativa combinando su confianza acústica con lo que encaja en la
+tienda: palabras conocidas (comandos, números, catálogo), si contiene un
+comando y si nombra productos del catálogo.
+
+El coste está acotado: como mucho ``_MAX_ALTERNATIVES`` hipótesis de
+``_MAX_WORDS`` palabras, consultas a un conjunto precalculado de palabras y
+una pasada del autómata de intenciones por hipótesis (``IntentEngine.summary``,
+que no resuelve productos). Sólo la hipótesis elegida se interpreta entera.
+"""
+import json
+import math
+
+from gestion_productos.text import fold
+
+from .intents import get_intent_engine
+from .vocabulary import normalize
+
+_MAX_ALTERNATIVES = 5
+_MAX_WORDS = 20
+
+# Diferencia de confianza de Vosk que equivale a un factor e en probabilidad
+_CONFIDENCE_SCALE = 5.0
+
+# Bonificaciones (en la misma escala logarítmica)
+_WEIGHT_COVERAGE = 2.0   # fracción de palabras conocidas
+_WEIGHT_COMMAND = 1.5    # contiene un comando
+_WEIGHT_PRODUCT = 1.0    # nombra productos del catálogo (no sólo por aproximación)
+
+
+def alternatives(result):
+    """
+    Hipótesis de un resultado de Vosk con alternativas.
+
+    Returns:
+        lista de (texto, confianza) en el orden de Vosk, o None si el
+        resultado no trae alternativas
+    """
+    if '"alternatives"' not in result:
+        return None
+    return [
+        (item.get('text', '').strip(), float(item.get('confidence', 0.0)))
+        for item in json.loads(result).get('alternatives', [])[:_MAX_ALTERNATIVES]
+    ]
+
+
+def rescore(result, engine=None):
+    """
+    Mejor interpretación de un resultado con alternativas (llamar fuera del
+    event loop, como ``IntentEngine.parse``).
+
+    Returns:
+        dict con 'transcript', 'intent' (o None), 'confidence' (0-1, sobre
+        las hipótesis consideradas) y 'alternatives' (textos en el orden de
+        Vosk); o None si no hay ninguna hipótesis con texto
+    """
+    hypotheses = [(text, confidence) for text, confidence in alternatives(result) or () if text]
+    if not hypotheses:
+        return None
+    engine = engine or get_intent_engine()
+    known = engine.known_words()
+    top = max(confidence for _, confidence in hypotheses)
+
+    scored = []
+    for text, confidence in hypotheses:
+        words = fold(normalize(text)).split()[:_MAX_WORDS]
+        coverage = sum(word in known for word in words) / len(words) if words else 0.0
+        command, products = engine.summary(text)
+        score = (confidence - top) / _CONFIDENCE_SCALE + _WEIGHT_COVERAGE * coverage
+        if command:
+            score += _WEIGHT_COMMAND
+            if products:
+                score += _WEIGHT_PRODUCT
+        scored.append((score, text))
+
+    best_score, best = max(scored, key=lambda item: item[0])
+    # Softmax de las puntuaciones: probabilidad relativa de la elegida
+    total = sum(math.exp(score - best_score) for score, _ in scored)
+    return {
+        'transcript': best,
+        'intent': engine.parse(best),
+        'confidence': round(1.0 / total, 3),
+        'alternatives': [text for text, _ in hypotheses],
+    }
@@ -0,0 +1,118 @@
+"""
+Reanudación de sesiones de voz tras una reconexión.
+
+En el móvil el socket se cae a menudo (cambio de red, pantalla bloqueada). Sin
+reanudación, ``disconnect`` devuelve el reconocedor al pool y pierde la frase
+a medias, y el usuario tiene que repetirla tras pagar otra vez la conexión.
+
+Cada sesión recibe un token en 'ready'. Si el socket se cierra sin un cierre
+limpio, el consumer aparca la sesión (reconocedor con su frase en curso,
+modelo, configuración y los mensajes que no llegaron a enviarse) durante
+``VOSK_RESUME_TTL`` segundos. Un cliente que vuelve con ``?resume=<token>``
+la recupera tal cual; si no vuelve a tiempo se liberan sus recursos. Como
+mucho hay ``VOSK_RESUME_MAX_PARKED`` sesiones aparcadas por proceso: al
+superarlo se libera la más antigua.
+"""
+import asyncio
+import secrets
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class _Parked:
+    __slots__ = ('owner', 'state', 'close', 'timer')
+
+    def __init__(self, owner, state, close, timer):
+        self.owner = owner
+        self.state = state
+        self.close = close
+        self.timer = timer
+
+
+class SessionParking:
+    """Sesiones desconectadas a la espera de que su cliente vuelva"""
+
+    def __init__(self, ttl=30.0, max_parked=64):
+        """
+        Args:
+            ttl: segundos que se guarda una sesión desconectada
+            max_parked: sesiones aparcadas como máximo (se libera la más antigua)
+        """
+        self.ttl = ttl
+        self.max_parked = max_parked
+        self._parked = OrderedDict()
+        self.parked = 0
+        self.resumed = 0
+        self.expired = 0
+        self.evicted = 0
+        self.rejected = 0
+
+    def issue(self):
+        """Token nuevo para una sesión"""
+        return secrets.token_urlsafe(18)
+
+    def park(self, token, owner, state, close):
+        """
+        Guarda una sesión desconectada.
+
+        Args:
+            token: token que el cliente presentará al volver
+            owner: usuario de la sesión (None si es anónima); sólo él puede reanudarla
+            state: lo que el consumer necesita para continuar
+            close: corrutina ``close()`` que libera los recursos si nadie vuelve
+        """
+        loop = asyncio.get_running_loop()
+        self._discard(token, 'evicted')
+        while len(self._parked) >= self.max_parked:
+            self._discard(next(iter(self._parked)), 'evicted')
+        timer = loop.call_later(self.ttl, self._discard, token, 'expired')
+        self._parked[token] = _Parked(owner, state, close, timer)
+        self.parked += 1
+
+    def claim(self, token, owner):
+        """Recupera la sesión de ``token`` (None si caducó, no existe o es de otro usuario)"""
+        parked = self._parked.get(token)
+        if parked is None or parked.owner != owner:
+            self.rejected += 1
+            return None
+        del self._parked[token]
+        parked.timer.cancel()
+        self.resumed += 1
+        return parked.state
+
+    def _discard(self, token, reason):
+        parked = self._parked.pop(token, None)
+        if parked is None:
+            return
+        parked.timer.cancel()
+        setattr(self, reason, getattr(self, reason) + 1)
+        asyncio.ensure_future(parked.close())
+
+    def stats(self):
+        return {
+            'parked_now': len(self._parked),
+            'parked': self.parked,
+            'resumed': self.resumed,
+            'expired': self.expired,
+            'evicted': self.evicted,
+            'rejected': self.rejected,
+        }
+
+
+_parking = None
+
+
+def get_parking():
+    """Sesiones aparcadas del proceso, configuradas con los settings"""
+    global _parking
+    if _parking is None:
+        _parking = SessionParking(
+            ttl=getattr(settings, 'VOSK_RESUME_TTL', 30),
+            max_parked=getattr(settings, 'VOSK_RESUME_MAX_PARKED', 64),
+        )
+    return _parking
+
+
+def is_enabled():
+    return bool(getattr(settings, 'VOSK_RESUME_TTL', 30))
@@ -0,0 +1,32 @@
+"""
+Mantiene el vocabulario de voz al día con los cambios del catálogo.
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from gestion_productos.models import categoria, producto
+
+from .prefetch import forget_product
+from .vocabulary import get_vocabulary
+
+
+@receiver(post_save, sender=producto)
+def producto_guardado(sender, instance, **kwargs):
+    get_vocabulary().update_product(instance)
+    forget_product(instance.pk)
+
+
+@receiver(post_delete, sender=producto)
+def producto_eliminado(sender, instance, **kwargs):
+    get_vocabulary().remove_product(instance.pk)
+    forget_product(instance.pk)
+
+
+@receiver(post_save, sender=categoria)
+def categoria_guardada(sender, instance, **kwargs):
+    get_vocabulary().update_category(instance)
+
+
+@receiver(post_delete, sender=categoria)
+def categoria_eliminada(sender, instance, **kwargs):
+    get_vocabulary().remove_category(instance.pk)
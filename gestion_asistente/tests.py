@@ -1,3 +1,1121 @@
-from django.test import TestCase
+import asyncio
+import json
+import multiprocessing
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+import msgpack
+import numpy as np
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from gestion_productos.models import categoria, producto
+
+from . import admission, vosk_registry
+from .admission import AdmissionController, AdmissionRejected
+from .asr_executor import OVERFLOW_DROP, OVERFLOW_MERGE, OVERFLOW_REJECT, SessionOverloaded, SessionQueue
+from .asr_workers import ASRProcessPool, AudioRing
+from .audio import Resampler, VoiceActivityDetector, decode_mulaw
+from .intents import IntentEngine, PhraseAutomaton
+from .partials import PartialCoalescer
+from .prefetch import SpeculativePrefetch
+from .protocol import PROTOCOL_MSGPACK, MessageEncoder, parse_result, unescape
+from .recognition import RecognitionStream
+from .recognizer_pool import RecognizerConfig, RecognizerPool, build_recognizer
+from .rescoring import alternatives, rescore
+from .resume import SessionParking
+from .vocabulary import COMMAND_PHRASES, CatalogVocabulary, normalize
+
+
+def _tone(seconds, rate=16000, amplitude=8000):
+    t = np.arange(int(seconds * rate)) / rate
+    return (amplitude * np.sin(2 * np.pi * 220 * t)).astype(np.int16)
+
+
+def _silence(seconds, rate=16000):
+    return np.zeros(int(seconds * rate), dtype=np.int16)
+
+
+class FakeKaldiRecognizer:
+    """KaldiRecognizer que apunta cómo se construyó y configuró"""
+
+    def __init__(self, model, sample_rate, grammar=None):
+        self.model = model
+        self.grammar = grammar
+        self.options = {}
+        self.resets = 0
+        self.broken = False
+
+    def SetWords(self, value):
+        self.options['words'] = value
+
+    def SetPartialWords(self, value):
+        self.options['partial_words'] = value
+
+    def SetMaxAlternatives(self, value):
+        self.options['alternatives'] = value
+
+    def Reset(self):
+        if self.broken:
+            raise RuntimeError('reconocedor roto')
+        self.resets += 1
+        self.samples = 0
+
+    # Reconocimiento: como FakeRecognizer, el texto es el número de muestras
+    samples = 0
+
+    def AcceptWaveform(self, data):
+        self.samples += len(data) // 2
+        return False
+
+    def PartialResult(self):
+        return json.dumps({'partial': f'{self.samples}'})
+
+    def FinalResult(self):
+        samples, self.samples = self.samples, 0
+        return json.dumps({'text': f'{samples}'})
+
+
+@mock.patch('gestion_asistente.recognizer_pool.KaldiRecognizer', FakeKaldiRecognizer)
+class RecognizerPoolTests(SimpleTestCase):
+    def test_build_applies_the_config(self):
+        recognizer = build_recognizer('modelo', RecognizerConfig(grammar='["pan"]', words=False, alternatives=3))
+        self.assertEqual(recognizer.grammar, '["pan"]')
+        self.assertEqual(recognizer.options, {'words': False, 'partial_words': False, 'alternatives': 3})
+        self.assertNotIn('alternatives', build_recognizer('modelo', RecognizerConfig()).options)
+
+    def test_reuse_by_model_and_config(self):
+        pool = RecognizerPool()
+        config, grammar = RecognizerConfig(), RecognizerConfig(grammar='["pan"]')
+        first = pool.acquire('a', config)
+        pool.release(first, 'a', config)
+        self.assertEqual(first.resets, 1)
+
+        self.assertIs(pool.acquire('a', config), first)
+        self.assertIsNot(pool.acquire('b', config), first)
+        self.assertIsNot(pool.acquire('a', grammar), first)
+        stats = pool.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['returned']), (1, 3, 1))
+
+    def test_broken_and_excess_recognizers_are_discarded(self):
+        pool = RecognizerPool(max_idle=1)
+        config = RecognizerConfig()
+        broken, first, second = (pool.acquire('a', config) for _ in range(3))
+        broken.broken = True
+        for recognizer in (broken, first, second):
+            pool.release(recognizer, 'a', config)
+        stats = pool.stats()
+        self.assertEqual((stats['idle'], stats['returned'], stats['discarded']), (1, 1, 2))
+
+    def test_prewarm_and_idle_expiry(self):
+        pool = RecognizerPool(min_idle=1, idle_ttl=10)
+        config = RecognizerConfig()
+        with mock.patch('gestion_asistente.recognizer_pool.time.monotonic', return_value=0):
+            pool.prewarm('a', config, count=2)
+            pool.release(FakeKaldiRecognizer('b', 16000), 'b', config)
+        self.assertEqual(pool.stats()['idle'], 3)
+        self.assertEqual(pool.stats()['misses'], 0)
+
+        # Al caducar se conserva el mínimo de la configuración precalentada
+        with mock.patch('gestion_asistente.recognizer_pool.time.monotonic', return_value=60):
+            pool.release(pool.acquire('a', config), 'a', config)
+        stats = pool.stats()
+        self.assertEqual((stats['idle'], stats['configs'], stats['hits']), (1, 1, 1))
+
+
+class SessionQueueTests(SimpleTestCase):
+    def setUp(self):
+        self.calls = []
+        self.gate = asyncio.Event()
+
+    async def _chunks(self, *chunks):
+        self.calls.append(chunks)
+        return len(chunks)
+
+    async def _blocked_queue(self, overflow, *chunks):
+        """Cola con un trabajo de control en curso y ``chunks`` pendientes"""
+        queue = SessionQueue(max_depth=2, overflow=overflow)
+        queue.submit(self.gate.wait)
+        await asyncio.sleep(0)
+        futures = [queue.submit(self._chunks, chunk, mergeable=True) for chunk in chunks]
+        return queue, futures
+
+    async def test_merge_joins_the_last_chunk(self):
+        queue, (first, second) = await self._blocked_queue(OVERFLOW_MERGE, b'1', b'2')
+        self.assertIs(queue.submit(self._chunks, b'3', mergeable=True), second)
+        self.gate.set()
+        await queue.join()
+        self.assertEqual(self.calls, [(b'1',), (b'2', b'3')])
+        self.assertEqual((await first, await second), (1, 2))
+        self.assertEqual(queue.stats()['merged'], 1)
+
+    async def test_drop_discards_the_oldest_chunk(self):
+        queue, (first, _) = await self._blocked_queue(OVERFLOW_DROP, b'1', b'2')
+        queue.submit(self._chunks, b'3', mergeable=True)
+        self.gate.set()
+        await queue.join()
+        self.assertTrue(first.cancelled())
+        self.assertEqual(self.calls, [(b'2',), (b'3',)])
+        self.assertEqual(queue.stats()['dropped'], 1)
+
+    async def test_merge_behind_a_control_job_drops(self):
+        queue, _ = await self._blocked_queue(OVERFLOW_MERGE, b'1', b'2')
+        queue.submit(self._chunks, b'fin')
+        queue.submit(self._chunks, b'3', mergeable=True)
+        self.gate.set()
+        await queue.join()
+        self.assertEqual(self.calls, [(b'2',), (b'fin',), (b'3',)])
+
+    async def test_reject_refuses_the_new_chunk(self):
+        queue, _ = await self._blocked_queue(OVERFLOW_REJECT, b'1', b'2')
+        with self.assertRaises(SessionOverloaded):
+            queue.submit(self._chunks, b'3', mergeable=True)
+        # Los trabajos de control no cuentan para el límite
+        queue.submit(self._chunks, b'fin')
+        self.gate.set()
+        await queue.join()
+        self.assertEqual(self.calls, [(b'1',), (b'2',), (b'fin',)])
+        self.assertEqual(queue.stats()['rejected'], 1)
+
+    async def test_runs_functions_in_the_executor(self):
+        queue = SessionQueue()
+        self.assertEqual(await queue.submit(sum, (1, 2)), 3)
+
+    async def test_failing_error_callback_does_not_stop_the_queue(self):
+        errors = []
+
+        async def on_error(error):
+            errors.append(error)
+            raise RuntimeError('socket cerrado')
+
+        async def fail(chunk):
+            raise ValueError(chunk)
+
+        async def on_result(result):
+            pass
+
+        queue = SessionQueue(on_error=on_error)
+        queue.submit(fail, b'1', on_result=on_result, mergeable=True)
+        after = queue.submit(self._chunks, b'2', on_result=on_result, mergeable=True)
+        with self.assertLogs('gestion_asistente.asr_executor', 'WARNING'):
+            await queue.join()
+        self.assertEqual(await after, 1)
+        self.assertEqual([type(error) for error in errors], [ValueError])
+
+    async def test_error_without_callback_reaches_the_future(self):
+        async def fail():
+            raise ValueError('modelo')
+
+        queue = SessionQueue()
+        with self.assertRaises(ValueError):
+            await queue.submit(fail)
+
+
+class AudioRingTests(SimpleTestCase):
+    def setUp(self):
+        buf = memoryview(bytearray(8 + 16))
+        # Productor y consumidor comparten sólo la memoria, como en dos procesos
+        self.producer = AudioRing(buf, 0, 16)
+        self.consumer = AudioRing(buf, 0, 16)
+
+    def tearDown(self):
+        self.producer.release()
+        self.consumer.release()
+
+    def test_wrap_around(self):
+        for size in (10, 12, 16, 7):
+            data = bytes(range(size))
+            self.producer.write(data)
+            self.assertEqual(self.producer.free(), 16 - size)
+            self.assertEqual(self.consumer.read(size), data)
+            self.assertEqual(self.producer.free(), 16)
+
+    def test_full_buffer(self):
+        self.producer.write(b'x' * 12)
+        with self.assertRaises(BufferError):
+            self.producer.write(b'y' * 5)
+        self.producer.write(b'y' * 4)
+        self.assertEqual(self.producer.free(), 0)
+        self.assertEqual(self.consumer.read(16), b'x' * 12 + b'y' * 4)
+
+
+class _ThreadPipeEnd:
+    """Extremo del pipe del worker: el padre lo cierra al arrancarlo, pero el thread sigue usándolo"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+    def close(self):
+        pass
+
+
+class _ThreadProcess(threading.Thread):
+    """Process de multiprocessing como thread: el worker ve los mocks del test"""
+
+    pid = None
+
+    def __init__(self, target, args, **kwargs):
+        super().__init__(target=target, args=args, **kwargs)
+        self.conn = args[-1].conn
+
+    def run(self):
+        try:
+            super().run()
+        finally:
+            self.conn.close()
+
+    def terminate(self):
+        pass
+
+
+class _ThreadContext:
+    Process = _ThreadProcess
+
+    @staticmethod
+    def Pipe():
+        parent, child = multiprocessing.Pipe()
+        return parent, _ThreadPipeEnd(child)
+
+
+class ASRProcessPoolTests(SimpleTestCase):
+    def setUp(self):
+        for target, value in (
+            ('gestion_asistente.asr_workers.multiprocessing.get_context', lambda method: _ThreadContext),
+            ('gestion_asistente.asr_workers.signal.signal', lambda *args: None),
+            ('gestion_asistente.asr_workers.vosk_registry.get_model', lambda path: 'modelo'),
+            ('gestion_asistente.recognizer_pool.KaldiRecognizer', FakeKaldiRecognizer),
+        ):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_round_trip_through_a_worker(self):
+        # El buffer (64 bytes) es más pequeño que el audio: viaja por partes
+        pool = ASRProcessPool(processes=1, model_path='modelo', slots=2, ring_bytes=64)
+        try:
+            session = await pool.open_session()
+            self.assertEqual(pool.stats()[0]['sessions'], 1)
+            results = await session.accept(bytes(100), bytes(60))
+            self.assertEqual([json.loads(result) for result in results], [{'partial': '80'}])
+            self.assertEqual(json.loads(await session.final()), {'text': '80'})
+
+            await session.close()
+            self.assertEqual(pool.stats()[0]['sessions'], 0)
+            with self.assertRaises(RuntimeError):
+                await session.final()  # el worker ya no tiene la sesión
+        finally:
+            pool.shutdown()
+
+
+class CatalogVocabularyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        lacteos = categoria.objects.create(nombre='Lácteos')
+        cls.leche = producto.objects.create(
+            nombre='Leche Entera', referencia='L1', stock=1, precio=1, descripcion='', categoria=lacteos,
+        )
+        producto.objects.create(
+            nombre='Queso (curado)', referencia='Q1', stock=1, precio=1, descripcion='', categoria=lacteos,
+            estado=False,
+        )
+
+    def setUp(self):
+        self.vocabulary = CatalogVocabulary()
+
+    def test_normalize_keeps_accents(self):
+        self.assertEqual(normalize('  ¿Azúcar,   MORENA? '), 'azúcar morena')
+        self.assertEqual(normalize(None), '')
+
+    def test_loads_active_products_and_categories(self):
+        self.vocabulary.ensure_loaded()
+        self.assertEqual(self.vocabulary.products(), {self.leche.pk: 'leche entera'})
+        self.assertEqual(list(self.vocabulary.categories().values()), ['lácteos'])
+        self.assertEqual(self.vocabulary.version, 1)
+
+        # Recargar sin cambios no cambia la versión (ni la gramática)
+        self.vocabulary._loaded_at = None
+        self.vocabulary.ensure_loaded()
+        self.assertEqual(self.vocabulary.version, 1)
+
+    def test_grammar(self):
+        phrases = json.loads(self.vocabulary.grammar())
+        self.assertEqual(phrases[-1], '[unk]')
+        self.assertEqual(phrases[:-1], sorted(set(phrases[:-1])))
+        self.assertTrue({'leche entera', 'leche', 'entera', 'lácteos', 'dos', 'y'} <= set(phrases))
+        self.assertTrue(set(COMMAND_PHRASES) <= set(phrases))
+        self.assertNotIn('queso', ' '.join(phrases))
+
+    def test_grammar_follows_catalog_changes(self):
+        grammar = self.vocabulary.grammar()
+        self.assertIs(self.vocabulary.grammar(), grammar)
+
+        self.leche.estado = False
+        self.vocabulary.update_product(self.leche)
+        self.assertNotIn('leche entera', json.loads(self.vocabulary.grammar()))
+        version = self.vocabulary.version
+        self.vocabulary.update_product(self.leche)
+        self.assertEqual(self.vocabulary.version, version)
+
+
+class VoiceActivityDetectorTests(SimpleTestCase):
+    def test_silence_is_dropped(self):
+        vad = VoiceActivityDetector()
+        self.assertEqual(vad.process(_silence(1.0).tobytes()), (b'', []))
+        stats = vad.stats()
+        self.assertEqual(stats['frames_dropped'], stats['frames_total'])
+
+    def test_speech_keeps_padding_and_marks_the_end(self):
+        vad = VoiceActivityDetector(padding_ms=210, hangover_ms=300, end_silence_ms=800)
+        # 16 tramas de silencio, 20 de voz y 34 de silencio
+        audio = np.concatenate((_silence(0.48), _tone(0.6), _silence(1.02)))
+        kept, ends = vad.process(audio.tobytes())
+
+        # 7 tramas antes, 20 de voz y 10 de hangover
+        self.assertEqual(len(kept) // 2, (7 + 20 + 10) * vad.frame)
+        self.assertEqual(ends, [len(kept) // 2])
+        self.assertEqual(vad.utterances, 1)
+
+    def test_partial_frames_wait_for_the_next_chunk(self):
+        audio = np.concatenate((_silence(0.3), _tone(0.3))).tobytes()
+        whole, _ = VoiceActivityDetector().process(audio)
+
+        vad = VoiceActivityDetector()
+        self.assertEqual(vad.process(audio[:vad.frame]), (b'', []))  # media trama
+        kept, _ = vad.process(audio[vad.frame:])
+        self.assertEqual(kept, whole)
+        self.assertGreater(len(kept), 0)
+
+    def test_state_carries_across_chunks(self):
+        # Dos frases; los cortes caen dentro del hangover, del silencio final y del relleno
+        audio = np.concatenate((
+            _silence(0.3), _tone(0.6), _silence(1.0), _silence(0.1), _tone(0.3), _silence(0.2),
+        )).tobytes()
+        whole, whole_ends = VoiceActivityDetector().process(audio)
+
+        vad = VoiceActivityDetector()
+        kept, ends = b'', []
+        for i in range(0, len(audio), 2000):
+            chunk, chunk_ends = vad.process(audio[i:i + 2000])
+            ends += [len(kept) // 2 + end for end in chunk_ends]
+            kept += chunk
+        self.assertEqual(kept, whole)
+        self.assertEqual(ends, whole_ends)
+        self.assertEqual(len(ends), 1)
+
+
+class MulawTests(SimpleTestCase):
+    def test_known_codes(self):
+        pcm = np.frombuffer(decode_mulaw(bytes([0xFF, 0x7F, 0x80, 0x00])), dtype=np.int16)
+        self.assertEqual(pcm.tolist(), [0, 0, 32124, -32124])
+
+    def test_decoding_is_monotonic(self):
+        # 0x80..0xFF son positivos de mayor a menor; 0x00..0x7F, negativos
+        positive = np.frombuffer(decode_mulaw(bytes(range(0x80, 0x100))), dtype=np.int16)
+        negative = np.frombuffer(decode_mulaw(bytes(range(0x80))), dtype=np.int16)
+        self.assertTrue(np.all(np.diff(positive) < 0))
+        self.assertTrue(np.all(np.diff(negative) > 0))
+        self.assertEqual(negative.tolist(), (-positive).tolist())
+
+
+class ResamplerTests(SimpleTestCase):
+    def test_chunks_give_the_same_result(self):
+        audio = _tone(0.5, rate=44100).tobytes()
+        whole = Resampler(44100).process(audio)
+        resampler = Resampler(44100)
+        chunked = b''.join(resampler.process(audio[i:i + 1234]) for i in range(0, len(audio), 1234))
+        self.assertEqual(chunked, whole)
+
+    def test_output_length_and_level(self):
+        resampler = Resampler(48000)
+        self.assertEqual((resampler.up, resampler.down), (1, 3))
+        out = np.frombuffer(resampler.process(_tone(1.0, rate=48000).tobytes()), dtype=np.int16)
+        self.assertLessEqual(abs(len(out) - 16000), resampler.taps)
+        # El tono de 220 Hz pasa sin atenuarse (se ignora el arranque del filtro)
+        self.assertAlmostEqual(np.abs(out[100:]).max() / 8000, 1.0, delta=0.02)
+
+    def test_reset_forgets_history(self):
+        resampler = Resampler(8000)
+        first = resampler.process(_tone(0.1, rate=8000).tobytes())
+        resampler.reset()
+        self.assertEqual(resampler.process(_tone(0.1, rate=8000).tobytes()), first)
+
+
+class PartialCoalescerTests(SimpleTestCase):
+    def setUp(self):
+        self.sent = []
+
+    async def _send(self, text):
+        self.sent.append(text)
+
+    async def test_repeated_text_is_not_sent(self):
+        coalescer = PartialCoalescer(self._send, min_interval=0)
+        await coalescer.push('hola')
+        await coalescer.push('hola')
+        self.assertEqual(self.sent, ['hola'])
+        self.assertEqual(coalescer.stats(), {'sent': 1, 'coalesced': 1})
+
+    async def test_burst_sends_only_the_last(self):
+        coalescer = PartialCoalescer(self._send, min_interval=0.05)
+        for text in ('agregar', 'agregar dos', 'agregar dos leches'):
+            await coalescer.push(text)
+        self.assertEqual(self.sent, ['agregar'])
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.sent, ['agregar', 'agregar dos leches'])
+        self.assertEqual(coalescer.stats(), {'sent': 2, 'coalesced': 1})
+
+    async def test_clear_drops_the_pending_partial(self):
+        coalescer = PartialCoalescer(self._send, min_interval=0.05)
+        await coalescer.push('agregar')
+        await coalescer.push('agregar dos')
+        coalescer.clear()
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.sent, ['agregar'])
+        # La frase siguiente puede repetir el texto de la anterior
+        await coalescer.push('agregar')
+        self.assertEqual(self.sent, ['agregar', 'agregar'])
+
+
+class ProtocolTests(SimpleTestCase):
+    def test_parse_result(self):
+        self.assertEqual(parse_result('{"partial" : "agregar dos"}'), ('partial', 'agregar dos'))
+        words = '{"result": [{"conf": 1.0, "word": "pan"}], "text": "pan"}'
+        self.assertEqual(parse_result(words), ('text', 'pan'))
+        self.assertEqual(parse_result('{"partial_result": []}'), (None, ''))
+
+    def test_escaped_text(self):
+        field, raw = parse_result(json.dumps({'text': 'dijo "pan"'}))
+        self.assertEqual(field, 'text')
+        self.assertEqual(unescape(raw), 'dijo "pan"')
+        self.assertEqual(unescape('añadir'), 'añadir')
+
+    def test_encode_transcript_json(self):
+        encoder = MessageEncoder()
+        for text in ('leche entera', 'dijo "pan"', 'añadir\npan'):
+            _, raw = parse_result(json.dumps({'text': text}))
+            message = json.loads(encoder.encode_transcript('final', raw)['text_data'])
+            self.assertEqual(message, {'type': 'final', 'transcript': text})
+
+    def test_encode_transcript_msgpack(self):
+        encoder = MessageEncoder(PROTOCOL_MSGPACK)
+        _, raw = parse_result(json.dumps({'partial': 'dijo "pan"'}))
+        data = encoder.encode_transcript('partial', raw)['bytes_data']
+        self.assertEqual(msgpack.unpackb(data), {'type': 'partial', 'transcript': 'dijo "pan"'})
+        self.assertEqual(msgpack.unpackb(encoder.encode({'type': 'ready'})['bytes_data']), {'type': 'ready'})
+
+    def test_unknown_protocol(self):
+        with self.assertRaises(ValueError):
+            MessageEncoder('xml')
+
+
+class FakeVocabulary:
+    """CatalogVocabulary sin base de datos"""
+
+    version = 1
+
+    def ensure_loaded(self):
+        pass
+
+    def products(self):
+        return {1: 'leche entera', 2: 'pan de molde', 3: 'leche de almendras'}
+
+    def categories(self):
+        return {10: 'lácteos'}
+
+
+class IntentEngineTests(SimpleTestCase):
+    def setUp(self):
+        self.engine = IntentEngine(FakeVocabulary())
+        patcher = mock.patch('gestion_asistente.intents.get_fuzzy_index')
+        self.fuzzy = patcher.start().return_value
+        self.fuzzy.search.return_value = []
+        self.addCleanup(patcher.stop)
+
+    def test_add_with_quantity(self):
+        intent = self.engine.parse('Agregar dos leche entera')
+        self.assertEqual(intent, {'action': 'add', 'quantity': 2, 'products': [1], 'categories': []})
+        self.assertEqual(self.engine.parse('agregar treinta y cinco pan de molde')['quantity'], 35)
+        self.assertEqual(self.engine.parse('agregar 12 pan de molde')['quantity'], 12)
+
+    def test_no_command(self):
+        self.assertIsNone(self.engine.parse('hola qué tal'))
+
+    def test_priority_between_commands(self):
+        self.assertEqual(self.engine.parse('ver carrito y pagar')['action'], 'read_cart')
+
+    def test_products_by_word(self):
+        # "leche" está en dos nombres: salen los dos, por id
+        self.assertEqual(self.engine.parse('quitar leche')['products'], [1, 3])
+        intent = self.engine.parse('buscar almendras tostadas')
+        self.assertEqual((intent['products'], intent['query']), ([3], 'almendras tostadas'))
+
+    def test_fuzzy_fallback(self):
+        self.fuzzy.search.return_value = [(7, 0.9)]
+        intent = self.engine.parse('agregar tres yogures')
+        self.assertEqual((intent['products'], intent['fuzzy'], intent['quantity']), ([7], True, 3))
+        self.assertEqual(self.fuzzy.search.call_args.args[0], 'yogures')
+
+    def test_categories(self):
+        self.assertEqual(self.engine.parse('filtrar lacteos')['categories'], [10])
+
+    def test_known_words(self):
+        known = self.engine.known_words()
+        self.assertTrue({'agregar', 'dos', 'almendras', 'lacteos'} <= known)
+        self.assertNotIn('yogur', known)
+
+    def test_common_words_are_bounded(self):
+        vocabulary = FakeVocabulary()
+        products = {pk: f'leche {pk}' for pk in range(100, 200)}
+        products[250] = 'leche de almendras'
+        vocabulary.products = lambda: products
+        engine = IntentEngine(vocabulary)
+        with mock.patch('gestion_asistente.intents._WORD_CANDIDATES', 20):
+            self.assertEqual(engine.parse('quitar leche')['products'], list(range(100, 110)))
+            # La palabra rara elige los candidatos y la común sólo suma
+            self.assertEqual(engine.parse('quitar leche almendras')['products'], [250])
+
+    def test_catalog_change_rebuilds_in_background(self):
+        vocabulary = FakeVocabulary()
+        engine = IntentEngine(vocabulary)
+        self.assertEqual(engine.parse('quitar leche')['products'], [1, 3])
+
+        building, release = threading.Event(), threading.Event()
+        build = engine._build
+
+        def slow_build():
+            building.set()
+            release.wait(5)
+            return build()
+
+        vocabulary.version = 2
+        vocabulary.products = lambda: {4: 'leche de avena'}
+        with mock.patch.object(engine, '_build', slow_build):
+            # Mientras se construye se sigue usando el autómata anterior
+            self.assertEqual(engine.parse('quitar leche')['products'], [1, 3])
+            self.assertTrue(building.wait(5))
+            self.assertEqual(engine.parse('quitar leche')['products'], [1, 3])
+            release.set()
+            for thread in threading.enumerate():
+                if thread.name == 'intent-automaton':
+                    thread.join(5)
+        self.assertEqual(engine.parse('quitar leche')['products'], [4])
+
+    def test_automaton_matches_whole_words(self):
+        automaton = PhraseAutomaton()
+        automaton.add('compra', 'a')
+        automaton.add('terminar compra', 'b')
+        automaton.build()
+        self.assertEqual(list(automaton.search(['comprar'])), [])
+        self.assertCountEqual(automaton.search('terminar compra'.split()), [(1, 2, 'a'), (0, 2, 'b')])
+
+
+class RescoreTests(SimpleTestCase):
+    def setUp(self):
+        self.engine = IntentEngine(FakeVocabulary())
+        patcher = mock.patch('gestion_asistente.intents.get_fuzzy_index')
+        patcher.start().return_value.search.return_value = []
+        self.addCleanup(patcher.stop)
+
+    def _result(self, *hypotheses):
+        return json.dumps({'alternatives': [{'text': text, 'confidence': conf} for text, conf in hypotheses]})
+
+    def test_shop_phrase_beats_higher_confidence(self):
+        result = self._result(('agregar dos le che', 210.0), ('agregar dos leche entera', 205.0))
+        best = rescore(result, self.engine)
+        self.assertEqual(best['transcript'], 'agregar dos leche entera')
+        self.assertEqual(best['intent']['products'], [1])
+        self.assertEqual(best['alternatives'], ['agregar dos le che', 'agregar dos leche entera'])
+        self.assertGreater(best['confidence'], 0.5)
+
+    def test_acoustic_confidence_decides_between_equals(self):
+        result = self._result(('pan de molde', 150.0), ('pan de molde', 100.0))
+        self.assertEqual(rescore(result, self.engine)['confidence'], round(1 / (1 + np.exp(-10)), 3))
+
+    def test_only_the_chosen_hypothesis_is_parsed(self):
+        result = self._result(
+            ('agregar dos le che', 210.0), ('agregar dos leche entera', 205.0), ('agregar leche', 200.0),
+        )
+        with mock.patch.object(self.engine, 'parse', wraps=self.engine.parse) as parse:
+            best = rescore(result, self.engine)
+        parse.assert_called_once_with('agregar dos leche entera')
+        self.assertEqual(best['intent']['products'], [1])
+
+    def test_summary(self):
+        self.assertEqual(self.engine.summary('agregar dos leche'), (True, True))
+        self.assertEqual(self.engine.summary('agregar dos le che'), (True, False))
+        self.assertEqual(self.engine.summary('leche entera'), (False, False))
+
+    def test_without_alternatives(self):
+        self.assertIsNone(alternatives('{"text": "pan"}'))
+        self.assertIsNone(rescore('{"text": "pan"}', self.engine))
+        self.assertIsNone(rescore(self._result(('', 10.0)), self.engine))
+
+
+class SpeculativePrefetchTests(SimpleTestCase):
+    def setUp(self):
+        self.sent = []
+        self.calls = []
+        self.running = 0
+        self.peak = 0
+        self.delay = 0
+        self.enterContext(mock.patch('gestion_asistente.prefetch.predict', self._predict))
+
+    def _predict(self, prefix):
+        self.calls.append(prefix)
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        time.sleep(self.delay)
+        self.running -= 1
+        return {'action': 'add', 'products': [{'id': 1}]}
+
+    async def _send(self, prediction):
+        self.sent.append(prediction)
+
+    async def _settle(self, prefetch):
+        while prefetch._task is not None:
+            await asyncio.sleep(0.01)
+
+    def _partials(self, prefetch, prefix):
+        # Dos parciales que sólo coinciden en ``prefix``
+        prefetch.observe(f'{prefix} a')
+        prefetch.observe(f'{prefix} b')
+
+    async def test_one_speculation_at_a_time(self):
+        self.delay = 0.1
+        prefetch = SpeculativePrefetch(self._send, debounce=0.01)
+        self._partials(prefetch, 'agregar dos')
+        await asyncio.sleep(0.05)
+        # Mientras se interpreta el primero el prefijo crece dos veces: sólo
+        # se interpreta el último, y el resultado del primero se descarta
+        self._partials(prefetch, 'agregar dos leche')
+        self._partials(prefetch, 'agregar dos leche entera')
+        await self._settle(prefetch)
+        self.assertEqual(self.calls, ['agregar dos', 'agregar dos leche entera'])
+        self.assertEqual(self.peak, 1)
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual(prefetch.stats(), {'hints': 1, 'hits': 0, 'misses': 0, 'cancelled': 1})
+
+    async def test_hits_misses_and_repeated_predictions(self):
+        prefetch = SpeculativePrefetch(self._send, debounce=0)
+        self._partials(prefetch, 'agregar leche')
+        await self._settle(prefetch)
+        # La misma predicción no se vuelve a enviar
+        self._partials(prefetch, 'agregar leche entera')
+        await self._settle(prefetch)
+        self.assertEqual(len(self.sent), 1)
+        prefetch.resolve({'products': [1]})
+
+        self._partials(prefetch, 'agregar leche')
+        await self._settle(prefetch)
+        prefetch.resolve({'products': [2]})
+        # Sin predicción no cuenta
+        prefetch.resolve(None)
+        self.assertEqual(prefetch.stats(), {'hints': 2, 'hits': 1, 'misses': 1, 'cancelled': 0})
+
+    async def test_final_result_discards_speculation_in_flight(self):
+        self.delay = 0.1
+        prefetch = SpeculativePrefetch(self._send, debounce=0)
+        self._partials(prefetch, 'agregar leche')
+        await asyncio.sleep(0.05)
+        prefetch.resolve({'products': [1]})
+        await self._settle(prefetch)
+        self.assertEqual(self.sent, [])
+        self.assertEqual(prefetch.stats(), {'hints': 0, 'hits': 0, 'misses': 0, 'cancelled': 1})
+
+    async def test_short_prefixes_are_ignored(self):
+        prefetch = SpeculativePrefetch(self._send, debounce=0)
+        self._partials(prefetch, 'agregar')
+        self.assertIsNone(prefetch._task)
+
+
+class SessionParkingTests(SimpleTestCase):
+    def setUp(self):
+        self.closed = []
+
+    def _close(self, name):
+        async def close():
+            self.closed.append(name)
+        return close
+
+    async def test_claim_by_owner(self):
+        parking = SessionParking(ttl=5)
+        token = parking.issue()
+        parking.park(token, 'ana', {'frase': 'agregar'}, self._close('a'))
+
+        self.assertIsNone(parking.claim(token, 'otro'))
+        self.assertEqual(parking.claim(token, 'ana'), {'frase': 'agregar'})
+        self.assertIsNone(parking.claim(token, 'ana'))
+        await asyncio.sleep(0)
+        self.assertEqual(self.closed, [])
+        stats = parking.stats()
+        self.assertEqual((stats['resumed'], stats['rejected'], stats['parked_now']), (1, 2, 0))
+
+    async def test_expired_session_is_closed(self):
+        parking = SessionParking(ttl=0.01)
+        token = parking.issue()
+        parking.park(token, None, {}, self._close('a'))
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.closed, ['a'])
+        self.assertIsNone(parking.claim(token, None))
+        self.assertEqual(parking.stats()['expired'], 1)
+
+    async def test_oldest_is_evicted(self):
+        parking = SessionParking(ttl=5, max_parked=1)
+        first, second = parking.issue(), parking.issue()
+        parking.park(first, None, {}, self._close('a'))
+        parking.park(second, None, {}, self._close('b'))
+        await asyncio.sleep(0)
+        self.assertEqual(self.closed, ['a'])
+        self.assertEqual(parking.stats()['evicted'], 1)
+        self.assertEqual(parking.claim(second, None), {})
+
+
+class FakeRecognizer:
+    """KaldiRecognizer mínimo: cuenta las muestras de cada frase"""
+
+    def __init__(self):
+        self.samples = 0
+
+    def AcceptWaveform(self, data):
+        self.samples += len(data) // 2
+        return False
+
+    def PartialResult(self):
+        return json.dumps({'partial': f'{self.samples}'})
+
+    def Result(self):
+        return self.FinalResult()
+
+    def FinalResult(self):
+        samples, self.samples = self.samples, 0
+        return json.dumps({'text': f'{samples}'})
+
+    def Reset(self):
+        self.samples = 0
+
+
+class RecognitionStreamTests(SimpleTestCase):
+    def test_two_utterances_in_one_chunk(self):
+        recognizer = FakeRecognizer()
+        stream = RecognitionStream(recognizer, vad={})
+        audio = np.concatenate((_tone(0.6), _silence(1.2), _tone(0.6), _silence(0.1)))
+
+        results = [json.loads(result) for result in stream.accept(audio.tobytes())]
+
+        # La primera frase se cierra sólo con su audio (voz + hangover) y la
+        # segunda sigue abierta como parcial
+        self.assertEqual([list(result) for result in results], [['text'], ['partial']])
+        first = int(results[0]['text'])
+        self.assertGreaterEqual(first, 600 * 16)
+        self.assertLessEqual(first, (600 + 300) * 16)
+        second = int(results[1]['partial'])
+        self.assertGreaterEqual(second, 600 * 16)
+        self.assertEqual(stream.vad.utterances, 1)
+
+        # El fin de la segunda llega en el chunk siguiente: el resto del
+        # hangover y nada de la primera
+        results = [json.loads(result) for result in stream.accept(_silence(1.0).tobytes())]
+        self.assertEqual([list(result) for result in results], [['text']])
+        self.assertGreaterEqual(int(results[0]['text']), second)
+        self.assertLessEqual(int(results[0]['text']), (210 + 600 + 300) * 16)
+
+    def test_silence_returns_no_results(self):
+        stream = RecognitionStream(FakeRecognizer(), vad={})
+        self.assertEqual(stream.accept(_silence(0.5).tobytes()), [])
+
+
+class FakeGlobalSlots:
+    """GlobalSlots en memoria; ``on_reserve`` se ejecuta durante la espera a Redis"""
+
+    lease = 60.0
+
+    def __init__(self, limit, on_reserve=None):
+        self.limit = limit
+        self.members = set()
+        self.on_reserve = on_reserve
+
+    async def reserve(self, sid):
+        await asyncio.sleep(0)
+        if self.on_reserve is not None:
+            self.on_reserve()
+        if len(self.members) >= self.limit:
+            return False
+        self.members.add(sid)
+        return True
+
+    async def release(self, sid):
+        self.members.discard(sid)
+
+    async def renew(self, sids):
+        pass
+
+
+class AdmissionControllerTests(SimpleTestCase):
+    async def test_rejects_when_queue_is_full(self):
+        controller = AdmissionController(limit=1, queue=0)
+        await controller.acquire()
+        with self.assertRaises(AdmissionRejected):
+            await controller.acquire()
+        self.assertEqual(controller.stats()['rejected'], 1)
+
+    async def test_queued_session_is_admitted_on_release(self):
+        controller = AdmissionController(limit=1, queue=2, wait=5)
+        first = await controller.acquire()
+        positions = []
+
+        async def on_wait(position):
+            positions.append(position)
+
+        waiting = asyncio.ensure_future(controller.acquire(on_wait))
+        await asyncio.sleep(0.01)
+        self.assertEqual(controller.stats()['waiting'], 1)
+        await controller.release(first)
+        second = await asyncio.wait_for(waiting, 1)
+
+        self.assertNotEqual(second, first)
+        self.assertEqual(positions, [1])
+        stats = controller.stats()
+        self.assertEqual((stats['active'], stats['waiting'], stats['queued']), (1, 0, 1))
+
+    async def test_wait_times_out(self):
+        controller = AdmissionController(limit=1, queue=2, wait=0.05)
+        await controller.acquire()
+        with self.assertRaises(AdmissionRejected):
+            await controller.acquire()
+        stats = controller.stats()
+        self.assertEqual((stats['timeouts'], stats['waiting']), (1, 0))
+
+    async def test_cancelled_wait_leaves_the_queue(self):
+        controller = AdmissionController(limit=1, queue=2, wait=5)
+        first = await controller.acquire()
+        leaving = asyncio.ensure_future(controller.acquire())
+        staying = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0.01)
+        leaving.cancel()
+        await asyncio.sleep(0.01)
+        self.assertEqual(controller.stats()['waiting'], 1)
+        await controller.release(first)
+        await asyncio.wait_for(staying, 1)
+        self.assertTrue(leaving.cancelled())
+
+    async def test_degraded_near_the_limit(self):
+        controller = AdmissionController(limit=4, degrade_at=0.5)
+        await controller.acquire()
+        self.assertFalse(controller.degraded())
+        await controller.acquire()
+        self.assertTrue(controller.degraded())
+
+        controller.enter_degraded()
+        controller.enter_degraded()
+        controller.leave_degraded()
+        stats = controller.stats()
+        self.assertEqual((stats['degraded_sessions'], stats['degraded_active']), (2, 1))
+        # Al reanudarse sólo vuelve a contar como activa
+        controller.leave_degraded()
+        controller.enter_degraded(new=False)
+        stats = controller.stats()
+        self.assertEqual((stats['degraded_sessions'], stats['degraded_active']), (2, 1))
+
+    async def test_global_slot_is_returned_when_local_room_is_gone(self):
+        # Mientras se espera a Redis otra sesión ocupa la última plaza local
+        controller = AdmissionController(limit=1, queue=0)
+        slots = FakeGlobalSlots(limit=5, on_reserve=lambda: controller._active.add('otra'))
+        controller.global_slots = slots
+        with self.assertRaises(AdmissionRejected):
+            await controller.acquire()
+        self.assertEqual(slots.members, set())
+        self.assertEqual(controller.stats()['active'], 1)
+
+    async def test_global_limit_applies_across_processes(self):
+        slots = FakeGlobalSlots(limit=1)
+        slots.members.add('otro-proceso')
+        controller = AdmissionController(limit=4, queue=0, global_slots=slots)
+        with self.assertRaises(AdmissionRejected):
+            await controller.acquire()
+        slots.members.clear()
+        sid = await controller.acquire()
+        self.assertEqual(slots.members, {sid})
+        await controller.release(sid)
+        self.assertEqual(slots.members, set())
+
+
+@override_settings(VOSK_MAX_SESSIONS=1, VOSK_ADMISSION_QUEUE=2, VOSK_ADMISSION_WAIT=5)
+class VoiceConsumerAdmissionTests(SimpleTestCase):
+    def setUp(self):
+        admission._controller = None
+
+    def tearDown(self):
+        admission._controller = None
+
+    async def test_disconnect_while_queued_frees_the_place(self):
+        from .consumers import VoiceRecognitionConsumer
+
+        controller = admission.get_admission()
+        await controller.acquire()  # el proceso está lleno
+        communicator = WebsocketCommunicator(VoiceRecognitionConsumer.as_asgi(), '/ws/voice/')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        message = json.loads(await communicator.receive_from())
+        self.assertEqual((message['type'], message['position']), ('busy', 1))
+        self.assertEqual(controller.stats()['waiting'], 1)
+
+        await communicator.disconnect()
+        self.assertEqual(controller.stats()['waiting'], 0)
+
+
+    @override_settings(VOSK_MAX_SESSIONS=4, VOSK_DEGRADE_AT=0.5)
+    async def test_repeated_starts_count_one_degraded_session(self):
+        from .consumers import VoiceRecognitionConsumer
+
+        controller = admission.get_admission()
+        consumer = VoiceRecognitionConsumer()
+        consumer.degraded = False  # como tras connect()
+        consumer._update_degraded()
+        await controller.acquire()
+        await controller.acquire()
+        for _ in range(3):
+            consumer._update_degraded()
+        stats = controller.stats()
+        self.assertEqual((stats['degraded_sessions'], stats['degraded_active']), (1, 1))
+        # Si baja la carga, el siguiente 'start' deja el modo degradado
+        controller._active.clear()
+        consumer._update_degraded()
+        self.assertFalse(consumer.degraded)
+        self.assertEqual(controller.stats()['degraded_active'], 0)
+
+
+class FakeModel:
+    def __init__(self, path):
+        self.path = path
+
+
+class VoskRegistryTests(SimpleTestCase):
+    """Registro de modelos con un cargador falso: los tamaños salen de ``sizes`` (MB)"""
+
+    def setUp(self):
+        self.paths = {
+            name: self.enterContext(tempfile.TemporaryDirectory()) for name in ('grande', 'pequeno', 'movil')
+        }
+        self.sizes = {self.paths['grande']: 600, self.paths['pequeno']: 300, self.paths['movil']: 300}
+        self.enterContext(self.settings(
+            VOSK_MODELS=self.paths, VOSK_DEFAULT_MODEL='grande', VOSK_MODEL_CACHE_MB=None,
+            VOSK_MODEL_IDLE_TTL=None, VOSK_MODEL_MEMORY_LIMIT_MB=None,
+        ))
+        for name in ('_versions', '_current', '_counters'):
+            self.enterContext(mock.patch.dict(getattr(vosk_registry, name), clear=True))
+        self.model = self.enterContext(mock.patch.object(vosk_registry, 'Model', side_effect=FakeModel))
+        self.enterContext(mock.patch.object(
+            vosk_registry, '_disk_bytes', side_effect=lambda path: self.sizes[path] * 2**20,
+        ))
+        self.rss = self.enterContext(mock.patch.object(vosk_registry, 'rss_bytes', return_value=0))
+        self.pool = self.enterContext(mock.patch('gestion_asistente.recognizer_pool.get_pool')).return_value
+
+    def _loaded(self):
+        return sorted(version.name for version in vosk_registry._versions.values())
+
+    def _unloaded(self):
+        return [call.args[0].path for call in self.pool.discard_model.call_args_list]
+
+    def test_sessions_share_the_active_version(self):
+        first, model = vosk_registry.acquire()
+        second, same = vosk_registry.acquire('grande')
+        self.assertEqual((first, model), (second, same))
+        self.assertEqual(self.model.call_count, 1)
+        self.assertEqual(vosk_registry._versions[first].refs, 2)
+        stats = vosk_registry.model_stats()
+        self.assertEqual((stats['names']['grande']['misses'], stats['names']['grande']['hits']), (1, 1))
+
+        vosk_registry.release(first)
+        vosk_registry.release(second)
+        # La versión activa se queda cargada aunque no tenga sesiones
+        self.assertEqual(vosk_registry._versions[first].refs, 0)
+        self.assertEqual(self._loaded(), ['grande'])
+
+    def test_unknown_model(self):
+        with self.assertRaises(vosk_registry.ModelLoadError):
+            vosk_registry.acquire('otro')
+
+    @override_settings(VOSK_MODEL_CACHE_MB=1000)
+    def test_least_recently_used_idle_model_makes_room(self):
+        for name in ('grande', 'pequeno'):
+            vosk_registry.release(vosk_registry.acquire(name)[0])
+        # 600 + 300 + 300 no caben: sale el que lleva más tiempo sin sesiones
+        vosk_registry.acquire('movil')
+        self.assertEqual(self._loaded(), ['movil', 'pequeno'])
+        self.assertEqual(self._unloaded(), [self.paths['grande']])
+        self.assertEqual(vosk_registry.model_stats()['names']['grande']['evictions'], 1)
+
+        # Con sesiones en todos no se descarga ninguno
+        vosk_registry.acquire('pequeno')
+        with self.assertRaises(vosk_registry.ModelLoadError):
+            vosk_registry.acquire('grande')
+        self.assertEqual(self._loaded(), ['movil', 'pequeno'])
+
+    @override_settings(VOSK_MODEL_IDLE_TTL=60)
+    def test_idle_models_are_unloaded_except_the_default(self):
+        for name in ('grande', 'pequeno', 'movil'):
+            vosk_registry.release(vosk_registry.acquire(name)[0])
+        vosk_registry.acquire('movil')
+        for version in vosk_registry._versions.values():
+            version.last_used -= 120
+        vosk_registry.acquire('grande')
+        # "movil" tiene una sesión y "grande" es el modelo por defecto
+        self.assertEqual(self._loaded(), ['grande', 'movil'])
+        self.assertEqual(self._unloaded(), [self.paths['pequeno']])
+
+    @override_settings(VOSK_MODEL_MEMORY_LIMIT_MB=1000)
+    def test_memory_limit(self):
+        self.rss.return_value = 500 * 2**20
+        with self.assertRaises(vosk_registry.ModelLoadError):
+            vosk_registry.acquire('grande')
+        vosk_registry.acquire('pequeno')
+        self.assertEqual(self._loaded(), ['pequeno'])
+
+    def test_reload_keeps_the_old_version_for_its_sessions(self):
+        old, old_model = vosk_registry.acquire()
+        new = vosk_registry.reload()
+        self.assertGreater(new, old)
+        self.pool.prewarm.assert_called_once()
+        self.assertEqual(vosk_registry.acquire()[0], new)
+        self.assertEqual(self._unloaded(), [])
+
+        # La versión retirada se descarga con su última sesión
+        vosk_registry.release(old)
+        self.assertNotIn(old, vosk_registry._versions)
+        self.pool.discard_model.assert_called_once_with(old_model)
+        self.assertEqual(vosk_registry.model_stats()['models'][new]['state'], 'active')
+
+        # Sin sesiones la anterior se descarga en el momento
+        vosk_registry.release(new)
+        newest = vosk_registry.reload()
+        self.assertEqual(list(vosk_registry._versions), [newest])
+
+    def test_reload_while_loading(self):
+        with vosk_registry._load_lock:
+            with self.assertRaises(vosk_registry.ModelLoadError):
+                vosk_registry.reload()
+
+
+class ReloadModelViewTests(TestCase):
+    def setUp(self):
+        self.url = reverse('recargar_modelo_voz')
+        staff = User.objects.create_user('staff', password='x', is_staff=True)
+        self.client.force_login(staff)
+
+    def test_only_staff(self):
+        self.client.logout()
+        self.assertEqual(self.client.post(self.url).status_code, 403)
+
+    def test_rejects_unknown_model_name(self):
+        response = self.client.post(self.url, {'modelo': '../otro'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_rejects_paths(self):
+        response = self.client.post(self.url, {'ruta': '/tmp/modelo'})
+        self.assertEqual(response.status_code, 400)
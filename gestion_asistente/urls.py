@@ -17,6 +17,8 @@ urlpatterns = [
     path('login-voice/', views.login_voice, name='login_voice'),
     path('registro/', views.registro, name='registrarse'),
     path('registrarse/', views.registro, name='registro'),
+    path('api/voz/metricas/', views.metricas_voz, name='metricas_voz'),
+    path('api/voz/modelo/recargar/', views.recargar_modelo_voz, name='recargar_modelo_voz'),
     path('', include(router.urls))
   
 ] 
@@ -1,4 +1,9 @@
+import secrets
+
+from django.conf import settings
+from django.http import JsonResponse
 from django.shortcuts import render, redirect
+from django.views.decorators.http import require_POST
 from django.contrib.auth.forms import AuthenticationForm, UserCreationForm
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.models import User
@@ -7,6 +12,10 @@ from django import forms
 from rest_framework import viewsets
 from .serializer import asistenteSerializer
 from .models import asistente
+from . import asr_workers, vosk_registry
+from .admission import get_admission
+from .recognizer_pool import get_pool
+from .resume import get_parking
 
 # Formulario personalizado para registro
 class CustomUserCreationForm(UserCreationForm):
@@ -143,3 +152,54 @@ class asistenteView(viewsets.ModelViewSet):
     serializer_class = asistenteSerializer
     queryset = asistente.objects.all() 
 
+
+def metricas_voz(request):
+    """
+    Contadores del reconocimiento de voz de este proceso, para monitorización.
+    Acceso para staff o con la cabecera X-Metrics-Token = VOSK_METRICS_TOKEN.
+    """
+    token = getattr(settings, 'VOSK_METRICS_TOKEN', None)
+    recibido = request.headers.get('X-Metrics-Token', '')
+    if not (request.user.is_staff or (token and secrets.compare_digest(recibido, token))):
+        return JsonResponse({'error': 'No autorizado'}, status=403)
+
+    datos = {
+        'admision': get_admission().stats(),
+        'reconocedores': get_pool().stats(),
+        'modelos': vosk_registry.model_stats(),
+        'reanudacion': get_parking().stats(),
+    }
+    if asr_workers.is_enabled():
+        datos['procesos'] = asr_workers.get_process_pool().stats()
+    return JsonResponse(datos)
+
+
+@require_POST
+def recargar_modelo_voz(request):
+    """
+    Carga en segundo plano una versión nueva de un modelo Vosk (campo
+    'modelo', uno de los nombres de VOSK_MODELS; por defecto el modelo por
+    defecto) desde su directorio configurado y la activa para las sesiones
+    nuevas. No se aceptan rutas: sólo se cargan directorios configurados.
+    Sólo staff; el estado se consulta en /api/voz/metricas/.
+    """
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'No autorizado'}, status=403)
+    if 'ruta' in request.POST:
+        return JsonResponse({'error': "No se acepta 'ruta': el modelo se elige por nombre de VOSK_MODELS"}, status=400)
+    modelo = request.POST.get('modelo') or vosk_registry.default_name()
+    if modelo not in vosk_registry.model_paths():
+        return JsonResponse({'error': f'Modelo de voz desconocido: {modelo}'}, status=400)
+    if asr_workers.is_enabled():
+        return JsonResponse({'error': 'Con VOSK_ASR_MODE = process hay que reiniciar los workers'}, status=409)
+
+    try:
+        vosk_registry.reload_in_background(name=modelo)
+    except vosk_registry.ModelLoadError as e:
+        return JsonResponse({'error': str(e)}, status=409)
+    return JsonResponse({
+        'mensaje': 'Cargando modelo',
+        'modelo': modelo,
+        'ruta': vosk_registry.model_paths()[modelo],
+        'version_activa': vosk_registry.model_stats()['names'][modelo]['active'],
+    }, status=202)
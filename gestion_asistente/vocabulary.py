@@ -0,0 +1,164 @@
+"""
+Vocabulario de las compras por voz: comandos, números y catálogo.
+
+Decodificar contra un vocabulario pequeño es mucho más rápido y preciso que el
+modo abierto del modelo pequeño en español, sobre todo con nombres de
+productos. ``CatalogVocabulary`` mantiene en memoria los nombres de productos
+activos y de categorías, se actualiza con las señales de ``gestion_productos``
+(ver ``signals.py``) y genera la gramática JSON que acepta ``KaldiRecognizer``.
+"""
+import json
+import re
+import threading
+import time
+
+from django.conf import settings
+
+# Comandos que reconoce el frontend (Shop.jsx, CheckoutModal.jsx)
+COMMAND_PHRASES = (
+    'agregar', 'agrega', 'añadir', 'quitar', 'eliminar', 'remover',
+    'buscar', 'busca', 'encuentra', 'filtrar', 'mostrar solo', 'todos', 'todas',
+    'ver carrito', 'mostrar carrito', 'leer carrito', 'qué hay en el carrito',
+    'vaciar carrito', 'limpiar carrito', 'borrar carrito', 'eliminar todo del carrito',
+    'leer productos', 'listar productos', 'mostrar productos', 'qué productos hay',
+    'categorías', 'categoría', 'qué categorías hay', 'precio de', 'cuánto cuesta',
+    'cuánto es', 'cuánto debo', 'total', 'detalles', 'información',
+    'comprar', 'pagar', 'finalizar compra', 'terminar compra', 'proceder al pago',
+    'confirmar', 'confirmar compra', 'cancelar', 'continuar', 'siguiente',
+    'anterior', 'atrás', 'volver', 'cerrar', 'salir',
+    'con envío', 'sin envío', 'envío a domicilio', 'recoger en tienda', 'recogida en tienda',
+    'ayuda', 'comandos', 'qué puedo decir', 'de', 'unidades', 'por favor',
+)
+
+# Números hablados (cantidades); las decenas se combinan con "y" + unidad
+NUMBER_WORDS = {
+    'cero': 0, 'uno': 1, 'una': 1, 'un': 1,
+    'dos': 2, 'tres': 3, 'cuatro': 4, 'cinco': 5,
+    'seis': 6, 'siete': 7, 'ocho': 8, 'nueve': 9,
+    'diez': 10, 'once': 11, 'doce': 12, 'trece': 13,
+    'catorce': 14, 'quince': 15, 'dieciséis': 16, 'diecisiete': 17,
+    'dieciocho': 18, 'diecinueve': 19, 'veinte': 20, 'veintiuno': 21,
+    'veintiuna': 21, 'veintidós': 22, 'veintitrés': 23, 'veinticuatro': 24,
+    'veinticinco': 25, 'veintiséis': 26, 'veintisiete': 27, 'veintiocho': 28,
+    'veintinueve': 29, 'treinta': 30, 'cuarenta': 40, 'cincuenta': 50,
+    'sesenta': 60, 'setenta': 70, 'ochenta': 80, 'noventa': 90, 'cien': 100,
+}
+
+_NON_WORD = re.compile(r'[^\w\s]+')
+_SPACES = re.compile(r'\s+')
+
+
+def normalize(text):
+    """Minúsculas y sin signos de puntuación, conservando tildes (como el vocabulario de Vosk)"""
+    text = _NON_WORD.sub(' ', (text or '').lower())
+    return _SPACES.sub(' ', text).strip()
+
+
+class CatalogVocabulary:
+    """
+    Nombres del catálogo y gramática de reconocimiento derivada.
+
+    Los cambios de productos y categorías llegan uno a uno por señales y sólo
+    tocan su entrada; la gramática JSON se regenera una vez por versión, la
+    primera vez que se pide. Como cada proceso tiene su propia copia y las
+    señales sólo se reciben en el proceso que guarda, se recarga completa si
+    tiene más de ``VOSK_GRAMMAR_MAX_AGE`` segundos.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._products = {}
+        self._categories = {}
+        self._loaded_at = None
+        self.version = 0
+        self._grammar = None
+        self._grammar_version = -1
+
+    def _stale(self):
+        max_age = getattr(settings, 'VOSK_GRAMMAR_MAX_AGE', 300)
+        return self._loaded_at is None or (max_age and time.monotonic() - self._loaded_at > max_age)
+
+    def ensure_loaded(self):
+        """Carga el catálogo desde la base de datos si hace falta (llamar fuera del event loop)"""
+        if not self._stale():
+            return
+        from gestion_productos.models import categoria, producto
+
+        products = {
+            pk: normalize(nombre)
+            for pk, nombre in producto.objects.filter(estado=True).values_list('id', 'nombre')
+        }
+        categories = {
+            pk: normalize(nombre) for pk, nombre in categoria.objects.values_list('id', 'nombre')
+        }
+        with self._lock:
+            if products != self._products or categories != self._categories:
+                self._products = products
+                self._categories = categories
+                self.version += 1
+            self._loaded_at = time.monotonic()
+
+    def update_product(self, instance):
+        with self._lock:
+            name = normalize(instance.nombre) if instance.estado else None
+            if self._products.get(instance.pk) != name:
+                if name:
+                    self._products[instance.pk] = name
+                else:
+                    self._products.pop(instance.pk, None)
+                self.version += 1
+
+    def remove_product(self, pk):
+        with self._lock:
+            if self._products.pop(pk, None) is not None:
+                self.version += 1
+
+    def update_category(self, instance):
+        with self._lock:
+            name = normalize(instance.nombre)
+            if self._categories.get(instance.pk) != name:
+                self._categories[instance.pk] = name
+                self.version += 1
+
+    def remove_category(self, pk):
+        with self._lock:
+            if self._categories.pop(pk, None) is not None:
+                self.version += 1
+
+    def products(self):
+        """Copia de {id: nombre normalizado} de los productos activos"""
+        with self._lock:
+            return dict(self._products)
+
+    def categories(self):
+        with self._lock:
+            return dict(self._categories)
+
+    def phrases(self):
+        """Frases de la gramática: comandos, números, nombres y sus palabras sueltas"""
+        with self._lock:
+            names = set(self._products.values()) | set(self._categories.values())
+        phrases = set(COMMAND_PHRASES) | set(NUMBER_WORDS) | {'y'}
+        for name in names:
+            phrases.add(name)
+            # Palabras sueltas para "agregar dos leche" cuando el producto es "leche entera"
+            phrases.update(name.split())
+        phrases.discard('')
+        return sorted(phrases)
+
+    def grammar(self):
+        """Gramática JSON para ``KaldiRecognizer`` (cacheada por versión)"""
+        self.ensure_loaded()
+        version = self.version
+        if self._grammar_version != version:
+            grammar = json.dumps(self.phrases() + ['[unk]'], ensure_ascii=False)
+            with self._lock:
+                self._grammar, self._grammar_version = grammar, version
+        return self._grammar
+
+
+_vocabulary = CatalogVocabulary()
+
+
+def get_vocabulary():
+    return _vocabulary
@@ -0,0 +1,426 @@
+"""
+Registro de modelos Vosk compartidos por proceso.
+
+Cargar un ``vosk.Model`` tarda uno o dos segundos y ocupa cientos de MB, así que
+cada proceso (worker de daphne) lo carga una única vez y todas las conexiones
+de ``ws/voice/`` lo comparten. Cada sesión sólo crea su propio
+``KaldiRecognizer``, que es ligero.
+
+Un proceso puede servir varios modelos con nombre (``VOSK_MODELS``: el grande
+para escritorio, el pequeño para móvil, otras variantes regionales...). La
+sesión elige uno en el mensaje 'start'; se cargan la primera vez que alguien
+los pide y, si no caben en ``VOSK_MODEL_CACHE_MB``, se descargan primero los
+que llevan más tiempo sin sesiones (LRU). Los que no son el modelo por
+defecto también se descargan tras ``VOSK_MODEL_IDLE_TTL`` segundos sin uso.
+
+Cada carga es una versión numerada. ``reload`` carga una versión nueva de un
+modelo (otro directorio, o el mismo actualizado) sin cortar a nadie: las
+sesiones nuevas usan la versión activa y las que ya estaban conectadas siguen
+con la suya hasta desconectarse (``acquire`` / ``release`` cuentan las
+referencias). Una versión retirada se descarga al quedarse sin sesiones. Con
+``VOSK_MODEL_MEMORY_LIMIT_MB`` no se carga un modelo que no quepa junto a lo
+que ya hay en memoria, así que dos modelos grandes no coinciden.
+
+La recarga es por proceso: con varios workers de daphne hay que pedirla en
+cada uno.
+"""
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from vosk import Model
+
+logger = logging.getLogger(__name__)
+
+# Protege el registro; las cargas van aparte (``_load_lock``) para que las
+# sesiones sigan tomando los modelos cargados mientras se carga otro
+_lock = threading.Lock()
+_load_lock = threading.Lock()
+_versions = {}      # número de versión -> _Version
+_current = {}       # nombre del modelo -> número de su versión activa
+_counters = {}      # nombre del modelo -> contadores de uso y carga
+_next_version = 1
+_last_error = None  # último fallo de una recarga en segundo plano
+
+
+class ModelLoadError(Exception):
+    """No se puede cargar un modelo (ruta inexistente, memoria, otra carga en curso...)"""
+
+
+class _Version:
+    __slots__ = ('number', 'name', 'path', 'model', 'refs', 'size', 'last_used', 'stats')
+
+    def __init__(self, number, name, path, model, size, stats):
+        self.number = number
+        self.name = name
+        self.path = path
+        self.model = model
+        self.refs = 0
+        self.size = size
+        self.last_used = time.monotonic()
+        self.stats = stats
+
+
+def rss_bytes():
+    """Memoria residente actual del proceso en bytes (0 si no se puede medir)"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        # ru_maxrss es el pico (KB en Linux); mejor que nada fuera de Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except (ImportError, OSError):
+        return 0
+
+
+def _disk_bytes(path):
+    """Tamaño del directorio del modelo: estimación de lo que ocupará en memoria"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+# -- Modelos configurados ------------------------------------------------
+
+def model_paths():
+    """Modelos que se pueden pedir, por nombre (``VOSK_MODELS``)"""
+    return getattr(settings, 'VOSK_MODELS', None) or {'default': settings.VOSK_MODEL_PATH}
+
+
+def default_name():
+    """Modelo de las sesiones que no eligen ninguno"""
+    return getattr(settings, 'VOSK_DEFAULT_MODEL', None) or next(iter(model_paths()))
+
+
+def _counter(name):
+    return _counters.setdefault(name, {
+        'hits': 0, 'misses': 0, 'loads': 0, 'load_seconds': 0.0, 'evictions': 0,
+    })
+
+
+# -- Carga y descarga ----------------------------------------------------
+
+def _check_memory(path):
+    limit = getattr(settings, 'VOSK_MODEL_MEMORY_LIMIT_MB', None)
+    if not limit:
+        return
+    rss, needed = rss_bytes(), _disk_bytes(path)
+    if rss + needed > limit * 2**20:
+        in_use = sorted(v.number for v in _versions.values() if v.refs)
+        raise ModelLoadError(
+            f'Cargar {path} (~{needed / 2**20:.0f} MB) superaría VOSK_MODEL_MEMORY_LIMIT_MB={limit} '
+            f'(RSS actual {rss / 2**20:.0f} MB; versiones con sesiones: {in_use or "ninguna"})'
+        )
+
+
+def _make_room(needed):
+    """
+    Descarga los modelos sin sesiones menos usados hasta que ``needed`` bytes
+    quepan en ``VOSK_MODEL_CACHE_MB`` (con ``_load_lock`` tomado).
+    """
+    budget = getattr(settings, 'VOSK_MODEL_CACHE_MB', None)
+    if not budget:
+        return
+    budget *= 2**20
+    evicted = []
+    with _lock:
+        used = sum(version.size for version in _versions.values())
+        idle = sorted((v for v in _versions.values() if not v.refs), key=lambda v: v.last_used)
+        while used + needed > budget and idle:
+            version = idle.pop(0)
+            _forget(version)
+            used -= version.size
+            evicted.append(version)
+        fits = used + needed <= budget
+    for version in evicted:
+        _counter(version.name)['evictions'] += 1
+        _unload(version)
+    if not fits:
+        raise ModelLoadError(
+            'No hay sitio en VOSK_MODEL_CACHE_MB para otro modelo: todos los cargados tienen sesiones'
+        )
+
+
+def _load(path, name):
+    """Carga una versión nueva de ``path`` (con ``_load_lock`` tomado) y la registra"""
+    global _next_version
+    if not os.path.exists(path):
+        raise FileNotFoundError(f'Modelo Vosk no encontrado en {path}')
+    size = _disk_bytes(path)
+    _make_room(size)
+    _check_memory(path)
+
+    rss_before = rss_bytes()
+    started = time.perf_counter()
+    model = Model(path)
+    elapsed = time.perf_counter() - started
+    rss_after = rss_bytes()
+
+    with _lock:
+        version = _Version(_next_version, name, path, model, max(size, rss_after - rss_before), {
+            'load_seconds': round(elapsed, 3),
+            'rss_before_bytes': rss_before,
+            'rss_after_bytes': rss_after,
+            'rss_delta_bytes': max(rss_after - rss_before, 0),
+            'loaded_at': time.time(),
+        })
+        _versions[version.number] = version
+        _next_version += 1
+        counter = _counter(name)
+        counter['loads'] += 1
+        counter['load_seconds'] = round(counter['load_seconds'] + elapsed, 3)
+    logger.info(
+        'Modelo Vosk %s v%d cargado desde %s en %.2f s (RSS %.1f MB, +%.1f MB)',
+        name, version.number, path, elapsed, rss_after / 2**20, (rss_after - rss_before) / 2**20,
+    )
+    return version
+
+
+def _forget(version):
+    """Quita una versión del registro (con ``_lock`` tomado)"""
+    del _versions[version.number]
+    if _current.get(version.name) == version.number:
+        del _current[version.name]
+
+
+def _unload(version):
+    from .recognizer_pool import get_pool
+
+    # Los reconocedores libres del pool mantienen vivo el modelo
+    get_pool().discard_model(version.model)
+    logger.info('Modelo Vosk %s v%d (%s) descargado', version.name, version.number, version.path)
+
+
+def _evict_idle():
+    """Descarga los modelos que no son el de por defecto y llevan ``VOSK_MODEL_IDLE_TTL`` sin sesiones"""
+    ttl = getattr(settings, 'VOSK_MODEL_IDLE_TTL', None)
+    if not ttl:
+        return
+    now = time.monotonic()
+    keep = default_name()
+    with _lock:
+        expired = [
+            v for v in _versions.values()
+            if not v.refs and v.name != keep and now - v.last_used > ttl
+        ]
+        for version in expired:
+            _forget(version)
+    for version in expired:
+        _counter(version.name)['evictions'] += 1
+        _unload(version)
+
+
+def _active(name):
+    """Versión activa del modelo ``name``, cargándola si no está en memoria"""
+    paths = model_paths()
+    if name not in paths:
+        raise ModelLoadError(f'Modelo Vosk desconocido: {name}')
+    version = _versions.get(_current.get(name))
+    if version is not None:
+        return version
+    with _load_lock:
+        version = _versions.get(_current.get(name))
+        if version is None:
+            version = _load(paths[name], name)
+            with _lock:
+                _current[name] = version.number
+        return version
+
+
+# -- API -----------------------------------------------------------------
+
+def get_model(model_path=None):
+    """
+    Devuelve el modelo Vosk de ``model_path`` (por defecto, la versión activa
+    del modelo por defecto) cargándolo sólo la primera vez.
+
+    Es seguro llamarlo desde varios threads: si dos conexiones llegan a la vez
+    mientras el modelo se carga, la segunda espera a la primera en lugar de
+    cargar otra copia.
+    """
+    if model_path is None:
+        return _active(default_name()).model
+    for name, path in model_paths().items():
+        if path == model_path:
+            return _active(name).model
+    with _load_lock:
+        for version in _versions.values():
+            if version.path == model_path:
+                return version.model
+        return _load(model_path, model_path).model
+
+
+def acquire(name=None):
+    """
+    Versión activa del modelo ``name`` para una sesión (llamar desde un thread).
+
+    Returns:
+        (número de versión, modelo); la sesión la devuelve con ``release``
+        al desconectarse o al cambiar de modelo
+
+    Raises:
+        ModelLoadError: si el modelo no existe o no cabe en memoria
+    """
+    name = name or default_name()
+    _evict_idle()
+    loaded = _current.get(name) in _versions
+    while True:
+        version = _active(name)
+        with _lock:
+            # Si justo se retiró o se descargó, tomar la nueva versión activa
+            if _versions.get(version.number) is version:
+                version.refs += 1
+                version.last_used = time.monotonic()
+                _counter(name)['hits' if loaded else 'misses'] += 1
+                return version.number, version.model
+
+
+def release(number):
+    """Una sesión dejó la versión ``number``; se descarga si está retirada y sin sesiones"""
+    with _lock:
+        version = _versions.get(number)
+        if version is None:
+            return
+        version.refs -= 1
+        version.last_used = time.monotonic()
+        if version.refs > 0 or _current.get(version.name) == number:
+            return
+        del _versions[number]
+    _unload(version)
+
+
+def reload(model_path=None, name=None):
+    """
+    Carga una versión nueva de un modelo y la activa para las sesiones nuevas
+    (bloqueante).
+
+    Args:
+        model_path: directorio del modelo (por defecto el configurado para
+            ``name``, releído desde disco)
+        name: modelo de ``VOSK_MODELS`` (por defecto, el modelo por defecto)
+
+    Returns:
+        número de la versión nueva
+
+    Raises:
+        ModelLoadError: si hay otra carga en curso o el modelo no cabe en memoria
+    """
+    name = name or default_name()
+    path = model_path or model_paths()[name]
+    if not _load_lock.acquire(blocking=False):
+        raise ModelLoadError('Ya hay un modelo cargándose')
+    try:
+        version = _load(path, name)
+    finally:
+        _load_lock.release()
+
+    from .recognizer_pool import RecognizerConfig, get_pool
+
+    # Reconocedores listos antes de que llegue la primera sesión
+    get_pool().prewarm(version.model, RecognizerConfig())
+    with _lock:
+        previous = _versions.get(_current.get(name))
+        _current[name] = version.number
+        retired = previous if previous is not None and previous.refs == 0 else None
+        if retired is not None:
+            del _versions[retired.number]
+    if retired is not None:
+        _unload(retired)
+    logger.info('Modelo Vosk %s v%d activo', name, version.number)
+    return version.number
+
+
+def reload_in_background(model_path=None, name=None):
+    """
+    Lanza ``reload`` en un thread; las comprobaciones rápidas (nombre, ruta,
+    memoria, otra carga en curso) fallan aquí mismo con ``ModelLoadError``.
+    """
+    name = name or default_name()
+    if name not in model_paths():
+        raise ModelLoadError(f'Modelo Vosk desconocido: {name}')
+    path = model_path or model_paths()[name]
+    if not os.path.isdir(path):
+        raise ModelLoadError(f'Modelo Vosk no encontrado en {path}')
+    if _load_lock.locked():
+        raise ModelLoadError('Ya hay un modelo cargándose')
+    _check_memory(path)
+
+    def run():
+        global _last_error
+        try:
+            reload(path, name)
+            _last_error = None
+        except Exception as e:
+            _last_error = f'{name} ({path}): {e}'
+            logger.exception('No se pudo recargar el modelo Vosk %s desde %s', name, path)
+
+    thread = threading.Thread(target=run, name='vosk-reload', daemon=True)
+    thread.start()
+    return thread
+
+
+def is_loaded(model_path=None):
+    """Indica si el modelo (por defecto, el modelo por defecto) ya está en memoria en este proceso"""
+    if model_path is None:
+        return _current.get(default_name()) in _versions
+    return any(version.path == model_path for version in _versions.values())
+
+
+def preload(model_path=None):
+    """
+    Carga el modelo al arrancar el proceso (lo llama ``vocalcart/asgi.py``).
+    Los demás modelos de ``VOSK_MODELS`` se cargan cuando alguien los pide.
+
+    Un fallo aquí no debe impedir que arranque el servidor HTTP: se registra y
+    las conexiones de voz informarán el error cuando intenten usar el modelo.
+    """
+    if not getattr(settings, 'VOSK_PRELOAD', True):
+        return None
+    try:
+        return get_model(model_path)
+    except Exception:
+        logger.exception('No se pudo precargar el modelo Vosk')
+        return None
+
+
+def current_path(name=None):
+    """Directorio de la versión activa de ``name`` (el configurado si aún no se cargó)"""
+    name = name or default_name()
+    version = _versions.get(_current.get(name))
+    return version.path if version is not None else model_paths().get(name)
+
+
+def model_stats():
+    """Modelos y versiones cargadas con sus sesiones, aciertos, tiempo de carga y memoria"""
+    with _lock:
+        budget = getattr(settings, 'VOSK_MODEL_CACHE_MB', None)
+        return {
+            'rss_bytes': rss_bytes(),
+            'default': default_name(),
+            'cache_bytes': sum(version.size for version in _versions.values()),
+            'cache_limit_bytes': budget * 2**20 if budget else None,
+            'loading': _load_lock.locked(),
+            'last_error': _last_error,
+            'names': {
+                name: dict(_counter(name), path=path, active=_current.get(name))
+                for name, path in model_paths().items()
+            },
+            'models': {
+                number: dict(
+                    version.stats, name=version.name, path=version.path, sessions=version.refs,
+                    size_bytes=version.size,
+                    state='active' if _current.get(version.name) == number else 'retired',
+                )
+                for number, version in _versions.items()
+            },
+        }
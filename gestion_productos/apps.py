@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class GestionProductosConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'gestion_productos'
+
+    def ready(self):
+        # Mantener el índice de búsqueda aproximada al día con el catálogo
+        from . import signals  # noqa: F401
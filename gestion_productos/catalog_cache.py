@@ -0,0 +1,110 @@
+"""
+Copia cacheada del catálogo para ``/api/catalogo/``.
+
+La tienda pide el catálogo entero en cada visita aunque casi nunca cambia.
+Cada cambio de un producto o una categoría sube el contador de
+``version_catalogo`` (ver ``signals.py``) al confirmarse su transacción, y el
+catálogo de cada versión se serializa una sola vez. El JSON ya codificado se
+guarda en la caché de Django y, la última versión, también en memoria del
+proceso. Sin ``CACHES`` configurado la caché es ``LocMemCache``, propia de
+cada proceso: cada proceso serializa su copia una vez por versión. La versión
+sale de la base de datos, así que todos los procesos dan el mismo ETag. La
+vista usa el número de versión como ETag y su fecha como Last-Modified, así
+que un cliente con la versión actual recibe un 304 sin cuerpo y el servidor
+sólo lee una fila.
+
+La copia sólo lleva los productos activos (``estado=True``).
+
+Los cambios con ``queryset.update()`` o ``bulk_create`` no emiten señales: quien
+los haga debe llamar a ``bump()`` e incluir la fecha para la sincronización
+incremental: ``update(..., fecha_actualizacion=timezone.now())``.
+"""
+import json
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+_SNAPSHOT_KEY = 'catalogo:{}'
+
+_lock = threading.Lock()
+_last = (None, None)  # (versión, bytes) de la última copia servida por el proceso
+
+
+def current_version():
+    """(número, fecha) de la versión actual del catálogo"""
+    from .models import version_catalogo
+
+    row = version_catalogo.objects.filter(pk=1).values_list('numero', 'fecha_actualizacion').first()
+    return row or (0, None)
+
+
+def bump():
+    """
+    Nueva versión del catálogo al confirmarse la transacción en curso (en el
+    momento si no hay ninguna). Después del commit y no dentro de la
+    transacción: las escrituras concurrentes no se esperan por la fila del
+    contador, y la versión nueva nunca es visible antes que sus datos.
+    """
+    transaction.on_commit(_increment)
+
+
+def _increment():
+    from .models import version_catalogo
+
+    updated = version_catalogo.objects.filter(pk=1).update(numero=F('numero') + 1, fecha_actualizacion=timezone.now())
+    if not updated:
+        version_catalogo.objects.get_or_create(pk=1, defaults={'numero': 1})
+
+
+def get_snapshot(version):
+    """JSON codificado del catálogo en la versión ``version``"""
+    global _last
+    if _last[0] == version:
+        return _last[1]
+    key = _SNAPSHOT_KEY.format(version)
+    data = cache.get(key)
+    if data is None:
+        with _lock:
+            if _last[0] == version:
+                return _last[1]
+            data = _build(version)
+            cache.set(key, data, getattr(settings, 'CATALOG_CACHE_TIMEOUT', 3600))
+    _last = (version, data)
+    return data
+
+
+def product_rows(queryset):
+    """Productos tal como los envían /api/catalogo/ y /api/catalogo/cambios/"""
+    return list(
+        queryset.annotate(categoria_nombre=F('categoria__nombre')).values(
+            'id', 'nombre', 'referencia', 'precio', 'descripcion', 'imagen', 'stock', 'estado',
+            'categoria', 'categoria_nombre',
+        )
+    )
+
+
+def category_rows(queryset):
+    return list(queryset.values('id', 'nombre', 'descripcion'))
+
+
+def _build(version):
+    # La versión se lee antes que los datos: la copia nunca es más antigua que
+    # la versión con la que se guarda, ni que su token de sincronización
+    from .catalog_sync import encode_token
+    from .models import categoria, producto
+
+    token = encode_token(timezone.now())
+    return json.dumps(
+        {
+            'version': version,
+            'token': token,
+            'categorias': category_rows(categoria.objects.order_by('id')),
+            'productos': product_rows(producto.objects.filter(estado=True).order_by('id')),
+        },
+        cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':'),
+    ).encode()
@@ -0,0 +1,85 @@
+"""
+Avisos en tiempo real de cambios de stock, precio y estado (``ws/catalogo/``).
+
+Cada producto y cada categoría tienen un grupo del channel layer. Al guardar
+un producto se comparan ``stock``, ``precio`` y ``estado`` con los valores que
+tenía al cargarse y, cuando la transacción se confirma, se envía sólo lo que
+cambió al grupo del producto y al de su categoría. Si el producto cambió de
+categoría se envían todos los campos y la categoría nueva también al grupo de
+la anterior, cuyas conexiones lo dan por eliminado. Cada conexión junta los
+cambios que le llegan y los envía en lotes (ver ``consumers.py``), así que una
+ráfaga de ventas del mismo producto llega al cliente como un único mensaje con
+el último stock.
+"""
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# Campos que se avisan
+TRACKED_FIELDS = ('stock', 'precio', 'estado')
+
+
+def product_group(pk):
+    return f'catalogo.producto.{pk}'
+
+
+def category_group(pk):
+    return f'catalogo.categoria.{pk}'
+
+
+def remember(instance):
+    """
+    Guarda los valores con los que se cargó el producto (post_init). Sólo los
+    que están cargados: leer un campo diferido costaría una consulta
+    """
+    deferred = instance.get_deferred_fields()
+    instance._catalog_original = {
+        name: getattr(instance, name) for name in (*TRACKED_FIELDS, 'categoria_id') if name not in deferred
+    }
+
+
+def _value(name, value):
+    return str(value) if name == 'precio' else value
+
+
+def product_saved(instance, created):
+    """Publica los campos que cambiaron al confirmarse la transacción"""
+    original = getattr(instance, '_catalog_original', {})
+    # Si la categoría no se cargó no se sabe cuál era: no se avisa a la anterior
+    previous = original.get('categoria_id', instance.categoria_id)
+    moved = not created and previous != instance.categoria_id
+    diff = {'id': instance.pk}
+    for name in TRACKED_FIELDS:
+        value = getattr(instance, name)
+        if created or moved or name not in original or original[name] != value:
+            diff[name] = _value(name, value)
+    if created or moved:
+        diff['categoria'] = instance.categoria_id
+    remember(instance)
+    if len(diff) > 1:
+        _publish_on_commit(diff, instance.categoria_id, *([previous] if moved else []))
+
+
+def product_deleted(instance):
+    _publish_on_commit({'id': instance.pk, 'eliminado': True}, instance.categoria_id)
+
+
+def _publish_on_commit(diff, *categoria_ids):
+    groups = (product_group(diff['id']), *(category_group(pk) for pk in categoria_ids))
+    transaction.on_commit(lambda: publish(groups, [diff]))
+
+
+def publish(groups, diffs):
+    """Envía cambios de productos a los grupos (un error aquí no afecta al guardado)"""
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    try:
+        for group in groups:
+            async_to_sync(layer.group_send)(group, {'type': 'catalog.changes', 'productos': diffs})
+    except Exception:
+        logger.warning('No se pudieron publicar cambios del catálogo', exc_info=True)
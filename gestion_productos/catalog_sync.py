@@ -0,0 +1,102 @@
+"""
+Sincronización incremental del catálogo (``/api/catalogo/cambios/``).
+
+Un cliente que ya tiene el catálogo (de ``/api/catalogo/``, que incluye un
+token) pide sólo lo que cambió desde su token: productos y categorías con
+``fecha_actualizacion`` posterior (una lectura por rango del índice de esa
+columna), los desactivados (``estado=False``) y los eliminados, que se
+apuntan en ``eliminacion_catalogo`` desde las señales.
+
+``fecha_actualizacion`` se fija al guardar, no al confirmar la transacción:
+una escritura lenta puede aparecer con una fecha anterior a la de un token ya
+entregado. Por eso cada consulta vuelve a mirar ``CATALOG_SYNC_OVERLAP``
+segundos hacia atrás; el cliente aplica los cambios por id, así que recibir
+uno dos veces no importa.
+
+Las eliminaciones se guardan ``CATALOG_TOMBSTONE_DAYS`` días. Un token
+anterior a lo ya purgado recibe un 410 y el cliente vuelve a cargar el
+catálogo completo.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+
+from .catalog_cache import category_rows, product_rows
+
+
+class TokenExpired(Exception):
+    """El token es anterior a las eliminaciones purgadas"""
+
+
+def encode_token(moment):
+    """Token opaco para un instante (microsegundos desde 1970 en base 36)"""
+    micros = int(moment.timestamp() * 1_000_000)
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    token = ''
+    while True:
+        micros, rest = divmod(micros, 36)
+        token = digits[rest] + token
+        if not micros:
+            return token
+
+
+def decode_token(token):
+    """Instante de un token; ValueError si no es válido"""
+    micros = int(token, 36)
+    if micros < 0:
+        raise ValueError(token)
+    try:
+        return datetime.fromtimestamp(micros / 1_000_000, tz=dt_timezone.utc)
+    except (OverflowError, OSError):
+        raise ValueError(token)
+
+
+def record_deletion(modelo, pk):
+    """Apunta una eliminación y purga las que superan la retención"""
+    from .models import eliminacion_catalogo, version_catalogo
+
+    now = timezone.now()
+    eliminacion_catalogo.objects.create(modelo=modelo, objeto_id=pk, fecha=now)
+    cutoff = now - timedelta(days=getattr(settings, 'CATALOG_TOMBSTONE_DAYS', 30))
+    purged, _ = eliminacion_catalogo.objects.filter(fecha__lt=cutoff).delete()
+    if purged:
+        version_catalogo.objects.filter(pk=1).update(purgado_hasta=cutoff)
+
+
+def changes_since(token):
+    """
+    Cambios del catálogo desde ``token`` (None: el catálogo entero).
+
+    Raises:
+        ValueError: token no válido
+        TokenExpired: hay eliminaciones posteriores al token que ya se purgaron
+    """
+    from .models import categoria, eliminacion_catalogo, producto, version_catalogo
+
+    # El token nuevo se toma antes de leer: lo que cambie mientras tanto
+    # vuelve a salir en la siguiente consulta
+    now = timezone.now()
+    productos = producto.objects.order_by('fecha_actualizacion', 'id')
+    categorias = categoria.objects.order_by('fecha_actualizacion', 'id')
+    eliminados = {'productos': [], 'categorias': []}
+
+    if token is not None:
+        since = decode_token(token)
+        purged = version_catalogo.objects.filter(pk=1).values_list('purgado_hasta', flat=True).first()
+        if purged is not None and since < purged:
+            raise TokenExpired(token)
+        since -= timedelta(seconds=getattr(settings, 'CATALOG_SYNC_OVERLAP', 5))
+        productos = productos.filter(fecha_actualizacion__gte=since)
+        categorias = categorias.filter(fecha_actualizacion__gte=since)
+        for modelo, pk in eliminacion_catalogo.objects.filter(fecha__gte=since).values_list('modelo', 'objeto_id'):
+            eliminados[f'{modelo}s'].append(pk)
+
+    changed = product_rows(productos)
+    return {
+        'token': encode_token(now),
+        'categorias': category_rows(categorias),
+        'productos': [row for row in changed if row['estado']],
+        'desactivados': [row['id'] for row in changed if not row['estado']],
+        'eliminados': eliminados,
+    }
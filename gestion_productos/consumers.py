@@ -0,0 +1,105 @@
+import asyncio
+import json
+
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+
+from .catalog_events import category_group, product_group
+
+
+class CatalogEventsConsumer(AsyncWebsocketConsumer):
+    """
+    WebSocket con los cambios de stock, precio y estado de los productos a los
+    que se suscribe el cliente (ver catalog_events.py).
+
+    Cliente -> servidor:
+        {"type": "subscribe", "productos": [1, 2], "categorias": [3]}
+        {"type": "unsubscribe", "productos": [1], "categorias": []}
+    Servidor -> cliente:
+        {"type": "subscribed", "productos": [...], "categorias": [...]}
+        {"type": "catalog_changes", "productos": [{"id": 1, "stock": 4}, ...]}
+
+    Un producto que deja de estar en lo suscrito (pasó a otra categoría) llega
+    como ``{"id": 1, "eliminado": true}``.
+    """
+
+    async def connect(self):
+        self.groups_joined = set()
+        # Cambios pendientes de enviar, por id de producto
+        self.pending = {}
+        self.flush_task = None
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+        for group in self.groups_joined:
+            await self.channel_layer.group_discard(group, self.channel_name)
+        self.groups_joined.clear()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            data = json.loads(text_data or '')
+            msg_type = data.get('type')
+            groups = (
+                {product_group(int(pk)) for pk in data.get('productos', [])}
+                | {category_group(int(pk)) for pk in data.get('categorias', [])}
+            )
+        except (ValueError, TypeError, AttributeError):
+            await self._send_error('Mensaje no válido')
+            return
+
+        if msg_type == 'subscribe':
+            groups -= self.groups_joined
+            limit = getattr(settings, 'CATALOG_EVENTS_MAX_SUBSCRIPTIONS', 500)
+            if len(self.groups_joined) + len(groups) > limit:
+                await self._send_error(f'Como mucho {limit} suscripciones por conexión')
+                return
+            for group in groups:
+                await self.channel_layer.group_add(group, self.channel_name)
+            self.groups_joined |= groups
+        elif msg_type == 'unsubscribe':
+            groups &= self.groups_joined
+            for group in groups:
+                await self.channel_layer.group_discard(group, self.channel_name)
+            self.groups_joined -= groups
+        else:
+            await self._send_error(f'Tipo de mensaje desconocido: {msg_type}')
+            return
+        await self._send_subscriptions()
+
+    async def catalog_changes(self, event):
+        """Cambios publicados en un grupo: se juntan y se envían en el siguiente lote"""
+        for diff in event['productos']:
+            if 'categoria' in diff and not self._follows(diff):
+                # Llega por el grupo de la categoría de la que salió
+                diff = {'id': diff['id'], 'eliminado': True}
+            if diff.get('eliminado') or self.pending.get(diff['id'], {}).get('eliminado'):
+                self.pending[diff['id']] = diff
+            else:
+                self.pending.setdefault(diff['id'], {}).update(diff)
+        if self.flush_task is None:
+            self.flush_task = asyncio.ensure_future(self._flush_later())
+
+    def _follows(self, diff):
+        """Si la conexión sigue el producto en su categoría actual"""
+        return bool({product_group(diff['id']), category_group(diff['categoria'])} & self.groups_joined)
+
+    async def _flush_later(self):
+        await asyncio.sleep(getattr(settings, 'CATALOG_EVENTS_BATCH_INTERVAL', 0.25))
+        self.flush_task = None
+        pending, self.pending = self.pending, {}
+        if pending:
+            await self.send(text_data=json.dumps({'type': 'catalog_changes', 'productos': list(pending.values())}))
+
+    async def _send_subscriptions(self):
+        productos, categorias = [], []
+        for group in self.groups_joined:
+            _, kind, pk = group.split('.')
+            (productos if kind == 'producto' else categorias).append(int(pk))
+        await self.send(text_data=json.dumps({
+            'type': 'subscribed', 'productos': sorted(productos), 'categorias': sorted(categorias),
+        }))
+
+    async def _send_error(self, message):
+        await self.send(text_data=json.dumps({'type': 'error', 'message': message}))
@@ -0,0 +1,29 @@
+"""
+Filtros de las APIs del catálogo (django-filter).
+"""
+import django_filters
+
+from .models import categoria, producto
+
+
+class NumberInFilter(django_filters.BaseInFilter, django_filters.NumberFilter):
+    """Lista de números separados por comas: ?categoria=1,4"""
+
+
+class productoFilter(django_filters.FilterSet):
+    """?estado=true|false&categoria=1,4&actualizado_desde=<fecha ISO>"""
+    categoria = NumberInFilter(field_name='categoria_id')
+    actualizado_desde = django_filters.IsoDateTimeFilter(field_name='fecha_actualizacion', lookup_expr='gte')
+
+    class Meta:
+        model = producto
+        fields = ['estado', 'categoria']
+
+
+class categoriaFilter(django_filters.FilterSet):
+    """?actualizado_desde=<fecha ISO>"""
+    actualizado_desde = django_filters.IsoDateTimeFilter(field_name='fecha_actualizacion', lookup_expr='gte')
+
+    class Meta:
+        model = categoria
+        fields = []
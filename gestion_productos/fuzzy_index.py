@@ -0,0 +1,395 @@
+"""
+Índice de búsqueda aproximada de productos.
+
+Resuelve nombres mal reconocidos o mal escritos ("yogur griego" por "yogurt
+griego", "baso" por "vaso") sin recorrer el catálogo. Indexa las palabras de
+``producto.nombre``, ``producto.descripcion`` y ``categoria.nombre`` de los
+productos activos en tres niveles:
+
+- palabra exacta (sin tildes) -> productos que la contienen, por campo
+- clave fonética -> palabras que suenan igual
+- trigrama -> palabras que lo contienen, para encontrar las palabras a poca
+  distancia de edición
+
+Cada palabra de la consulta se expande a las palabras parecidas del
+vocabulario (no del catálogo completo), y los productos se puntúan sumando,
+por palabra de la consulta, la mejor coincidencia ponderada por campo. Los
+cambios llegan por señales (ver ``signals.py``) y sólo tocan el producto
+afectado. La reconstrucción periódica (``FUZZY_INDEX_MAX_AGE``) se hace en un
+thread sobre estructuras nuevas; las búsquedas siguen usando el índice
+anterior hasta que el nuevo está listo.
+
+``manage.py benchmark_fuzzy`` mide la latencia de las búsquedas sobre un
+catálogo sintético del tamaño que se quiera.
+"""
+import heapq
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from itertools import islice
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import connection
+
+from .text import edit_distance, phonetic_key, tokens, trigrams
+
+# Peso de cada campo en la puntuación
+WEIGHT_NAME = 3.0
+WEIGHT_CATEGORY = 2.0
+WEIGHT_DESCRIPTION = 1.0
+
+# Similitud de una palabra que suena igual pero se escribe distinto
+_PHONETIC_SIMILARITY = 0.9
+
+# Palabras con más productos que esto ("leche" en un supermercado) no se
+# recorren enteras: si la consulta tiene palabras más raras sólo se consultan
+# para sus candidatos, y si no, se toman como mucho este número de candidatos
+# empezando por el campo de más peso
+_DENSE_POSTING = 2000
+
+_EXPANSION_CACHE_SIZE = 4096
+
+# Estructuras que se reemplazan de una vez al reconstruir el índice
+_STATE = (
+    '_documents', '_product_category', '_category_words', '_products_by_category',
+    '_postings', '_phonetic', '_trigrams', '_expansions',
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _max_edits(word):
+    """Errores tolerados según la longitud de la palabra"""
+    if len(word) <= 3:
+        return 0
+    if len(word) <= 6:
+        return 1
+    return 2
+
+
+class FuzzyIndex:
+    """Índice incremental del catálogo activo para búsquedas aproximadas"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._documents = {}              # pk -> {palabra: peso}
+        self._product_category = {}       # pk -> id de categoría
+        self._category_words = {}         # id de categoría -> palabras
+        self._products_by_category = defaultdict(set)
+        self._postings = {}               # palabra -> {peso: {pk, ...}}
+        self._phonetic = defaultdict(set)  # clave fonética -> palabras
+        self._trigrams = defaultdict(set)  # trigrama -> palabras
+        self._expansions = {}
+        self._loaded_at = None
+        # Cambios llegados durante una reconstrucción (None si no hay ninguna)
+        self._changes = None
+
+    # -- Carga y actualización -------------------------------------------
+
+    def _stale(self):
+        max_age = getattr(settings, 'FUZZY_INDEX_MAX_AGE', 300)
+        return self._loaded_at is None or (max_age and time.monotonic() - self._loaded_at > max_age)
+
+    def ensure_loaded(self):
+        """
+        Construye el índice desde la base de datos la primera vez (llamar fuera
+        del event loop). Si después se queda viejo, lo reconstruye en un thread.
+        """
+        if self._loaded_at is None:
+            self.load(*self._read_catalog())
+        elif self._stale():
+            self._rebuild_in_background()
+
+    @staticmethod
+    def _read_catalog():
+        from .models import categoria, producto
+
+        categories = dict(categoria.objects.values_list('id', 'nombre'))
+        rows = list(
+            producto.objects.filter(estado=True).values_list('id', 'nombre', 'descripcion', 'categoria_id')
+        )
+        return categories, rows
+
+    def load(self, categories, rows):
+        """
+        Reemplaza el índice entero. Se construye aparte, sin el lock, y se
+        cambia de una vez.
+
+        Args:
+            categories: {id de categoría: nombre}
+            rows: (pk, nombre, descripcion, id de categoría) de los productos activos
+        """
+        fresh = FuzzyIndex()
+        for pk, nombre in categories.items():
+            fresh._category_words[pk] = set(tokens(nombre))
+        for pk, nombre, descripcion, categoria_id in rows:
+            fresh._add(pk, nombre, descripcion, categoria_id)
+        with self._lock:
+            for name in _STATE:
+                setattr(self, name, getattr(fresh, name))
+            # Lo que cambió mientras se construía puede no estar en ``rows``
+            for operation, args in self._changes or ():
+                getattr(self, operation)(*args)
+            self._changes = None
+            self._loaded_at = time.monotonic()
+
+    def _rebuild_in_background(self):
+        with self._lock:
+            if self._changes is not None:
+                return
+            self._changes = []
+
+        def run():
+            try:
+                self.load(*self._read_catalog())
+            except Exception:
+                logger.exception('No se pudo reconstruir el índice de búsqueda aproximada')
+                with self._lock:
+                    # Se reintenta cuando vuelva a quedarse viejo
+                    self._changes = None
+                    self._loaded_at = time.monotonic()
+            finally:
+                connection.close()
+
+        threading.Thread(target=run, name='fuzzy-index', daemon=True).start()
+
+    def _apply(self, operation, *args):
+        with self._lock:
+            getattr(self, operation)(*args)
+            if self._changes is not None:
+                self._changes.append((operation, args))
+
+    def _fields(self, nombre, descripcion, categoria_id):
+        words = {}
+        for word in tokens(descripcion):
+            words[word] = WEIGHT_DESCRIPTION
+        for word in self._category_words.get(categoria_id, ()):
+            words[word] = WEIGHT_CATEGORY
+        for word in tokens(nombre):
+            words[word] = WEIGHT_NAME
+        return words
+
+    def _add(self, pk, nombre, descripcion, categoria_id):
+        words = self._fields(nombre, descripcion, categoria_id)
+        self._documents[pk] = words
+        self._product_category[pk] = categoria_id
+        self._products_by_category[categoria_id].add(pk)
+        for word, weight in words.items():
+            self._link(word, pk, weight)
+
+    def _remove(self, pk):
+        words = self._documents.pop(pk, None)
+        if words is None:
+            return
+        categoria_id = self._product_category.pop(pk)
+        self._products_by_category[categoria_id].discard(pk)
+        for word, weight in words.items():
+            self._unlink(word, pk, weight)
+
+    def _link(self, word, pk, weight):
+        """Añade un producto a la lista de una palabra (y la palabra al vocabulario si es nueva)"""
+        posting = self._postings.get(word)
+        if posting is None:
+            posting = self._postings[word] = {}
+            self._phonetic[phonetic_key(word)].add(word)
+            for gram in trigrams(word):
+                self._trigrams[gram].add(word)
+            self._expansions.clear()
+        posting.setdefault(weight, set()).add(pk)
+
+    def _unlink(self, word, pk, weight):
+        """Quita un producto de la lista de una palabra (y la palabra, si se queda sin productos)"""
+        posting = self._postings[word]
+        members = posting[weight]
+        members.discard(pk)
+        if not members:
+            del posting[weight]
+        if posting:
+            return
+        del self._postings[word]
+        key = phonetic_key(word)
+        self._phonetic[key].discard(word)
+        if not self._phonetic[key]:
+            del self._phonetic[key]
+        for gram in trigrams(word):
+            self._trigrams[gram].discard(word)
+            if not self._trigrams[gram]:
+                del self._trigrams[gram]
+        self._expansions.clear()
+
+    def update_product(self, instance):
+        self._apply(
+            '_update_product', instance.pk, instance.nombre, instance.descripcion, instance.categoria_id,
+            instance.estado,
+        )
+
+    def _update_product(self, pk, nombre, descripcion, categoria_id, estado):
+        self._remove(pk)
+        if estado:
+            self._add(pk, nombre, descripcion, categoria_id)
+
+    def remove_product(self, pk):
+        self._apply('_remove', pk)
+
+    def update_category(self, instance):
+        """Reindexa los productos de la categoría con su nuevo nombre"""
+        self._apply('_update_category', instance.pk, instance.nombre)
+
+    def _update_category(self, pk, nombre):
+        words = set(tokens(nombre))
+        if self._category_words.get(pk) == words:
+            return
+        self._category_words[pk] = words
+        for product_pk in self._products_by_category.get(pk, ()):
+            self._reweight(product_pk, words)
+
+    def _reweight(self, pk, category_words):
+        """
+        Cambia las palabras de categoría de un producto sin releerlo: las
+        palabras que además están en el nombre o la descripción conservan
+        su peso (una palabra de la descripción que dejó de ser de la
+        categoría se pierde hasta el siguiente guardado o recarga).
+        """
+        document = self._documents[pk]
+        for word, weight in list(document.items()):
+            if weight == WEIGHT_CATEGORY and word not in category_words:
+                del document[word]
+                self._unlink(word, pk, weight)
+        for word in category_words:
+            weight = document.get(word)
+            if weight is None or weight < WEIGHT_CATEGORY:
+                if weight is not None:
+                    self._unlink(word, pk, weight)
+                document[word] = WEIGHT_CATEGORY
+                self._link(word, pk, WEIGHT_CATEGORY)
+
+    def remove_category(self, pk):
+        self._apply('_remove_category', pk)
+
+    def _remove_category(self, pk):
+        self._category_words.pop(pk, None)
+        # Sus productos se borran en cascada y llegan por remove_product
+        for product_pk in list(self._products_by_category.pop(pk, ())):
+            self._remove(product_pk)
+
+    # -- Búsqueda --------------------------------------------------------
+
+    def _expand(self, word):
+        """Palabras del vocabulario parecidas a ``word`` con su similitud (0-1]"""
+        cached = self._expansions.get(word)
+        if cached is not None:
+            return cached
+
+        similar = {}
+        if word in self._postings:
+            similar[word] = 1.0
+        for candidate in self._phonetic.get(phonetic_key(word), ()):
+            similar.setdefault(candidate, _PHONETIC_SIMILARITY)
+
+        # Una palabra que está en el catálogo (lo normal con el vocabulario
+        # del reconocedor) no necesita buscar parecidas por distancia
+        limit = _max_edits(word) if word not in self._postings else 0
+        if limit:
+            grams = trigrams(word)
+            shared = Counter()
+            for gram in grams:
+                shared.update(self._trigrams.get(gram, ()))
+            # Cada edición destruye como mucho 3 trigramas
+            minimum = max(len(grams) - 3 * limit, 1)
+            for candidate, count in shared.items():
+                if count < minimum or candidate in similar:
+                    continue
+                distance = edit_distance(word, candidate, limit)
+                if distance <= limit:
+                    similar[candidate] = 1.0 - distance / max(len(word), len(candidate))
+
+        if len(self._expansions) >= _EXPANSION_CACHE_SIZE:
+            self._expansions.clear()
+        self._expansions[word] = similar
+        return similar
+
+    def search(self, query, limit=10):
+        """
+        Productos activos que mejor coinciden con ``query``.
+
+        Returns:
+            lista de (pk, puntuación) de mayor a menor puntuación
+        """
+        self.ensure_loaded()
+        words = list(dict.fromkeys(tokens(query)))
+        if not words:
+            return []
+
+        with self._lock:
+            # Por palabra de la consulta: grupos (peso * similitud, productos)
+            # de mayor a menor valor, y cuántos productos suman
+            per_word = []
+            for word in words:
+                groups = [
+                    (weight * similarity, members)
+                    for candidate, similarity in self._expand(word).items()
+                    for weight, members in self._postings[candidate].items()
+                ]
+                if groups:
+                    groups.sort(key=itemgetter(0), reverse=True)
+                    per_word.append((sum(len(members) for _, members in groups), groups))
+
+            # Primero las palabras con menos productos
+            per_word.sort(key=itemgetter(0))
+            scores = {}
+            for size, groups in per_word:
+                if scores and size > _DENSE_POSTING:
+                    # Palabra frecuente: sólo puntúa a los candidatos que ya hay
+                    best = {}
+                    for pk in scores:
+                        for value, members in groups:
+                            if pk in members:
+                                best[pk] = value
+                                break
+                else:
+                    best = self._collect(groups, _DENSE_POSTING if size > _DENSE_POSTING else None)
+                if not scores:
+                    scores = best
+                    continue
+                for pk, value in best.items():
+                    scores[pk] = scores.get(pk, 0.0) + value
+
+        return [
+            (pk, round(score, 3))
+            for pk, score in heapq.nlargest(limit, scores.items(), key=itemgetter(1))
+        ]
+
+    @staticmethod
+    def _collect(groups, cap):
+        """{pk: mejor valor} de todos los grupos (como mucho ``cap`` productos)"""
+        best = {}
+        for value, members in groups:
+            # Los grupos van de mayor a menor valor: el primero que trae un
+            # producto le da su mejor valor (operaciones de conjuntos en C)
+            new = members.difference(best) if best else members
+            if cap is not None:
+                room = cap - len(best)
+                if room <= 0:
+                    break
+                if len(new) > room:
+                    new = islice(new, room)
+            best.update(dict.fromkeys(new, value))
+        return best
+
+    def stats(self):
+        with self._lock:
+            return {
+                'productos': len(self._documents),
+                'palabras': len(self._postings),
+                'claves_foneticas': len(self._phonetic),
+                'trigramas': len(self._trigrams),
+            }
+
+
+_index = FuzzyIndex()
+
+
+def get_fuzzy_index():
+    return _index
@@ -0,0 +1,119 @@
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion_asistente.benchmarking import percentiles
+from gestion_productos.fuzzy_index import FuzzyIndex
+
+# Sílabas para inventar palabras con forma de español
+_SYLLABLES = (
+    'ma', 'ne', 'ri', 'to', 'ca', 'lo', 'sa', 'pe', 'qui', 'ra', 'go', 'bu',
+    'che', 'za', 'lla', 've', 'fi', 'do', 'ce', 'gui', 'ho', 'ja', 'ba', 'si',
+)
+
+# Palabras que comparten muchos productos, como "leche" en un supermercado
+_COMMON = ('leche', 'pan', 'arroz', 'queso', 'jugo', 'galletas', 'aceite', 'yogur')
+
+# Cambios que suenan igual (ver text.phonetic_key)
+_PHONETIC = (('v', 'b'), ('z', 's'), ('ce', 'se'), ('ll', 'y'), ('qui', 'ki'), ('ho', 'o'))
+
+
+class Command(BaseCommand):
+    help = ('Mide la latencia del índice de búsqueda aproximada (FuzzyIndex) '
+            'sobre un catálogo sintético, sin base de datos')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--productos', type=int, default=100000, help='Productos del catálogo sintético')
+        parser.add_argument('--categorias', type=int, default=50, help='Categorías del catálogo sintético')
+        parser.add_argument('--consultas', type=int, default=500, help='Consultas por tipo')
+        parser.add_argument('--json', action='store_true', help='Imprimir el resultado como JSON')
+
+    def handle(self, *args, **options):
+        if options['productos'] < 1 or options['categorias'] < 1 or options['consultas'] < 1:
+            raise CommandError('--productos, --categorias y --consultas deben ser al menos 1')
+        rng = random.Random(0)
+        vocabulary = sorted({self._word(rng) for _ in range(max(options['productos'] // 5, 100))})
+        categories = {pk: f'categoria {self._word(rng)}' for pk in range(1, options['categorias'] + 1)}
+        rows = [
+            (
+                pk,
+                f'{rng.choice(_COMMON)} {rng.choice(vocabulary)} {rng.choice(vocabulary)}',
+                ' '.join(rng.choice(vocabulary) for _ in range(8)),
+                rng.randint(1, options['categorias']),
+            )
+            for pk in range(1, options['productos'] + 1)
+        ]
+
+        index = FuzzyIndex()
+        started = time.perf_counter()
+        index.load(categories, rows)
+        build = time.perf_counter() - started
+
+        count = options['consultas']
+        names = [rng.choice(rows)[1].split()[1:] for _ in range(count)]
+        queries = {
+            'exacta': [' '.join(words) for words in names],
+            'fonetica': [self._phonetic(words[0], rng) for words in names],
+            'errata': [self._typo(words[0], rng) for words in names],
+            'frecuente': [rng.choice(_COMMON) for _ in range(count)],
+            'frecuente_y_rara': [f'{rng.choice(_COMMON)} {words[0]}' for words in names],
+        }
+
+        results = []
+        for kind, batch in queries.items():
+            # Primera vez: sin las expansiones en caché; después, con ellas
+            cold = self._measure(index, batch)
+            warm = self._measure(index, batch)
+            results.append({
+                'consulta': kind,
+                'fria_ms': percentiles(cold),
+                'caliente_ms': percentiles(warm),
+            })
+
+        report = {
+            'productos': options['productos'],
+            'construccion_s': round(build, 3),
+            'indice': index.stats(),
+            'consultas': results,
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2, ensure_ascii=False))
+            return
+
+        self.stdout.write(
+            f'{report["productos"]} productos, índice construido en {report["construccion_s"]} s: {report["indice"]}'
+        )
+        self.stdout.write(f'{"consulta":<18} {"fría p50":>9} {"fría p99":>9} {"p50":>9} {"p95":>9} {"p99":>9}')
+        for row in results:
+            cold, warm = row['fria_ms'], row['caliente_ms']
+            self.stdout.write(
+                f'{row["consulta"]:<18} {cold["p50"]:>9} {cold["p99"]:>9} '
+                f'{warm["p50"]:>9} {warm["p95"]:>9} {warm["p99"]:>9}'
+            )
+
+    def _measure(self, index, queries):
+        latencies = []
+        for query in queries:
+            started = time.perf_counter()
+            index.search(query)
+            latencies.append(time.perf_counter() - started)
+        return latencies
+
+    def _word(self, rng):
+        return ''.join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+    def _phonetic(self, word, rng):
+        """La misma palabra escrita como suena (o con una sílaba cambiada si no hay cambio posible)"""
+        changes = [(a, b) for a, b in _PHONETIC if a in word]
+        if not changes:
+            return self._typo(word, rng)
+        a, b = rng.choice(changes)
+        return word.replace(a, b, 1)
+
+    def _typo(self, word, rng):
+        """Una letra cambiada"""
+        position = rng.randrange(len(word))
+        letter = rng.choice('abcdefghijklmnopqrstuvwxyz'.replace(word[position], ''))
+        return word[:position] + letter + word[position + 1:]
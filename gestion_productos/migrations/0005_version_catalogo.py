@@ -0,0 +1,26 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:53
+
+from django.db import migrations, models
+
+
+def crear_version(apps, schema_editor):
+    apps.get_model('gestion_productos', 'version_catalogo').objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_productos', '0004_alter_producto_imagen'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='version_catalogo',
+            fields=[
+                ('id', models.PositiveSmallIntegerField(default=1, primary_key=True, serialize=False)),
+                ('numero', models.PositiveBigIntegerField(default=0, verbose_name='Versión del catálogo')),
+                ('fecha_actualizacion', models.DateTimeField(auto_now=True, verbose_name='Última actualización')),
+            ],
+        ),
+        migrations.RunPython(crear_version, migrations.RunPython.noop),
+    ]
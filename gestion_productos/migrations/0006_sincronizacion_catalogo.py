@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-18 17:54
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_productos', '0005_version_catalogo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='eliminacion_catalogo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(choices=[('producto', 'Producto'), ('categoria', 'Categoría')], max_length=10, verbose_name='Tipo')),
+                ('objeto_id', models.IntegerField(verbose_name='Id eliminado')),
+                ('fecha', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Fecha de eliminación')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='version_catalogo',
+            name='purgado_hasta',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Eliminaciones purgadas hasta'),
+        ),
+        migrations.AlterField(
+            model_name='categoria',
+            name='fecha_actualizacion',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Última actualización'),
+        ),
+        migrations.AlterField(
+            model_name='producto',
+            name='fecha_actualizacion',
+            field=models.DateTimeField(auto_now=True, db_index=True, verbose_name='Última actualización'),
+        ),
+    ]
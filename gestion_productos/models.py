@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 # Create your models here.
 class categoria(models.Model):
@@ -6,7 +7,7 @@ class categoria(models.Model):
     nombre = models.CharField(max_length=35,verbose_name='Nombre de la categoría')
     descripcion = models.TextField(blank=True,null=True,verbose_name='Descripción de la categoría')
     fecha_creacion = models.DateTimeField(auto_now_add=True,verbose_name='Fecha de creación')
-    fecha_actualizacion = models.DateTimeField(auto_now=True,verbose_name='Última actualización')
+    fecha_actualizacion = models.DateTimeField(auto_now=True,db_index=True,verbose_name='Última actualización')
 
     def __str__(self):
         return self.nombre
@@ -22,8 +23,39 @@ class producto(models.Model):
     estado = models.BooleanField(default=True,verbose_name='Estado del producto')
     categoria = models.ForeignKey(categoria,on_delete=models.CASCADE,verbose_name='Categoría del producto')
     fecha_creacion = models.DateTimeField(auto_now_add=True,verbose_name='Fecha de creación')
-    fecha_actualizacion = models.DateTimeField(auto_now=True,verbose_name='Última actualización')
+    fecha_actualizacion = models.DateTimeField(auto_now=True,db_index=True,verbose_name='Última actualización')
 
 
     def __str__(self):
         return self.nombre
+
+
+class version_catalogo(models.Model):
+    """
+    Contador que sube con cada cambio de productos o categorías (ver
+    ``signals.py``). Una sola fila; identifica la copia cacheada del catálogo
+    y sirve de ETag de /api/catalogo/.
+    """
+    id = models.PositiveSmallIntegerField(primary_key=True, default=1)
+    numero = models.PositiveBigIntegerField(default=0, verbose_name='Versión del catálogo')
+    fecha_actualizacion = models.DateTimeField(auto_now=True, verbose_name='Última actualización')
+    # Eliminaciones anteriores a esta fecha ya no están en eliminacion_catalogo
+    purgado_hasta = models.DateTimeField(blank=True, null=True, verbose_name='Eliminaciones purgadas hasta')
+
+    def __str__(self):
+        return f'Catálogo v{self.numero}'
+
+
+class eliminacion_catalogo(models.Model):
+    """
+    Registro de un producto o una categoría eliminados, para que
+    /api/catalogo/cambios/ pueda avisar a los clientes (ver ``catalog_sync.py``)
+    """
+    MODELOS = [('producto', 'Producto'), ('categoria', 'Categoría')]
+
+    modelo = models.CharField(max_length=10, choices=MODELOS, verbose_name='Tipo')
+    objeto_id = models.IntegerField(verbose_name='Id eliminado')
+    fecha = models.DateTimeField(default=timezone.now, db_index=True, verbose_name='Fecha de eliminación')
+
+    def __str__(self):
+        return f'{self.modelo} {self.objeto_id}'
@@ -0,0 +1,41 @@
+"""
+Paginación por cursor de las APIs del catálogo.
+
+Con ``?page=N`` la base de datos tiene que contar y saltar las filas
+anteriores, y la tabla puede cambiar entre una página y la siguiente. El
+cursor guarda la posición (``id`` o ``fecha_actualizacion`` del último
+elemento), así que cada página es una consulta por índice que no depende de lo
+lejos que esté ni se salta filas cuando se añaden productos.
+"""
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class CatalogCursorPagination(CursorPagination):
+    """
+    ``?cursor=`` para avanzar, ``?page_size=`` para el tamaño de página y
+    ``?ordering=id|-id|fecha_actualizacion|-fecha_actualizacion``.
+
+    Sólo se pagina si la petición trae ``?cursor=`` o ``?page_size=``: sin
+    ellos la respuesta sigue siendo la lista completa de siempre, para los
+    clientes que no conocen la paginación.
+    """
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+
+    def __init__(self):
+        self.page_size = getattr(settings, 'CATALOG_PAGE_SIZE', 50)
+        self.max_page_size = getattr(settings, 'CATALOG_MAX_PAGE_SIZE', 500)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        # Con fecha_actualizacion repetida, el id desempata
+        if ordering[0].lstrip('-') != 'id':
+            ordering = (*ordering, '-id' if ordering[0].startswith('-') else 'id')
+        return ordering
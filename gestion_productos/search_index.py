@@ -0,0 +1,346 @@
+"""
+Índice invertido para la búsqueda de productos (``/api/producto/buscar/``).
+
+La tienda buscaba descargando el catálogo entero y filtrando subcadenas en el
+navegador. Este índice vive en el proceso y responde sin recorrer el
+catálogo: cada palabra de ``producto.nombre``, ``producto.descripcion`` y
+``categoria.nombre`` se pliega (sin tildes ni mayúsculas) y se reduce a su raíz
+(``text.stem``: "tomates" y "tomate" coinciden), y cada raíz apunta a los
+productos que la contienen ordenados por su peso en el producto.
+
+Los resultados se ordenan con BM25 sobre los campos ponderados (el nombre pesa
+más que la categoría y ésta más que la descripción). De cada término se
+consideran como mucho ``_CANDIDATES`` productos, los de más peso, así que el
+coste de una búsqueda no crece con el catálogo. La última palabra de la
+consulta también se busca como prefijo, para buscar mientras se escribe.
+Los cambios llegan por señales (ver ``signals.py``) y sólo tocan el producto
+afectado. La reconstrucción periódica (``PRODUCT_SEARCH_MAX_AGE``) se hace en
+un thread sobre estructuras nuevas; las búsquedas siguen usando el índice
+anterior hasta que el nuevo está listo. ``fuzzy_index`` sigue resolviendo las
+palabras mal reconocidas por la voz.
+"""
+import heapq
+import logging
+import math
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import defaultdict
+from itertools import islice
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import connection
+
+from .fuzzy_index import WEIGHT_CATEGORY, WEIGHT_DESCRIPTION, WEIGHT_NAME
+from .text import stem, tokens
+
+# Parámetros de BM25
+_K1 = 1.2
+_B = 0.75
+
+# Productos de más peso que se consideran por término de la consulta
+_CANDIDATES = 500
+
+# Términos que completan la última palabra, y cuánto valen frente a la exacta
+_PREFIX_TERMS = 8
+_PREFIX_WEIGHT = 0.7
+
+# Estructuras que se reemplazan de una vez al reconstruir el índice
+_STATE = (
+    '_documents', '_terms', '_lengths', '_impacts', '_total_length', '_postings', '_vocabulary',
+    '_category_words', '_products_by_category',
+)
+
+logger = logging.getLogger(__name__)
+
+
+class SearchIndex:
+    """Índice invertido incremental del catálogo activo"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._documents = {}              # pk -> (palabras del nombre, de la descripción, id de categoría)
+        self._terms = {}                  # pk -> {raíz: frecuencia ponderada}
+        self._lengths = {}                # pk -> longitud ponderada
+        self._impacts = {}                # pk -> {raíz: impacto con el que está en la lista}
+        self._total_length = 0.0
+        self._postings = {}               # raíz -> [(-impacto, pk), ...] ordenada
+        self._vocabulary = []             # raíces ordenadas, para los prefijos
+        self._category_words = {}         # id de categoría -> palabras
+        self._products_by_category = defaultdict(set)
+        self._loaded_at = None
+        # Cambios llegados durante una reconstrucción (None si no hay ninguna)
+        self._changes = None
+
+    # -- Carga y actualización -------------------------------------------
+
+    def _stale(self):
+        max_age = getattr(settings, 'PRODUCT_SEARCH_MAX_AGE', 300)
+        return self._loaded_at is None or (max_age and time.monotonic() - self._loaded_at > max_age)
+
+    def ensure_loaded(self):
+        """
+        Construye el índice desde la base de datos la primera vez (llamar fuera
+        del event loop). Si después se queda viejo, lo reconstruye en un thread.
+        """
+        if self._loaded_at is None:
+            self.load(*self._read_catalog())
+        elif self._stale():
+            self._rebuild_in_background()
+
+    @staticmethod
+    def _read_catalog():
+        from .models import categoria, producto
+
+        categories = dict(categoria.objects.values_list('id', 'nombre'))
+        rows = list(
+            producto.objects.filter(estado=True).values_list('id', 'nombre', 'descripcion', 'categoria_id')
+        )
+        return categories, rows
+
+    def load(self, categories, rows):
+        """
+        Reemplaza el índice entero. Se construye aparte, sin el lock, y se
+        cambia de una vez.
+
+        Args:
+            categories: {id de categoría: nombre}
+            rows: (pk, nombre, descripcion, id de categoría) de los productos activos
+        """
+        fresh = SearchIndex()
+        for pk, nombre in categories.items():
+            fresh._category_words[pk] = tokens(nombre)
+        for pk, nombre, descripcion, categoria_id in rows:
+            fresh._add(pk, tokens(nombre), tokens(descripcion), categoria_id, bulk=True)
+        # En la carga completa se ordena una vez al final
+        for posting in fresh._postings.values():
+            posting.sort()
+        fresh._vocabulary = sorted(fresh._postings)
+        with self._lock:
+            for name in _STATE:
+                setattr(self, name, getattr(fresh, name))
+            # Lo que cambió mientras se construía puede no estar en ``rows``
+            for operation, args in self._changes or ():
+                getattr(self, operation)(*args)
+            self._changes = None
+            self._loaded_at = time.monotonic()
+
+    def _rebuild_in_background(self):
+        with self._lock:
+            if self._changes is not None:
+                return
+            self._changes = []
+
+        def run():
+            try:
+                self.load(*self._read_catalog())
+            except Exception:
+                logger.exception('No se pudo reconstruir el índice de búsqueda de productos')
+                with self._lock:
+                    # Se reintenta cuando vuelva a quedarse viejo
+                    self._changes = None
+                    self._loaded_at = time.monotonic()
+            finally:
+                connection.close()
+
+        threading.Thread(target=run, name='search-index', daemon=True).start()
+
+    def _apply(self, operation, *args):
+        with self._lock:
+            getattr(self, operation)(*args)
+            if self._changes is not None:
+                self._changes.append((operation, args))
+
+    def _add(self, pk, name_words, description_words, categoria_id, bulk=False):
+        terms = defaultdict(float)
+        for words, weight in (
+            (name_words, WEIGHT_NAME),
+            (self._category_words.get(categoria_id, ()), WEIGHT_CATEGORY),
+            (description_words, WEIGHT_DESCRIPTION),
+        ):
+            for word in words:
+                terms[stem(word)] += weight
+        length = sum(terms.values())
+
+        self._documents[pk] = (name_words, description_words, categoria_id)
+        self._products_by_category[categoria_id].add(pk)
+        self._terms[pk] = terms
+        self._lengths[pk] = length
+        self._total_length += length
+
+        # El impacto ordena la lista de cada término; la puntuación exacta se
+        # calcula al buscar con la longitud media de ese momento
+        norm = self._norm(length)
+        impacts = self._impacts[pk] = {}
+        for term, frequency in terms.items():
+            impact = impacts[term] = frequency * (_K1 + 1) / (frequency + norm)
+            posting = self._postings.get(term)
+            if posting is None:
+                posting = self._postings[term] = []
+                if not bulk:
+                    insort(self._vocabulary, term)
+            if bulk:
+                posting.append((-impact, pk))
+            else:
+                insort(posting, (-impact, pk))
+
+    def _remove(self, pk):
+        document = self._documents.pop(pk, None)
+        if document is None:
+            return
+        self._products_by_category[document[2]].discard(pk)
+        del self._terms[pk]
+        self._total_length -= self._lengths.pop(pk)
+        for term, impact in self._impacts.pop(pk).items():
+            posting = self._postings[term]
+            del posting[bisect_left(posting, (-impact, pk))]
+            if not posting:
+                del self._postings[term]
+                del self._vocabulary[bisect_left(self._vocabulary, term)]
+
+    def _norm(self, length):
+        average = self._total_length / len(self._documents) if self._documents else length
+        return _K1 * (1 - _B + _B * length / (average or 1.0))
+
+    def update_product(self, instance):
+        self._apply(
+            '_update_product', instance.pk, tokens(instance.nombre), tokens(instance.descripcion),
+            instance.categoria_id, instance.estado,
+        )
+
+    def _update_product(self, pk, name_words, description_words, categoria_id, estado):
+        self._remove(pk)
+        if estado:
+            self._add(pk, name_words, description_words, categoria_id)
+
+    def remove_product(self, pk):
+        self._apply('_remove', pk)
+
+    def update_category(self, instance):
+        """Reindexa los productos de la categoría con su nuevo nombre"""
+        self._apply('_update_category', instance.pk, tokens(instance.nombre))
+
+    def _update_category(self, pk, words):
+        if self._category_words.get(pk) == words:
+            return
+        self._category_words[pk] = words
+        for product_pk in list(self._products_by_category.get(pk, ())):
+            document = self._documents[product_pk]
+            self._remove(product_pk)
+            self._add(product_pk, *document)
+
+    def remove_category(self, pk):
+        self._apply('_remove_category', pk)
+
+    def _remove_category(self, pk):
+        self._category_words.pop(pk, None)
+        # Sus productos se borran en cascada y llegan por remove_product
+        for product_pk in list(self._products_by_category.pop(pk, ())):
+            self._remove(product_pk)
+
+    # -- Búsqueda --------------------------------------------------------
+
+    def _prefixed(self, word):
+        """Términos del vocabulario que empiezan por ``word``, los de más productos primero"""
+        start = bisect_left(self._vocabulary, word)
+        matches = []
+        for term in islice(self._vocabulary, start, None):
+            if not term.startswith(word):
+                break
+            matches.append(term)
+        if len(matches) > _PREFIX_TERMS:
+            matches = heapq.nlargest(_PREFIX_TERMS, matches, key=lambda term: len(self._postings[term]))
+        return matches
+
+    def search(self, query, limit=20, categoria=None, prefix=True):
+        """
+        Productos activos que mejor coinciden con ``query``.
+
+        Args:
+            categoria: id de categoría para limitar la búsqueda
+            prefix: buscar también la última palabra como prefijo
+
+        Returns:
+            lista de (pk, puntuación) de mayor a menor puntuación
+        """
+        self.ensure_loaded()
+        words = list(dict.fromkeys(tokens(query)))
+        if not words:
+            return []
+
+        with self._lock:
+            total = len(self._documents)
+            # Por palabra de la consulta: [(raíz, factor, idf), ...]
+            groups = []
+            for i, word in enumerate(words):
+                options = {stem(word): 1.0}
+                if prefix and i == len(words) - 1 and len(word) >= 2:
+                    for term in self._prefixed(word):
+                        options.setdefault(term, _PREFIX_WEIGHT)
+                group = []
+                for term, factor in options.items():
+                    posting = self._postings.get(term)
+                    if posting:
+                        idf = math.log(1 + (total - len(posting) + 0.5) / (len(posting) + 0.5))
+                        group.append((term, factor, idf))
+                if group:
+                    groups.append(group)
+            if not groups:
+                return []
+
+            # Con categoría, los de la categoría de más peso en cada término:
+            # se recorre lo que sea más corto, la lista del término o la categoría
+            members = self._products_by_category.get(categoria, set()) if categoria is not None else None
+            candidates = set()
+            for group in groups:
+                for term, _, _ in group:
+                    posting = self._postings[term]
+                    if members is None:
+                        found = (pk for _, pk in islice(posting, _CANDIDATES))
+                    elif len(members) < len(posting):
+                        impacts = self._impacts
+                        found = (pk for _, pk in heapq.nsmallest(_CANDIDATES, (
+                            (-impacts[pk][term], pk) for pk in members if term in impacts[pk]
+                        )))
+                    else:
+                        found = islice((pk for _, pk in posting if pk in members), _CANDIDATES)
+                    candidates.update(found)
+
+            scores = []
+            for pk in candidates:
+                terms = self._terms[pk]
+                norm = self._norm(self._lengths[pk])
+                score = 0.0
+                matched = 0
+                for group in groups:
+                    best = 0.0
+                    for term, factor, idf in group:
+                        frequency = terms.get(term)
+                        if frequency:
+                            best = max(best, factor * idf * frequency * (_K1 + 1) / (frequency + norm))
+                    if best:
+                        score += best
+                        matched += 1
+                # Los que contienen todas las palabras de la consulta van delante
+                scores.append((pk, score * matched / len(groups)))
+
+        return [
+            (pk, round(score, 3))
+            for pk, score in heapq.nlargest(limit, scores, key=itemgetter(1))
+        ]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'productos': len(self._documents),
+                'terminos': len(self._postings),
+                'longitud_media': round(self._total_length / len(self._documents), 2) if self._documents else 0,
+            }
+
+
+_index = SearchIndex()
+
+
+def get_search_index():
+    return _index
@@ -1,12 +1,38 @@
 from rest_framework import serializers
 from .models import categoria, producto
 
-class categoriaSerializer(serializers.ModelSerializer):
+
+def requested_fields(request, available):
+    """
+    Campos pedidos con ?fields=a,b en una petición GET que existen en
+    ``available``; None si no se pidió ninguno válido (se envían todos)
+    """
+    if request is None or request.method != 'GET':
+        return None
+    value = request.query_params.get('fields')
+    if not value:
+        return None
+    wanted = {name.strip() for name in value.split(',')} & set(available)
+    return wanted or None
+
+
+class SparseFieldsMixin:
+    """Respuestas parciales: con ?fields=id,nombre sólo se serializan esos campos"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        wanted = requested_fields(self.context.get('request'), self.fields)
+        if wanted:
+            for name in set(self.fields) - wanted:
+                self.fields.pop(name)
+
+
+class categoriaSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = categoria
         fields = '__all__'
 
-class productoSerializer(serializers.ModelSerializer):
+class productoSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     categoria_nombre = serializers.CharField(source='categoria.nombre', read_only=True)
     
     class Meta:
@@ -0,0 +1,50 @@
+"""
+Mantiene los índices de búsqueda (aproximada y de texto completo) al día con
+los cambios del catálogo, apunta las eliminaciones para la sincronización
+incremental, sube la versión del catálogo cacheado y avisa de los cambios de
+stock, precio y estado a los clientes suscritos.
+"""
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import catalog_cache, catalog_events, catalog_sync
+from .fuzzy_index import get_fuzzy_index
+from .models import categoria, producto
+from .search_index import get_search_index
+
+
+@receiver(post_init, sender=producto)
+def producto_cargado(sender, instance, **kwargs):
+    catalog_events.remember(instance)
+
+
+@receiver(post_save, sender=producto)
+def producto_guardado(sender, instance, created, **kwargs):
+    get_fuzzy_index().update_product(instance)
+    get_search_index().update_product(instance)
+    catalog_events.product_saved(instance, created)
+    catalog_cache.bump()
+
+
+@receiver(post_delete, sender=producto)
+def producto_eliminado(sender, instance, **kwargs):
+    get_fuzzy_index().remove_product(instance.pk)
+    get_search_index().remove_product(instance.pk)
+    catalog_sync.record_deletion('producto', instance.pk)
+    catalog_events.product_deleted(instance)
+    catalog_cache.bump()
+
+
+@receiver(post_save, sender=categoria)
+def categoria_guardada(sender, instance, **kwargs):
+    get_fuzzy_index().update_category(instance)
+    get_search_index().update_category(instance)
+    catalog_cache.bump()
+
+
+@receiver(post_delete, sender=categoria)
+def categoria_eliminada(sender, instance, **kwargs):
+    get_fuzzy_index().remove_category(instance.pk)
+    get_search_index().remove_category(instance.pk)
+    catalog_sync.record_deletion('categoria', instance.pk)
+    catalog_cache.bump()
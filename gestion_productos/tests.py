@@ -1,3 +1,476 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import catalog_cache
+from .catalog_sync import TokenExpired, changes_since, decode_token, encode_token, record_deletion
+from .consumers import CatalogEventsConsumer
+from .fuzzy_index import FuzzyIndex
+from .models import categoria, eliminacion_catalogo, producto, version_catalogo
+from .search_index import SearchIndex
+from .text import edit_distance, fold, phonetic_key, stem, tokens, trigrams
+
+
+def _join(name):
+    """Espera a los threads en segundo plano llamados ``name``"""
+    for thread in threading.enumerate():
+        if thread.name == name:
+            thread.join(5)
+
+
+class PhoneticKeyTests(SimpleTestCase):
+    def test_same_sound_same_key(self):
+        for a, b in (('vaca', 'baca'), ('zapato', 'sapato'), ('queso', 'keso'), ('llave', 'yave'),
+                     ('hielo', 'ielo'), ('cereza', 'sereza'), ('Azúcar', 'asucar'), ('gente', 'jente')):
+            with self.subTest(a=a, b=b):
+                self.assertEqual(phonetic_key(a), phonetic_key(b))
+
+    def test_different_sound_different_key(self):
+        # "gui" suena /gi/ y "gi" suena /xi/
+        self.assertNotEqual(phonetic_key('guiso'), phonetic_key('giso'))
+        self.assertNotEqual(phonetic_key('casa'), phonetic_key('gasa'))
+
+    def test_trigrams_mark_word_edges(self):
+        self.assertEqual(trigrams('pan'), {'^pa', 'pan', 'an$'})
+
+    def test_edit_distance_stops_at_limit(self):
+        self.assertEqual(edit_distance('yogurt', 'yogur', 2), 1)
+        self.assertEqual(edit_distance('galletas', 'galeltas', 2), 2)
+        self.assertEqual(edit_distance('leche', 'arroz', 2), 3)
+
+
+class TextTests(SimpleTestCase):
+    def test_fold_and_tokens(self):
+        self.assertEqual(fold('Azúcar Morena'), 'azucar morena')
+        self.assertEqual(fold(None), '')
+        self.assertEqual(tokens('Pingüino, 1/2 kg. (ÑANDÚ)'), ['pinguino', '1', '2', 'kg', 'nandu'])
+
+    def test_stem_plural_and_gender(self):
+        for a, b in (('tomates', 'tomate'), ('galletas', 'galleta'), ('leches', 'leche'), ('arroces', 'arroz')):
+            with self.subTest(a=a, b=b):
+                self.assertEqual(stem(a), stem(b))
+        self.assertEqual(stem('pan'), 'pan')
+        self.assertEqual(stem('2024'), '2024')
+
+
+class FuzzyIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = FuzzyIndex()
+        self.index.load(
+            {1: 'Bebidas', 2: 'Hogar'},
+            [
+                (1, 'Vaso de vidrio', 'Vaso resistente para bebidas', 2),
+                (2, 'Yogur griego', 'Yogur natural cremoso', 1),
+                (3, 'Galletas de avena', 'Galletas integrales', 1),
+                (4, 'Zapatos de casa', 'Calzado cómodo', 2),
+                (5, 'Jarra', 'Jarra de vidrio para servir bebidas', 2),
+            ],
+        )
+
+    def _ids(self, query):
+        return [pk for pk, _ in self.index.search(query)]
+
+    def test_phonetic_match(self):
+        # "baso" suena como "vaso" aunque esté a una letra de distancia
+        self.assertEqual(self._ids('baso')[0], 1)
+        self.assertEqual(self._ids('sapatos'), [4])
+
+    def test_trigram_match_within_edit_distance(self):
+        self.assertEqual(self._ids('yogurt griego'), [2])
+        self.assertEqual(self._ids('galeltas'), [3])
+
+    def test_short_words_need_exact_match(self):
+        # Hasta 3 letras no se toleran errores
+        self.assertEqual(self._ids('pam'), [])
+
+    def test_exact_match_scores_above_phonetic(self):
+        exact = dict(self.index.search('vaso'))[1]
+        phonetic = dict(self.index.search('baso'))[1]
+        self.assertGreater(exact, phonetic)
+
+    def test_name_outranks_description(self):
+        # "vidrio" está en el nombre del vaso y sólo en la descripción de la jarra
+        self.assertEqual(self._ids('vidrio'), [1, 5])
+
+    def test_category_words_are_indexed(self):
+        self.assertEqual(set(self._ids('hogar')), {1, 4, 5})
+
+    def test_inactive_product_leaves_the_index(self):
+        class Product:
+            pk, nombre, descripcion, categoria_id, estado = 2, 'Yogur griego', '', 1, False
+
+        self.index.update_product(Product)
+        self.assertEqual(self._ids('yogur'), [])
+        self.assertEqual(self.index.stats()['productos'], 4)
+
+    @override_settings(FUZZY_INDEX_MAX_AGE=300)
+    def test_stale_index_is_rebuilt_in_background(self):
+        reading, release = threading.Event(), threading.Event()
+
+        def read_catalog():
+            reading.set()
+            release.wait(5)
+            return {1: 'Bebidas'}, [(2, 'Yogur griego', '', 1), (6, 'Taza de té', '', 1)]
+
+        class Product:
+            pk, nombre, descripcion, categoria_id, estado = 7, 'Tetera', '', 1, True
+
+        self.index._loaded_at -= 1000
+        with mock.patch.object(self.index, '_read_catalog', read_catalog):
+            # Mientras se reconstruye se sigue sirviendo el índice anterior
+            self.assertEqual(self._ids('vaso')[0], 1)
+            self.assertTrue(reading.wait(5))
+            self.assertEqual(self._ids('vaso')[0], 1)
+            # Un cambio que llega durante la reconstrucción no se pierde
+            self.index.update_product(Product)
+            release.set()
+            _join('fuzzy-index')
+
+        self.assertEqual(self._ids('vaso'), [])
+        self.assertEqual(self._ids('taza'), [6])
+        self.assertEqual(self._ids('tetera'), [7])
+        self.assertIsNone(self.index._changes)
+
+
+class SearchIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = SearchIndex()
+        self.index.load(
+            {1: 'Lácteos', 2: 'Panadería'},
+            [
+                (1, 'Leche entera', 'Leche de vaca', 1),
+                (2, 'Yogur de fresa', 'Yogur con leche entera', 1),
+                (3, 'Pan de leche', 'Bollos tiernos', 2),
+                (4, 'Tomates maduros', 'Tomate de rama', 2),
+                (5, 'Azúcar moreno', 'Azúcar de caña', 2),
+            ],
+        )
+
+    def _ids(self, query, **kwargs):
+        return [pk for pk, _ in self.index.search(query, **kwargs)]
+
+    def test_name_ranks_above_description(self):
+        # "leche" está en el nombre de 1 y 3 y sólo en la descripción de 2
+        self.assertEqual(self._ids('leche')[-1], 2)
+        self.assertEqual(set(self._ids('leche')), {1, 2, 3})
+
+    def test_all_words_rank_first(self):
+        self.assertEqual(self._ids('leche entera')[:2], [1, 2])
+
+    def test_plural_and_accents(self):
+        self.assertEqual(self._ids('tomate'), [4])
+        self.assertEqual(self._ids('AZUCAR'), [5])
+        self.assertEqual(self._ids('lacteos'), [1, 2])
+
+    def test_last_word_as_prefix(self):
+        self.assertEqual(self._ids('yog'), [2])
+        self.assertEqual(self._ids('yog', prefix=False), [])
+
+    def test_category_filter(self):
+        self.assertEqual(set(self._ids('leche', categoria=1)), {1, 2})
+        self.assertEqual(self._ids('leche', categoria=2), [3])
+        self.assertEqual(self._ids('leche', categoria=99), [])
+
+    def test_category_filter_respects_candidate_limit(self):
+        rows = [(pk, f'Leche {pk}', '', 1 if pk % 2 else 2) for pk in range(1, 2001)]
+        self.index.load({1: 'Lácteos', 2: 'Panadería'}, rows)
+        with mock.patch('gestion_productos.search_index._CANDIDATES', 10):
+            results = self._ids('leche', categoria=2, limit=50)
+        self.assertEqual(len(results), 10)
+        self.assertTrue(all(pk % 2 == 0 for pk in results))
+
+    def test_small_category_walks_its_members(self):
+        # Los de la categoría pequeña tienen "leche" con distinto peso
+        rows = [(pk, 'Leche', '', 2) for pk in range(1, 2001)]
+        rows += [
+            (3001, 'Leche', 'Leche de oveja', 1), (3002, 'Queso', 'Con leche', 1),
+            (3003, 'Leche', '', 1), (3004, 'Queso', '', 1),
+        ]
+        self.index.load({1: 'Quesos', 2: 'Lácteos'}, rows)
+        walked = [pk for _, pk in self.index._postings['lech'] if pk in {3001, 3002, 3003}][:2]
+        with mock.patch('gestion_productos.search_index._CANDIDATES', 2):
+            self.assertEqual(set(self._ids('leche', categoria=1)), set(walked))
+        self.assertEqual(self._ids('leche', categoria=1), [3003, 3001, 3002])
+
+    @override_settings(PRODUCT_SEARCH_MAX_AGE=300)
+    def test_stale_index_is_rebuilt_in_background(self):
+        reading, release = threading.Event(), threading.Event()
+
+        def read_catalog():
+            reading.set()
+            release.wait(5)
+            return {1: 'Lácteos'}, [(1, 'Leche entera', '', 1), (6, 'Queso curado', '', 1)]
+
+        class Category:
+            pk, nombre = 1, 'Quesería'
+
+        self.index._loaded_at -= 1000
+        with mock.patch.object(self.index, '_read_catalog', read_catalog):
+            self.assertEqual(self._ids('tomate'), [4])
+            self.assertTrue(reading.wait(5))
+            self.assertEqual(self._ids('tomate'), [4])
+            self.index.update_category(Category)
+            release.set()
+            _join('search-index')
+
+        self.assertEqual(self._ids('tomate'), [])
+        self.assertEqual(self._ids('queso'), [6])
+        self.assertEqual(set(self._ids('queseria')), {1, 6})
+        self.assertIsNone(self.index._changes)
+
+
+class CatalogApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.lacteos = categoria.objects.create(nombre='Lácteos')
+        cls.panaderia = categoria.objects.create(nombre='Panadería')
+        cls.productos = [
+            producto.objects.create(
+                nombre=f'Producto {i}', referencia=f'REF{i}', stock=i, precio=Decimal('1.50') * (i + 1),
+                descripcion='Descripción larga', categoria=cls.lacteos if i % 2 else cls.panaderia,
+                estado=i != 4,
+            )
+            for i in range(6)
+        ]
+
+    def _get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_plain_list_without_pagination_params(self):
+        data = self._get('/api/producto/')
+        self.assertIsInstance(data, list)
+        self.assertEqual(len(data), 6)
+
+    def test_cursor_pages_cover_every_product_once(self):
+        data = self._get('/api/producto/', page_size=4)
+        self.assertEqual(len(data['results']), 4)
+        ids = [row['id'] for row in data['results']]
+        with self.assertNumQueries(1):
+            data = self.client.get(data['next']).json()
+        ids += [row['id'] for row in data['results']]
+        self.assertIsNone(data['next'])
+        self.assertEqual(ids, sorted(p.pk for p in self.productos))
+
+    @override_settings(CATALOG_MAX_PAGE_SIZE=3)
+    def test_page_size_is_capped(self):
+        self.assertEqual(len(self._get('/api/producto/', page_size=100)['results']), 3)
+
+    def test_sparse_fields(self):
+        data = self._get('/api/producto/', fields='id,nombre,categoria_nombre', page_size=1)
+        self.assertEqual(set(data['results'][0]), {'id', 'nombre', 'categoria_nombre'})
+        self.assertEqual(set(self._get(f'/api/producto/{self.productos[0].pk}/', fields='precio')), {'precio'})
+
+    def test_filters(self):
+        inactive = self._get('/api/producto/', estado='false')
+        self.assertEqual([row['id'] for row in inactive], [self.productos[4].pk])
+
+        by_category = self._get('/api/producto/', categoria=f'{self.lacteos.pk}')
+        self.assertEqual({row['id'] for row in by_category}, {p.pk for p in self.productos[1::2]})
+        both = self._get('/api/producto/', categoria=f'{self.lacteos.pk},{self.panaderia.pk}')
+        self.assertEqual(len(both), 6)
+
+        producto.objects.filter(pk=self.productos[2].pk).update(
+            fecha_actualizacion=timezone.now() + timedelta(days=1)
+        )
+        since = (timezone.now() + timedelta(hours=1)).isoformat()
+        recent = self._get('/api/producto/', actualizado_desde=since)
+        self.assertEqual([row['id'] for row in recent], [self.productos[2].pk])
+
+    def test_ordering_by_update_date(self):
+        first = self.productos[3]
+        producto.objects.filter(pk=first.pk).update(fecha_actualizacion=timezone.now() + timedelta(days=1))
+        data = self._get('/api/producto/', ordering='-fecha_actualizacion', page_size=2)
+        self.assertEqual(data['results'][0]['id'], first.pk)
+        data = self._get('/api/categoria/', ordering='-id')
+        self.assertEqual([row['id'] for row in data], [self.panaderia.pk, self.lacteos.pk])
+
+
+class CatalogSnapshotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.lacteos = categoria.objects.create(nombre='Lácteos')
+        cls.leche = producto.objects.create(
+            nombre='Leche', referencia='L1', stock=3, precio=Decimal('1.20'), descripcion='', categoria=cls.lacteos,
+        )
+        cls.queso = producto.objects.create(
+            nombre='Queso', referencia='Q1', stock=0, precio=Decimal('4.00'), descripcion='', categoria=cls.lacteos,
+            estado=False,
+        )
+
+    def setUp(self):
+        catalog_cache._last = (None, None)
+
+    def _get(self, **headers):
+        return self.client.get('/api/catalogo/', headers=headers)
+
+    def test_only_active_products(self):
+        data = self._get().json()
+        self.assertEqual([row['id'] for row in data['productos']], [self.leche.pk])
+        self.assertEqual([row['id'] for row in data['categorias']], [self.lacteos.pk])
+
+    def test_not_modified_with_current_etag(self):
+        etag = self._get()['ETag']
+        response = self._get(if_none_match=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_not_modified_reads_one_row(self):
+        etag = self._get()['ETag']
+        with self.assertNumQueries(1):
+            self.assertEqual(self._get(if_none_match=etag).status_code, 304)
+
+    def test_etag_changes_with_the_catalog(self):
+        etags = [self._get()['ETag']]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.leche.stock = 10
+            self.leche.save()
+        etags.append(self._get()['ETag'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.queso.delete()
+        etags.append(self._get()['ETag'])
+        with self.captureOnCommitCallbacks(execute=True):
+            categoria.objects.create(nombre='Panadería')
+        etags.append(self._get()['ETag'])
+        self.assertEqual(len(set(etags)), 4)
+
+    def test_deactivated_product_leaves_the_snapshot(self):
+        self._get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.leche.estado = False
+            self.leche.save()
+        response = self._get()
+        self.assertEqual(response.json()['productos'], [])
+
+    def test_version_moves_after_commit(self):
+        numero, _ = catalog_cache.current_version()
+        # Dentro de la transacción no se toca la fila del contador
+        with self.captureOnCommitCallbacks() as callbacks, CaptureQueriesContext(connection) as queries:
+            self.leche.stock = 1
+            self.leche.save()
+        self.assertFalse(any('version_catalogo' in query['sql'] for query in queries))
+        self.assertEqual(catalog_cache.current_version()[0], numero)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(catalog_cache.current_version()[0], numero + 1)
+
+
+@override_settings(CATALOG_EVENTS_BATCH_INTERVAL=0.05)
+class CatalogEventsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.lacteos = categoria.objects.create(nombre='Lácteos')
+        cls.quesos = categoria.objects.create(nombre='Quesos')
+        cls.producto = producto.objects.create(
+            nombre='Queso fresco', referencia='Q1', stock=10, precio=Decimal('3.00'), descripcion='',
+            categoria=cls.lacteos,
+        )
+
+    async def _connect(self, **subscriptions):
+        communicator = WebsocketCommunicator(CatalogEventsConsumer.as_asgi(), '/ws/catalogo/')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.send_json_to({'type': 'subscribe', **subscriptions})
+        self.assertEqual((await communicator.receive_json_from())['type'], 'subscribed')
+        return communicator
+
+    @sync_to_async
+    def _save(self, **fields):
+        instance = producto.objects.get(pk=self.producto.pk)
+        for name, value in fields.items():
+            setattr(instance, name, value)
+        with self.captureOnCommitCallbacks(execute=True):
+            instance.save()
+
+    async def test_changes_are_batched(self):
+        communicator = await self._connect(productos=[self.producto.pk])
+        await self._save(stock=9)
+        await self._save(stock=8, precio=Decimal('2.50'))
+
+        message = await communicator.receive_json_from()
+        self.assertEqual(message, {
+            'type': 'catalog_changes', 'productos': [{'id': self.producto.pk, 'stock': 8, 'precio': '2.50'}],
+        })
+        self.assertTrue(await communicator.receive_nothing(0.1))
+        await communicator.disconnect()
+
+    async def test_category_change_removes_from_old_category(self):
+        old = await self._connect(categorias=[self.lacteos.pk])
+        new = await self._connect(categorias=[self.quesos.pk])
+        await self._save(categoria_id=self.quesos.pk)
+
+        message = await old.receive_json_from()
+        self.assertEqual(message['productos'], [{'id': self.producto.pk, 'eliminado': True}])
+        message = await new.receive_json_from()
+        self.assertEqual(message['productos'], [{
+            'id': self.producto.pk, 'stock': 10, 'precio': '3.00', 'estado': True, 'categoria': self.quesos.pk,
+        }])
+        await old.disconnect()
+        await new.disconnect()
+
+    def test_deferred_fields_are_not_loaded(self):
+        with self.assertNumQueries(1):
+            instance = producto.objects.only('id', 'stock').get(pk=self.producto.pk)
+        self.assertEqual(instance._catalog_original, {'stock': 10})
+
+
+@override_settings(CATALOG_SYNC_OVERLAP=0)
+class CatalogSyncTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.lacteos = categoria.objects.create(nombre='Lácteos')
+        cls.leche, cls.queso, cls.yogur = (
+            producto.objects.create(
+                nombre=nombre, referencia=nombre[:3], stock=1, precio=Decimal('1.00'), descripcion='',
+                categoria=cls.lacteos,
+            )
+            for nombre in ('Leche', 'Queso', 'Yogur')
+        )
+
+    def test_token_round_trip(self):
+        moment = timezone.now()
+        self.assertLess(abs(decode_token(encode_token(moment)) - moment), timedelta(milliseconds=1))
+        for token in ('-1', 'no valido', 'zzzzzzzzzzzzzzzzzzzz'):
+            with self.subTest(token=token), self.assertRaises(ValueError):
+                decode_token(token)
+
+    def test_full_catalog_without_token(self):
+        producto.objects.filter(pk=self.yogur.pk).update(estado=False)
+        changes = changes_since(None)
+        self.assertEqual([row['id'] for row in changes['productos']], [self.leche.pk, self.queso.pk])
+        self.assertEqual(changes['desactivados'], [self.yogur.pk])
+        self.assertEqual([row['id'] for row in changes['categorias']], [self.lacteos.pk])
+
+    def test_only_changes_since_token(self):
+        token = changes_since(None)['token']
+        self.leche.stock = 5
+        self.leche.save()
+        self.yogur.estado = False
+        self.yogur.save()
+        deleted = self.queso.pk
+        self.queso.delete()
+
+        changes = changes_since(token)
+        self.assertEqual([row['id'] for row in changes['productos']], [self.leche.pk])
+        self.assertEqual(changes['desactivados'], [self.yogur.pk])
+        self.assertEqual(changes['eliminados'], {'productos': [deleted], 'categorias': []})
+        self.assertEqual(changes['categorias'], [])
+
+    def test_purged_tombstones_expire_old_tokens(self):
+        old = timezone.now() - timedelta(days=40)
+        eliminacion_catalogo.objects.create(modelo='producto', objeto_id=99, fecha=old)
+        record_deletion('producto', 100)
+
+        self.assertEqual(list(eliminacion_catalogo.objects.values_list('objeto_id', flat=True)), [100])
+        self.assertIsNotNone(version_catalogo.objects.get(pk=1).purgado_hasta)
+        with self.assertRaises(TokenExpired):
+            changes_since(encode_token(old))
@@ -0,0 +1,111 @@
+"""
+Normalización de texto para buscar productos.
+
+Lo que dice el reconocedor de voz (o escribe el usuario) rara vez coincide
+letra a letra con el nombre del catálogo: tildes, mayúsculas, "b" por "v",
+"s" por "z"... Estas funciones reducen las palabras a formas comparables.
+"""
+import re
+import unicodedata
+
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+
+def fold(text):
+    """Minúsculas y sin tildes ni diéresis ("Azúcar Morena" -> "azucar morena")"""
+    decomposed = unicodedata.normalize('NFD', (text or '').lower())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def tokens(text):
+    """Palabras de ``text`` sin tildes ni signos de puntuación"""
+    return _NON_ALNUM.sub(' ', fold(text)).split()
+
+
+# Reglas de pronunciación del español (aplicadas en orden sobre texto sin
+# tildes). "ch" se marca antes de quitar las "h" mudas, y "gue"/"gui" antes
+# de convertir la "g" suave en "j".
+_PHONETIC_RULES = tuple((re.compile(pattern), replacement) for pattern, replacement in (
+    (r'ch', 'X'),
+    (r'h', ''),
+    (r'qu(?=[ei])', 'k'),
+    (r'gu(?=[ei])', 'G'),
+    (r'g(?=[ei])', 'j'),
+    (r'c(?=[ei])', 's'),
+    (r'[cq]', 'k'),
+    (r'z', 's'),
+    (r'x', 'ks'),
+    (r'[vw]', 'b'),
+    (r'll', 'y'),
+    (r'y$', 'i'),
+    (r'G', 'g'),
+    (r'(.)\1+', r'\1'),
+))
+
+
+def phonetic_key(word):
+    """
+    Clave fonética de una palabra: dos palabras que suenan igual en español
+    tienen la misma clave ("vaca" / "baca", "zapato" / "sapato", "queso" / "keso").
+    """
+    key = fold(word)
+    for pattern, replacement in _PHONETIC_RULES:
+        key = pattern.sub(replacement, key)
+    return key
+
+
+def trigrams(word):
+    """Trigramas de caracteres de ``word`` con marcas de inicio y fin"""
+    padded = f'^{word}$'
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b, limit):
+    """
+    Distancia de Levenshtein entre ``a`` y ``b``, o ``limit + 1`` si es mayor
+    que ``limit`` (se abandona en cuanto una fila entera supera el límite).
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b),
+            ))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1] if previous[-1] <= limit else limit + 1
+
+
+# Terminaciones que se quitan al reducir una palabra a su raíz (la primera que
+# encaja): plurales y género, para que "tomates", "tomate", "galletas" y
+# "galleta" coincidan. "-ces" vuelve a "-z" (arroces -> arroz).
+_STEM_RULES = (
+    ('ces', 'z'),
+    ('es', ''),
+    ('os', ''),
+    ('as', ''),
+    ('s', ''),
+    ('o', ''),
+    ('a', ''),
+    ('e', ''),
+)
+
+
+def stem(word):
+    """
+    Raíz ligera de una palabra sin tildes (sólo plural y género, sin
+    derivación): "leches" / "leche" -> "lech", "arroces" -> "arroz".
+    Las palabras de hasta 3 letras no se tocan.
+    """
+    if len(word) <= 3 or word.isdigit():
+        return word
+    for suffix, replacement in _STEM_RULES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)] + replacement
+    return word
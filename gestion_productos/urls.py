@@ -14,6 +14,8 @@ urlpatterns = [
     path('', views.productos_lista, name='lista'),
     path('detalle/<int:producto_id>/', views.producto_detalle, name='detalle'),
     path('agregar-carrito/<int:producto_id>/', views.agregar_carrito, name='agregar_carrito'),
+    path('api/catalogo/', views.catalogo, name='catalogo'),
+    path('api/catalogo/cambios/', views.catalogo_cambios, name='catalogo_cambios'),
 
     path('', include(router.urls))
 ]
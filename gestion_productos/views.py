@@ -1,10 +1,21 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.http import condition, require_safe
 from .models import producto, categoria
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets
-from .serializer import categoriaSerializer, productoSerializer
+from rest_framework.decorators import action
+from rest_framework.filters import OrderingFilter
+from rest_framework.response import Response
+from .serializer import categoriaSerializer, productoSerializer, requested_fields
+from .filters import categoriaFilter, productoFilter
+from .pagination import CatalogCursorPagination
+from . import catalog_cache, catalog_sync
+from .fuzzy_index import get_fuzzy_index
+from .search_index import get_search_index
 
 def productos_lista(request):
     """
@@ -85,9 +96,120 @@ def agregar_carrito(request, producto_id):
     
     return JsonResponse({'error': 'Método no permitido'}, status=405)
 
-class categoriaView(viewsets.ModelViewSet):
+def _version_catalogo(request):
+    # ETag y Last-Modified salen de la misma lectura
+    if not hasattr(request, 'version_catalogo'):
+        request.version_catalogo = catalog_cache.current_version()
+    return request.version_catalogo
+
+@require_safe
+@condition(
+    etag_func=lambda request: f'"catalogo-{_version_catalogo(request)[0]}"',
+    last_modified_func=lambda request: _version_catalogo(request)[1],
+)
+def catalogo(request):
+    """
+    Catálogo completo (categorías y productos) ya serializado. Responde 304 si
+    el cliente tiene la versión actual (If-None-Match / If-Modified-Since)
+    """
+    version, _ = _version_catalogo(request)
+    response = HttpResponse(catalog_cache.get_snapshot(version), content_type='application/json')
+    # El navegador guarda la copia pero pregunta siempre si sigue siendo válida
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+@require_safe
+def catalogo_cambios(request):
+    """
+    Cambios del catálogo desde ?desde=<token> (el de /api/catalogo/ o el de la
+    respuesta anterior). 410 si el token es demasiado antiguo: hay que volver a
+    cargar /api/catalogo/
+    """
+    token = request.GET.get('desde') or None
+    try:
+        cambios = catalog_sync.changes_since(token)
+    except ValueError:
+        return JsonResponse({'error': 'Token de sincronización no válido'}, status=400)
+    except catalog_sync.TokenExpired:
+        return JsonResponse({'error': 'Token caducado, vuelve a cargar el catálogo'}, status=410)
+    return JsonResponse(cambios, encoder=DjangoJSONEncoder, json_dumps_params={'ensure_ascii': False})
+
+class CatalogViewMixin:
+    """
+    Listados del catálogo paginados por cursor, con filtros, ?ordering= y
+    respuestas parciales (?fields=)
+    """
+    pagination_class = CatalogCursorPagination
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    ordering_fields = ['id', 'fecha_actualizacion']
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        wanted = requested_fields(self.request, self.serializer_class().fields)
+        if wanted:
+            # No leer las columnas que no se envían (la descripción puede ser larga);
+            # id y fecha_actualizacion hacen falta para el cursor
+            keep = wanted | {'id', 'fecha_actualizacion'}
+            queryset = queryset.defer(*(
+                field.name for field in queryset.model._meta.concrete_fields
+                if field.name not in keep and not field.is_relation
+            ))
+        return queryset
+
+class categoriaView(CatalogViewMixin, viewsets.ModelViewSet):
     serializer_class = categoriaSerializer
-    queryset = categoria.objects.all() 
-class productoView(viewsets.ModelViewSet):
+    queryset = categoria.objects.all()
+    filterset_class = categoriaFilter
+
+class productoView(CatalogViewMixin, viewsets.ModelViewSet):
     serializer_class = productoSerializer
-    queryset = producto.objects.all()
+    # categoria_nombre sale de la misma consulta
+    queryset = producto.objects.select_related('categoria')
+    filterset_class = productoFilter
+
+    @action(detail=False, methods=['get'])
+    def fuzzy(self, request):
+        """
+        Búsqueda aproximada por nombre, descripción y categoría (tolera tildes,
+        faltas de ortografía y palabras que suenan igual): ?q=texto&limit=10
+        """
+        consulta = request.query_params.get('q', '')
+        try:
+            limite = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+        except ValueError:
+            return Response({'error': 'limit debe ser un número'}, status=400)
+
+        resultados = get_fuzzy_index().search(consulta, limit=limite)
+        productos = producto.objects.select_related('categoria').in_bulk([pk for pk, _ in resultados])
+        datos = []
+        for pk, puntuacion in resultados:
+            if pk in productos:
+                fila = self.get_serializer(productos[pk]).data
+                fila['puntuacion'] = puntuacion
+                datos.append(fila)
+        return Response({'consulta': consulta, 'resultados': datos})
+
+    @action(detail=False, methods=['get'])
+    def buscar(self, request):
+        """
+        Búsqueda de texto completo en el catálogo activo, ordenada por relevancia
+        (sin tildes, singular y plural, la última palabra como prefijo):
+        ?q=texto&limit=20&categoria=id
+        """
+        consulta = request.query_params.get('q', '')
+        try:
+            limite = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+            categoria_id = request.query_params.get('categoria')
+            categoria_id = int(categoria_id) if categoria_id else None
+        except ValueError:
+            return Response({'error': 'limit y categoria deben ser números'}, status=400)
+
+        resultados = get_search_index().search(consulta, limit=limite, categoria=categoria_id)
+        productos = producto.objects.select_related('categoria').in_bulk([pk for pk, _ in resultados])
+        datos = []
+        for pk, puntuacion in resultados:
+            if pk in productos:
+                fila = self.get_serializer(productos[pk]).data
+                fila['puntuacion'] = puntuacion
+                datos.append(fila)
+        return Response({'consulta': consulta, 'resultados': datos})
@@ -12,16 +12,28 @@ from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 import gestion_asistente.routing
+import gestion_productos.routing
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'vocalcart.settings')
 
 django_asgi_app = get_asgi_application()
 
+# Cargar el modelo Vosk una sola vez al arrancar el worker, para que la
+# primera conexión de voz no pague el tiempo de carga
+from gestion_asistente import asr_workers, recognizer_pool, vosk_registry
+if asr_workers.is_enabled():
+    # En modo process el modelo vive en los workers de ASR
+    asr_workers.get_process_pool()
+else:
+    vosk_registry.preload()
+    recognizer_pool.prewarm()
+
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
     "websocket": AuthMiddlewareStack(
         URLRouter(
             gestion_asistente.routing.websocket_urlpatterns
+            + gestion_productos.routing.websocket_urlpatterns
         )
     ),
 })
@@ -44,6 +44,7 @@ INSTALLED_APPS = [
     'gestion_asistente',
     'vocalcart',
     'rest_framework',
+    'django_filters',
     'corsheaders',
     'channels',  # Django Channels
 ]
@@ -317,3 +318,121 @@ CHANNEL_LAYERS = {
 
 # Vosk Model Path
 VOSK_MODEL_PATH = str(BASE_DIR / 'vosk-model-small-es-0.42')
+
+# Cargar el modelo Vosk al arrancar el proceso ASGI (se comparte entre sesiones)
+VOSK_PRELOAD = True
+
+# Memoria máxima del proceso (MB) al cargar o recargar un modelo: una versión
+# nueva no se carga si no cabe junto a las que aún usan sesiones abiertas
+VOSK_MODEL_MEMORY_LIMIT_MB = None
+
+# Modelos que el cliente puede elegir en el mensaje 'start' ('model'). Se
+# cargan la primera vez que se piden; si no caben en VOSK_MODEL_CACHE_MB se
+# descargan los que llevan más tiempo sin sesiones
+VOSK_MODELS = {
+    'es-small': VOSK_MODEL_PATH,
+    # 'es-large': str(BASE_DIR / 'vosk-model-es-0.42'),
+}
+VOSK_DEFAULT_MODEL = 'es-small'
+VOSK_MODEL_CACHE_MB = None    # memoria para modelos cargados (None = sin límite)
+VOSK_MODEL_IDLE_TTL = 1800    # segundos sin sesiones antes de descargar un modelo que no es el de por defecto
+
+# Pool de reconocedores pre-construidos (se reutilizan entre conexiones)
+VOSK_POOL_MAX_IDLE = 16   # máximo de reconocedores libres por configuración
+VOSK_POOL_MIN_IDLE = 2    # se construyen al arrancar y nunca se descartan
+VOSK_POOL_IDLE_TTL = 300  # segundos sin uso antes de descartar un reconocedor
+
+# Executor dedicado al ASR y cola por sesión
+VOSK_ASR_WORKERS = None       # threads de ASR (None = número de núcleos)
+VOSK_ASR_MAX_QUEUE = 8        # chunks de audio pendientes por sesión
+VOSK_ASR_OVERFLOW = 'merge'   # 'merge', 'drop' o 'reject' (avisa 'overloaded' al cliente)
+
+# 'thread': el ASR corre en este proceso. 'process': se reparte entre procesos
+# worker que reciben el audio por memoria compartida (escala con los núcleos)
+VOSK_ASR_MODE = 'thread'
+VOSK_ASR_PROCESSES = None          # workers por proceso de servidor (None = núcleos, como mucho 4)
+VOSK_ASR_PROCESS_SLOTS = 64        # sesiones simultáneas por worker
+VOSK_ASR_RING_BYTES = 256 * 1024   # buffer de audio compartido por sesión
+
+# Modo por defecto si el cliente no lo pide en 'start': 'open' (vocabulario
+# abierto) o 'grammar' (comandos + números + nombres del catálogo)
+VOSK_RECOGNITION_MODE = 'open'
+VOSK_GRAMMAR_MAX_AGE = 300  # segundos antes de recargar el catálogo desde la base de datos
+
+# Detección de voz: el silencio no se envía a Vosk (el cliente puede pedir 'vad': false)
+VOSK_VAD_ENABLED = True
+VOSK_VAD = {
+    'threshold_db': -50.0,   # energía mínima de una trama de voz (dBFS)
+    'padding_ms': 210,       # audio que se conserva antes del inicio de la voz
+    'hangover_ms': 300,      # audio que se conserva después de la voz
+    'end_silence_ms': 800,   # silencio que cierra la frase
+}
+
+# Parciales: sólo se envían si cambió el texto, como mucho uno cada tantos segundos
+VOSK_PARTIAL_MIN_INTERVAL = 0.15
+VOSK_RESULT_WORDS = True  # detalle por palabra en los resultados (el cliente puede pedir 'words': false)
+
+# Interpretar las frases en el servidor y enviar un mensaje 'intent' con la
+# acción y los productos resueltos (el cliente puede pedir 'intents': false)
+VOSK_INTENTS_ENABLED = True
+
+# Índice de búsqueda aproximada de productos (/api/producto/fuzzy/ y voz):
+# se actualiza con las señales y se reconstruye completo tras estos segundos
+FUZZY_INDEX_MAX_AGE = 300
+
+# Índice invertido de la búsqueda de la tienda (/api/producto/buscar/): también
+# se actualiza con las señales y se reconstruye completo tras estos segundos
+PRODUCT_SEARCH_MAX_AGE = 300
+
+# Páginas de /api/producto/ y /api/categoria/ (paginación por cursor): tamaño
+# por defecto y máximo que se puede pedir con ?page_size=
+CATALOG_PAGE_SIZE = 50
+CATALOG_MAX_PAGE_SIZE = 500
+
+# Segundos que se guarda en la caché cada versión serializada de /api/catalogo/
+CATALOG_CACHE_TIMEOUT = 3600
+
+# Sincronización incremental (/api/catalogo/cambios/): segundos que cada
+# consulta vuelve a mirar hacia atrás (escrituras confirmadas tarde) y días que
+# se guardan las eliminaciones
+CATALOG_SYNC_OVERLAP = 5
+CATALOG_TOMBSTONE_DAYS = 30
+
+# Avisos de stock, precio y estado (ws/catalogo/): cada conexión junta los
+# cambios que llegan en este intervalo (segundos) en un solo mensaje, y puede
+# suscribirse como mucho a tantos productos y categorías
+CATALOG_EVENTS_BATCH_INTERVAL = 0.25
+CATALOG_EVENTS_MAX_SUBSCRIPTIONS = 500
+
+# Hipótesis por frase que pide el reconocedor (0 = sólo la mejor). Con más de
+# una se elige la que mejor encaja con los comandos y el catálogo; el cliente
+# puede pedirlas con 'alternatives': N en 'start'
+VOSK_MAX_ALTERNATIVES = 0
+
+# Enviar 'prefetch' con los productos que anticipan los parciales (el cliente
+# puede pedir 'prefetch': false), agrupando los parciales de este número de
+# segundos antes de especular
+VOSK_PREFETCH_ENABLED = True
+VOSK_PREFETCH_DEBOUNCE = 0.05
+
+# Control de admisión de sesiones de voz
+VOSK_MAX_SESSIONS = None          # sesiones activas por proceso (None = sin límite)
+VOSK_ADMISSION_QUEUE = 8          # conexiones que pueden esperar plaza (reciben 'busy' con su posición)
+VOSK_ADMISSION_WAIT = 10          # segundos máximos de espera antes de rechazar
+VOSK_GLOBAL_MAX_SESSIONS = None   # límite de todo el despliegue (requiere Redis)
+VOSK_ADMISSION_REDIS_URL = None   # p. ej. 'redis://localhost:6379/0'
+# Modo degradado a partir de esta fracción del límite: gramática y parciales espaciados
+VOSK_DEGRADE_AT = 0.8
+VOSK_DEGRADE_GRAMMAR = True
+VOSK_DEGRADED_PARTIAL_INTERVAL = 0.5
+# Token para leer /api/voz/metricas/ sin sesión de staff (None = sólo staff)
+VOSK_METRICS_TOKEN = None
+
+# Grabación de sesiones de voz (WAV por frase) para el comando benchmark_sesiones_voz
+VOSK_RECORD_DIR = None           # p. ej. str(BASE_DIR / 'grabaciones_voz'); None = no grabar
+VOSK_RECORD_MAX_SECONDS = 120    # audio máximo por frase
+
+# Reanudación de sesiones de voz tras una reconexión (?resume=<token>)
+VOSK_RESUME_TTL = 30             # segundos que se guarda una sesión caída (0 = no reanudar)
+VOSK_RESUME_MAX_PARKED = 64      # sesiones aparcadas como máximo por proceso
+VOSK_RESUME_MAX_MESSAGES = 32    # mensajes retenidos por sesión aparcada